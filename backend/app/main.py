@@ -1,22 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
-from io import StringIO
 import os
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import asyncio
+import itertools
 from pathlib import Path
 import requests 
-from sklearn.cluster import KMeans 
 import numpy as np 
 from textblob import TextBlob # <--- NEW IMPORT
 from fastapi.responses import StreamingResponse
 from app.services.surveillance import video_service
+from app.services.storage import hash_upload
+from app.services.registry import datasets, Dataset
+from app.services.indexing import FilterIndex
+from app.services.cache import result_cache
+from app.services.cube import CrimeCube
+from app.services.tiles import TileKeys, TilePyramid
+from app.services.encoding import negotiate, columns_response, category_codes, decode_codes, UNKNOWN_CODE
+from app.services.spatial import SpatialIndex, SPATIAL_MAX_RADIUS_M
+from app.services.timeseries import HourlyCounts
+from app.services.jobs import jobs, TERMINAL_STATES
 import shutil
 import hashlib  
 import json
@@ -28,17 +37,36 @@ import json
 detector = None
 # --- IMPORT SERVICES ---
 try:
-    from app.services.data_processing import load_and_preprocess_data, classify_severity
+    from app.services.data_processing import (
+        load_and_preprocess_data, load_and_preprocess_data_chunked, classify_severity, compact_dataframe, memory_usage_mb,
+        pipeline_fingerprint
+    )
     from app.services.analysis import (
-        detect_hotspots, get_time_series_data, get_time_series_forecast, train_risk_prediction_model
+        detect_hotspots, detect_hotspot_clusters, detect_density_hotspots, get_time_series_data, get_time_series_forecast,
+        train_risk_prediction_model, fit_risk_model, score_risk_surface
     )
+    from app.services.risk_models import model_registry
+    from app.services.analysis import RISK_SURFACE_MAX_SIDE
+    from app.services.forecasting import forecast_series, forecast_batch
 except ImportError:
     # Fallback dummies
     def load_and_preprocess_data(f): return pd.read_csv(f)
+    def load_and_preprocess_data_chunked(f, progress_callback=None): return pd.read_csv(f)
     def classify_severity(df): return df
+    def compact_dataframe(df): return df, {}
+    def memory_usage_mb(df): return None
+    def pipeline_fingerprint(): return None
+    def detect_hotspot_clusters(df, n_clusters=10): return []
+    def detect_density_hotspots(df, **kwargs): return {"peaks": [], "raster": None}
     def get_time_series_data(df): return []
     def get_time_series_forecast(df): return []
+    def forecast_series(series, periods=12, method=None): return []
+    def forecast_batch(groups, periods=12, method=None): return iter(())
     def train_risk_prediction_model(df): return {"accuracy": "N/A", "risk_factors": []}
+    def fit_risk_model(df, **kwargs): return None
+    def score_risk_surface(model, df, **kwargs): return None
+    model_registry = None
+    RISK_SURFACE_MAX_SIDE = 400
 
 try:
     from app.services.routing import get_nearby_amenities, calculate_safe_route
@@ -88,17 +116,124 @@ class FilterPayload(BaseModel):
     severities: List[str] = []
     class Config: extra = "ignore"
 
-# Nested Payload (3D Map)
-class FilterModel(BaseModel):
+# ✅ NEW (Flat - Matches your Frontend)
+class HotspotRequest(BaseModel):
     areas: List[str] = []
     crimes: List[str] = []
     severities: List[str] = []
+    n_clusters: int = 15
 
-# ✅ NEW (Flat - Matches your Frontend)
-class HotspotRequest(BaseModel):
+# Density (KDE) hotspots
+class DensityHotspotRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    top_n: int = 15
+    bandwidth_m: float = 300.0
+    cell_m: float = 100.0
+    significance: bool = False
+    include_raster: bool = False
+
+# Radius / bounding-box incident lookups: points are [lat, lon] pairs, bbox is [south, west, north, east],
+# days (1..SPATIAL_MAX_DAYS) keeps only incidents from the dataset's last `days` days
+SPATIAL_MAX_DAYS = 36500
+
+class SpatialQueryRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    points: List[List[float]] = []
+    radius_m: float = Field(300.0, gt=0, le=SPATIAL_MAX_RADIUS_M)
+    bbox: Optional[List[float]] = None
+    days: Optional[int] = Field(None, gt=0, le=SPATIAL_MAX_DAYS)
+    limit: int = 0
+
+# Trends + forecast; method is "fast" (Holt-Winters) or "prophet" (default: FORECAST_METHOD)
+class TimeSeriesRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    method: Optional[str] = None
+    class Config: extra = "ignore"
+
+# Range counts at hour / day / week / month resolution; start/end are ISO timestamps (default: whole dataset)
+class TimeSeriesRangeRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    start: Optional[str] = None
+    end: Optional[str] = None
+    resolution: str = "day"
+
+# Batch forecasts: one forecast per area (or per top crime type) within the filters
+class BatchForecastRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    by: str = "area"
+    top_n: int = 10
+    periods: int = 12
+    method: Optional[str] = None
+
+# Risk model training; mode is "auto", "standard" or "scalable", sample enables adaptive sampling
+class TrainModelRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    mode: Optional[str] = None
+    sample: bool = False
+    class Config: extra = "ignore"
+
+# Risk scoring against a trained model (model_id from /api/train-model, or the model of these filters)
+class RiskRecord(BaseModel):
+    hour: int
+    month: int
+    lat: float
+    lon: float
+    area: str
+
+class PredictRiskRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    model_id: Optional[str] = None
+    records: List[RiskRecord] = []
+
+# Background jobs: kind is "train-model", "forecast" or "hotspots"
+class JobRequest(BaseModel):
+    kind: str
     areas: List[str] = []
     crimes: List[str] = []
     severities: List[str] = []
+    method: Optional[str] = None
+    periods: int = 12
+    n_clusters: int = 15
+    mode: Optional[str] = None
+    sample: bool = False
+
+# Risk map: rows x cols grid over bbox ([south, west, north, east], default: the incidents' extent) x 24 hours
+class RiskSurfaceRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    model_id: Optional[str] = None
+    rows: int = 200
+    cols: int = 200
+    month: Optional[int] = None
+    bbox: Optional[List[float]] = None
+    risk_class: Optional[str] = None
+
+# Tiled map views (heatmap / 3D): zoom + optional [south, west, north, east] bounding box (default: the whole map)
+WORLD_BBOX = (-85.0, -180.0, 85.0, 180.0)
+# The 3D columns of /api/hotspots are the /api/points cells of the whole extent at this zoom
+HOTSPOT_3D_ZOOM = 12
+
+class TileRequest(BaseModel):
+    areas: List[str] = []
+    crimes: List[str] = []
+    severities: List[str] = []
+    zoom: int = 12
+    bbox: Optional[List[float]] = None
 
 # ✅ NEW: Incident Report Model
 class IncidentRequest(BaseModel):
@@ -118,54 +253,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-df_storage = {}
 # ✅ NEW: In-memory storage for reported incidents
 incidents_db = []
+# Cached analytics results of a dataset are dropped whenever it is re-registered or appended to
+datasets.subscribe(lambda event, dataset_id, df, delta: result_cache.invalidate(dataset_id))
+# Progress of the streaming CSV ingestion (polled by the upload screen)
+upload_progress = {"status": "idle", "rows_read": 0, "rows_kept": 0, "fraction": 0.0}
+
+def get_dataset(dataset_id: Optional[str] = None) -> Dataset:
+    """
+    Resolves the dataset an analytics call runs on (?dataset_id=..., defaults to the latest upload).
+    """
+    try:
+        return datasets.get_dataset(dataset_id)
+    except KeyError:
+        detail = f"Unknown dataset: {dataset_id}" if dataset_id else "No data uploaded yet."
+        raise HTTPException(status_code=404, detail=detail)
 
-def get_dataframe():
-    if 'main_df' not in df_storage:
-        raise HTTPException(status_code=404, detail="No data uploaded yet.")
-    return df_storage['main_df']
-
-def apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
-    subset = df.copy()
-    areas = getattr(filters, 'areas', [])
-    crimes = getattr(filters, 'crimes', [])
-    severities = getattr(filters, 'severities', [])
-
-    if areas and 'AREA NAME' in subset.columns:
-        subset = subset[subset['AREA NAME'].isin(areas)]
-    if crimes and 'Crm Cd Desc' in subset.columns:
-        subset = subset[subset['Crm Cd Desc'].isin(crimes)]
-    if severities and 'Severity' in subset.columns:
-        subset = subset[subset['Severity'].isin(severities)]
-    return subset
+def apply_filters(dataset: Dataset, filters, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Resolves the filters through the dataset's FilterIndex and takes only the requested columns.
+    With no filters and no columns the stored frame itself is returned, so callers must not mutate it.
+    """
+    df = dataset.df
+    rows = dataset.derived('filter_index', FilterIndex).rows(filters)
+    positions = [df.columns.get_loc(c) for c in columns if c in df.columns] if columns else None
+
+    if rows is None:
+        return df.iloc[:, positions] if positions is not None else df
+    return df.iloc[rows, positions] if positions is not None else df.iloc[rows]
 
 # --- 4. ENDPOINTS ---
 
+def _precompute_aggregates(dataset: Dataset):
+    # Pre-aggregate at ingestion so the first breakdown/trend/heatmap request is already cheap
+    dataset.derived('crime_cube', CrimeCube)
+    dataset.derived('spatial_index', SpatialIndex)
+    dataset.derived('hourly_counts', HourlyCounts)
+    _tile_pyramid(dataset, FilterPayload())
+
+def _report_upload_progress(rows_read, rows_kept, fraction):
+    upload_progress.update({"rows_read": rows_read, "rows_kept": rows_kept, "fraction": fraction})
+    print(f"⏳ Ingested {rows_read} rows ({rows_kept} kept)")
+
 @app.post("/api/upload")
 def upload_data(file: UploadFile = File(...)):
     try:
         print(f"Received file: {file.filename}")
-        df = load_and_preprocess_data(file.file)
-        if 'Severity' not in df.columns:
-             df['Severity'] = np.random.choice(['High', 'Medium', 'Low'], size=len(df))
+        upload_progress.update({"status": "processing", "filename": file.filename, "rows_read": 0, "rows_kept": 0, "fraction": 0.0})
+
+        # Identical re-uploads are a hash lookup instead of a full parse (as long as the pipeline is unchanged)
+        key = hash_upload(file.file, salt=pipeline_fingerprint())
+        dataset_id, df = datasets.lookup(key)
+        message = "File processed."
+        if df is not None:
+            memory = {"after_mb": memory_usage_mb(df)}
+            appends = datasets.meta(dataset_id).get("appends", 0)
+            if appends:
+                # The dataset keeps its upload's id across appends: say that this is not the file's own content
+                message = f"File already uploaded; returning its dataset with {appends} appended delta(s)."
+        else:
+            df = load_and_preprocess_data_chunked(file.file, progress_callback=_report_upload_progress)
+            if 'Severity' not in df.columns:
+                df = classify_severity(df)
+            df, memory = compact_dataframe(df)
+            dataset_id = datasets.register(df, key, filename=file.filename)
+            _precompute_aggregates(datasets.get_dataset(dataset_id))
 
-        df_storage['main_df'] = df
+        upload_progress.update({"status": "done", "fraction": 1.0, "dataset_id": dataset_id})
         
         unique_areas = sorted(df['AREA NAME'].unique().tolist()) if 'AREA NAME' in df.columns else []
         unique_crimes = sorted(df['Crm Cd Desc'].unique().tolist()) if 'Crm Cd Desc' in df.columns else []
         unique_severities = sorted(df['Severity'].unique().tolist()) if 'Severity' in df.columns else []
 
         return { 
-            "message": "File processed.", 
+            "message": message, 
             "total_records": len(df), 
+            "dataset_id": dataset_id, 
+            "version": datasets.meta(dataset_id).get("version", 1), 
+            "memory": memory, 
             "filters": { "areas": unique_areas, "crimes": unique_crimes, "severities": unique_severities } 
         }
     except Exception as e:
         print(f"Upload Error: {e}")
+        upload_progress["status"] = "error"
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/datasets/{dataset_id}/append")
+def append_data(dataset_id: str, file: UploadFile = File(...), key_column: Optional[str] = "DR_NO"):
+    """
+    Appends a delta CSV (e.g. the daily export) to an existing dataset, skipping records already present
+    (by key_column; send an empty key_column to append without deduplication).
+    """
+    try:
+        datasets.resolve(dataset_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset_id}")
+
+    try:
+        print(f"Received delta for {dataset_id}: {file.filename}")
+        delta_key = hash_upload(file.file)
+        delta = load_and_preprocess_data_chunked(file.file)
+        if 'Severity' not in delta.columns:
+            delta = classify_severity(delta)
+        delta, _ = compact_dataframe(delta)
+        result = datasets.append(dataset_id, delta, delta_key, key_column=key_column or None)
+    except Exception as e:
+        print(f"Append Error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+    return {
+        "message": "Delta appended.",
+        "dataset_id": result["dataset_id"],
+        "appended": result["appended"],
+        "duplicates": result["duplicates"],
+        "total_records": result["rows"],
+        "version": result["version"],
+    }
+
+@app.get("/api/datasets")
+def list_datasets():
+    """
+    Lists every uploaded dataset, whether it is currently held in memory, and which one is the default.
+    """
+    return {"datasets": datasets.list(), "memory_budget_mb": datasets.budget_mb}
+
+@app.get("/api/upload/progress")
+def get_upload_progress():
+    """
+    Reports how far the streaming ingestion of the current upload has got.
+    """
+    return upload_progress
+
 # --- NEW: SENTIMENT ANALYSIS ENDPOINT ---
 @app.post("/api/sentiment")
 def get_public_perception(payload: FilterPayload):
@@ -287,49 +506,315 @@ async def video_feed(source: str = "0", mode: str = "weapon"):
     )
 
 @app.post("/api/hotspots")
-def get_hotspots(request: HotspotRequest, df: pd.DataFrame = Depends(get_dataframe)):
+def get_hotspots(request: HotspotRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
     try:
-        # ❌ OLD: filters = request.filters or FilterModel()
-        
         # ✅ NEW: The request itself IS the filter object now
-        filters = request 
-        
-        # Apply the filters directly
-        subset = apply_filters(df, filters)
-        subset = subset.fillna(0)
-        
-        # ... (Rest of the function remains exactly the same)
-        if 'LAT' not in subset.columns or 'LON' not in subset.columns:
-             return {"hotspots": [], "heat_data": [], "centers": []}
-        
-        subset = subset[(subset['LAT'] != 0) & (subset['LON'] != 0)]
-        
-        # ... (Keep existing logic for 3D data, Heatmap, Clusters) ...
-        
-        # 3D Data
-        subset_3d = subset.head(15000)
-        hotspots_3d = subset_3d[['LAT', 'LON', 'Severity']].rename(
-            columns={'LAT': 'lat', 'LON': 'lng', 'Severity': 'severity'}
-        ).to_dict(orient='records')
-
-        # 2D Heatmap
-        heat_data = subset[['LAT', 'LON']].values.tolist()
-
-        # 2D Clusters
-        centers = []
-        try:
-            centers = detect_hotspots(subset, 15)
-        except:
-             if len(subset) > 15:
-                kmeans = KMeans(n_clusters=15, n_init=10, random_state=42)
-                kmeans.fit(subset[['LAT', 'LON']])
-                for i, center in enumerate(kmeans.cluster_centers_):
-                    centers.append({"lat": center[0], "lng": center[1], "label": f"#{i+1}"})
-
-        return {"hotspots": hotspots_3d, "heat_data": heat_data, "centers": centers}
+        result = result_cache.get_or_compute(
+            result_cache.key(dataset, "hotspots", request, n_clusters=request.n_clusters),
+            lambda: _compute_hotspots(dataset, request)
+        )
     except Exception as e:
         print(f"Hotspot Error: {e}")
-        return {"hotspots": [], "heat_data": [], "centers": []}
+        return {"hotspots": [], "centers": []}
+
+    media_type = negotiate(accept)
+    if media_type:
+        return columns_response({
+            "hotspots.lat": result["lat_3d"],
+            "hotspots.lng": result["lng_3d"],
+            "hotspots.count": result["count_3d"],
+            "hotspots.severity": result["severity_3d"],
+            "centers.lat": np.array([c["lat"] for c in result["clusters"]], dtype=np.float32),
+            "centers.lng": np.array([c["lng"] for c in result["clusters"]], dtype=np.float32),
+            "centers.count": np.array([c["count"] for c in result["clusters"]], dtype=np.uint32),
+        }, media_type, meta={"severity_labels": result["severity_labels"]})
+
+    severities = decode_codes(result["severity_3d"], result["severity_labels"])
+    hotspots_3d = [
+        {"lat": a, "lng": b, "count": c, "severity": s}
+        for a, b, c, s in zip(result["lat_3d"].tolist(), result["lng_3d"].tolist(), result["count_3d"].tolist(), severities)
+    ]
+    centers = [[c["lat"], c["lng"]] for c in result["clusters"]]
+    return {"hotspots": hotspots_3d, "centers": centers, "clusters": result["clusters"]}
+
+@app.post("/api/hotspots/density")
+def get_density_hotspots(request: DensityHotspotRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    Kernel-density hotspots: top-N density peaks (incidents per km²), optionally with Getis-Ord Gi*
+    significance and the density raster itself.
+    """
+    if request.bandwidth_m <= 0 or request.cell_m <= 0 or request.top_n <= 0:
+        raise HTTPException(status_code=400, detail="bandwidth_m, cell_m and top_n must be positive.")
+    result = result_cache.get_or_compute(
+        result_cache.key(
+            dataset, "density-hotspots", request, top_n=request.top_n, bandwidth_m=request.bandwidth_m,
+            cell_m=request.cell_m, significance=request.significance, include_raster=request.include_raster
+        ),
+        lambda: detect_density_hotspots(
+            apply_filters(dataset, request, columns=['LAT', 'LON']), top_n=request.top_n, bandwidth_m=request.bandwidth_m,
+            cell_m=request.cell_m, significance=request.significance, include_raster=request.include_raster
+        )
+    )
+    peaks, raster = result["peaks"], result["raster"]
+
+    media_type = negotiate(accept)
+    if media_type:
+        columns = {
+            "peaks.lat": np.array([p["lat"] for p in peaks], dtype=np.float32),
+            "peaks.lng": np.array([p["lng"] for p in peaks], dtype=np.float32),
+            "peaks.density": np.array([p["density"] for p in peaks], dtype=np.float32),
+        }
+        if request.significance:
+            columns["peaks.gi_z"] = np.array([p["gi_z"] for p in peaks], dtype=np.float32)
+        meta = {}
+        if raster is not None:
+            columns["raster"] = raster["values"].ravel()
+            meta["raster"] = {k: v for k, v in raster.items() if k != "values"}
+        return columns_response(columns, media_type, meta=meta)
+
+    if raster is not None:
+        raster = {**raster, "values": raster["values"].tolist()}
+    return {"peaks": peaks, "raster": raster}
+
+def _compute_hotspots(dataset: Dataset, filters) -> dict:
+    """Hotspot columns as NumPy arrays, so one cached result serves both JSON and binary responses."""
+    # Apply the filters directly
+    subset = apply_filters(dataset, filters, columns=['LAT', 'LON'])
+    subset = subset.fillna({'LAT': 0, 'LON': 0})
+    subset = subset[(subset['LAT'] != 0) & (subset['LON'] != 0)]
+
+    # 3D Data: the level-of-detail cells /api/points serves (count + dominant severity per cell, spatially even
+    # and bounded in size) over the whole extent, instead of the first rows of the file
+    pyramid = _tile_pyramid(dataset, filters)
+    _, lat_3d, lng_3d, counts_3d = pyramid.bbox(HOTSPOT_3D_ZOOM, *WORLD_BBOX)
+
+    # 2D Clusters (grid-binned, weighted K-Means)
+    n_clusters = getattr(filters, 'n_clusters', 15)
+    clusters = detect_hotspot_clusters(subset, n_clusters)
+
+    return {
+        "lat_3d": np.asarray(lat_3d, dtype=np.float32),
+        "lng_3d": np.asarray(lng_3d, dtype=np.float32),
+        "count_3d": counts_3d.sum(axis=1).astype(np.uint32),
+        "severity_3d": _dominant_codes(pyramid, counts_3d),
+        "severity_labels": [str(s) for s in pyramid.severity_labels],
+        "clusters": clusters,
+    }
+
+def _tile_pyramid(dataset: Dataset, filters) -> TilePyramid:
+    """The dataset's precomputed pyramid, or one built from the filtered rows (cached per filter selection)."""
+    tile_keys = dataset.derived('tile_keys', TileKeys)
+    rows = dataset.derived('filter_index', FilterIndex).rows(filters)
+    if rows is None:
+        return dataset.derived(
+            'tile_pyramid', lambda df: TilePyramid(tile_keys.keys, tile_keys.severity, tile_keys.severity_labels)
+        )
+    return result_cache.get_or_compute(
+        result_cache.key(dataset, "tile-pyramid", filters),
+        lambda: TilePyramid(tile_keys.keys[rows], tile_keys.severity[rows], tile_keys.severity_labels)
+    )
+
+def _dominant_codes(pyramid: TilePyramid, counts):
+    """uint8 code of every cell's most frequent severity (UNKNOWN_CODE for cells without a known severity)."""
+    if not pyramid.severity_labels:
+        return np.full(len(counts), UNKNOWN_CODE, dtype=np.uint8)
+    return np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), UNKNOWN_CODE).astype(np.uint8)
+
+def _request_bbox(request: TileRequest):
+    """The request's [south, west, north, east] box (the whole map when none is given); 400 when malformed."""
+    if request.bbox is None:
+        return WORLD_BBOX
+    if len(request.bbox) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be [south, west, north, east].")
+    south, west, north, east = request.bbox
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+        raise HTTPException(status_code=400, detail="bbox must satisfy south < north (within ±90) and west < east (within ±180).")
+    return south, west, north, east
+
+def _heat_cells(zoom, lat, lon, counts, media_type=None, **meta):
+    counts = counts.sum(axis=1)
+    max_count = int(counts.max()) if len(counts) else 0
+    if media_type:
+        return columns_response({
+            "lat": np.asarray(lat, dtype=np.float32),
+            "lon": np.asarray(lon, dtype=np.float32),
+            "count": counts.astype(np.uint32),
+        }, media_type, meta={"zoom": zoom, "max": max_count, **meta})
+    return {
+        "zoom": zoom,
+        "points": np.column_stack([lat, lon, counts]).tolist(),
+        "max": max_count,
+    }
+
+def _point_cells(pyramid: TilePyramid, zoom, lat, lon, counts, media_type=None, **meta):
+    totals = counts.sum(axis=1)
+    max_count = int(totals.max()) if len(totals) else 0
+    if media_type:
+        return columns_response({
+            "lat": np.asarray(lat, dtype=np.float32),
+            "lng": np.asarray(lon, dtype=np.float32),
+            "count": totals.astype(np.uint32),
+            "severity": _dominant_codes(pyramid, counts),
+        }, media_type, meta={"zoom": zoom, "max": max_count, "severity_labels": [str(s) for s in pyramid.severity_labels], **meta})
+    severities = pyramid.dominant_severity(counts)
+    return {
+        "zoom": zoom,
+        "points": [
+            {"lat": float(a), "lng": float(b), "count": int(c), "severity": s}
+            for a, b, c, s in zip(lat, lon, totals, severities)
+        ],
+        "max": max_count,
+    }
+
+@app.post("/api/heatmap")
+def get_heatmap(request: TileRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    Server-aggregated heatmap: [lat, lon, count] cells for the requested zoom and bounding box.
+    Send `Accept: application/x-crimelens-columns` (or Arrow IPC) for packed typed-array columns instead of JSON.
+    """
+    pyramid = _tile_pyramid(dataset, request)
+    zoom, lat, lon, counts = pyramid.bbox(request.zoom, *_request_bbox(request))
+    media_type = negotiate(accept)
+    if media_type:
+        return _heat_cells(zoom, lat, lon, counts, media_type, total=pyramid.total)
+    return {**_heat_cells(zoom, lat, lon, counts), "total": pyramid.total}
+
+@app.post("/api/heatmap/tiles/{z}/{x}/{y}")
+def get_heatmap_tile(z: int, x: int, y: int, payload: FilterPayload, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    One z/x/y heatmap tile of [lat, lon, count] cells.
+    """
+    lat, lon, counts = _tile_pyramid(dataset, payload).tile(z, x, y)
+    return _heat_cells(z, lat, lon, counts, negotiate(accept))
+
+@app.post("/api/points")
+def get_points(request: TileRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    Level-of-detail points for the 3D view: one aggregated column per cell (count + dominant severity)
+    over the visible bounding box, bounded in size.
+    """
+    pyramid = _tile_pyramid(dataset, request)
+    zoom, lat, lon, counts = pyramid.bbox(request.zoom, *_request_bbox(request))
+    media_type = negotiate(accept)
+    if media_type:
+        return _point_cells(pyramid, zoom, lat, lon, counts, media_type, total=pyramid.total)
+    return {**_point_cells(pyramid, zoom, lat, lon, counts), "total": pyramid.total}
+
+@app.post("/api/points/tiles/{z}/{x}/{y}")
+def get_point_tile(z: int, x: int, y: int, payload: FilterPayload, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    One z/x/y tile of aggregated 3D columns, so the client can stream detail for the visible region.
+    """
+    pyramid = _tile_pyramid(dataset, payload)
+    lat, lon, counts = pyramid.tile(z, x, y)
+    return _point_cells(pyramid, z, lat, lon, counts, negotiate(accept))
+
+def _spatial_mask(dataset: Dataset, request: SpatialQueryRequest):
+    """Boolean row mask for the filters and the days window, or None when nothing is filtered."""
+    df = dataset.df
+    mask = None
+    rows = dataset.derived('filter_index', FilterIndex).rows(request)
+    if rows is not None:
+        mask = np.zeros(len(df), dtype=bool)
+        mask[rows] = True
+    if request.days is not None:
+        # The window ends at the dataset's latest incident (the data is historical)
+        dt = df['datetime_occ'].to_numpy()
+        recent = dt >= dt.max() - np.timedelta64(request.days, 'D')
+        mask = recent if mask is None else mask & recent
+    return mask
+
+INCIDENT_COLUMNS = ('DR_NO', 'LAT', 'LON', 'Crm Cd Desc', 'Severity', 'AREA NAME', 'datetime_occ')
+
+def _incident_records(df, positions, distances=None):
+    cols = [c for c in INCIDENT_COLUMNS if c in df.columns]
+    records = df.iloc[positions, [df.columns.get_loc(c) for c in cols]]
+    if 'datetime_occ' in records.columns:
+        records = records.assign(datetime_occ=records['datetime_occ'].dt.strftime('%Y-%m-%dT%H:%M:%S'))
+    records = records.astype(object).where(records.notna(), None).to_dict(orient='records')
+    if distances is not None:
+        for record, distance in zip(records, distances):
+            record["distance_m"] = round(float(distance), 1)
+    return records
+
+def _incident_columns(df, positions, prefix, columns, labels):
+    """Adds incident columns to a binary response: categoricals as codes (labels in meta), times as epoch seconds."""
+    rows = df.iloc[positions]
+    for col in INCIDENT_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = rows[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            columns[f"{prefix}.{col}"] = category_codes(values)
+            labels[col] = [str(c) for c in values.cat.categories]
+        elif col == 'datetime_occ':
+            columns[f"{prefix}.{col}"] = values.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        elif col in ('LAT', 'LON'):
+            columns[f"{prefix}.{col}"] = values.to_numpy(dtype=np.float32)
+        else:
+            columns[f"{prefix}.{col}"] = values.to_numpy()
+
+@app.post("/api/spatial/query")
+def spatial_query(request: SpatialQueryRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    Incident counts within radius_m of every point (batched) and/or inside a bounding box, honouring the
+    usual filters and an optional `days` window. `limit` > 0 also returns up to that many incidents per
+    query, nearest first. Binary Accept types get typed columns: results.*, incidents.* (with incidents.query,
+    the index of the query point) and bbox.incidents.*.
+    """
+    if request.radius_m <= 0 or request.limit < 0:
+        raise HTTPException(status_code=400, detail="radius_m must be positive and limit non-negative.")
+    if any(len(p) != 2 for p in request.points):
+        raise HTTPException(status_code=400, detail="points must be [lat, lon] pairs.")
+    if request.bbox is not None and len(request.bbox) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be [south, west, north, east].")
+
+    index = dataset.derived('spatial_index', SpatialIndex)
+    mask = _spatial_mask(dataset, request)
+    media_type = negotiate(accept)
+    response = {"radius_m": request.radius_m, "days": request.days}
+    columns, labels = {}, {}
+
+    if request.points:
+        points = np.asarray(request.points, dtype=np.float64)
+        counts = index.count_radius(points[:, 0], points[:, 1], request.radius_m, mask)
+        positions = queries = distances = None
+        if request.limit:
+            # Only the nearest `limit` matches per query are kept (sorted by query, then distance)
+            positions, queries, distances = index.query_radius(points[:, 0], points[:, 1], request.radius_m, mask, limit=request.limit)
+
+        if media_type:
+            columns.update({
+                "results.lat": points[:, 0].astype(np.float32),
+                "results.lon": points[:, 1].astype(np.float32),
+                "results.count": counts.astype(np.uint32),
+            })
+            if positions is not None:
+                columns["incidents.query"] = queries.astype(np.uint32)
+                columns["incidents.distance_m"] = distances.astype(np.float32)
+                _incident_columns(dataset.df, positions, "incidents", columns, labels)
+        else:
+            results = [{"lat": float(lat), "lon": float(lon), "count": int(c)} for (lat, lon), c in zip(points, counts)]
+            if positions is not None:
+                starts = np.searchsorted(queries, np.arange(len(points) + 1))
+                for i, result in enumerate(results):
+                    take = slice(starts[i], starts[i + 1])
+                    result["incidents"] = _incident_records(dataset.df, positions[take], distances[take])
+            response["results"] = results
+
+    if request.bbox is not None:
+        positions = index.query_bbox(*request.bbox, mask=mask)
+        response["bbox"] = {"count": int(len(positions))}
+        if request.limit:
+            if media_type:
+                _incident_columns(dataset.df, positions[:request.limit], "bbox.incidents", columns, labels)
+            else:
+                response["bbox"]["incidents"] = _incident_records(dataset.df, positions[:request.limit])
+
+    if media_type:
+        return columns_response(columns, media_type, meta={**response, "labels": labels})
+    return response
+
 @app.post("/api/map-context")
 def get_map_context(payload: MapContextRequest):
     # 1. Try Primary Service (Local Graph)
@@ -422,40 +907,283 @@ def get_map_context(payload: MapContextRequest):
         {"lat": payload.lat - 0.005, "lon": payload.lon - 0.005, "name": "General Hospital (Demo)", "type": "hospital"}
     ]}
 @app.post("/api/time-series")
-def get_trends(payload: FilterPayload, df: pd.DataFrame = Depends(get_dataframe)):
-    df_filtered = apply_filters(df, payload)
-    counts = get_time_series_data(df_filtered.copy())
-    forecast = get_time_series_forecast(df_filtered.copy())
-    return {"counts": counts, "forecast": forecast or []}
+def get_trends(payload: TimeSeriesRequest, dataset: Dataset = Depends(get_dataset)):
+    def compute():
+        # One monthly series from the pre-aggregated cube feeds both the chart and the (cached) forecast
+        series = dataset.derived('crime_cube', CrimeCube).monthly_counts(payload)
+        forecast = forecast_series(series, method=payload.method)
+        return {"counts": series.to_dict(orient='records'), "forecast": forecast or []}
+
+    try:
+        return result_cache.get_or_compute(result_cache.key(dataset, "time-series", payload, method=payload.method), compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/time-series/range")
+def get_range_counts(request: TimeSeriesRangeRequest, dataset: Dataset = Depends(get_dataset)):
+    """
+    Incident counts per hour, day, week or month over any date range, read from the dataset's hourly
+    prefix sums instead of resampling rows.
+    """
+    hourly = dataset.derived('hourly_counts', HourlyCounts)
+    prefix = hourly.prefix_for(request)
+    if prefix is None:
+        # Filters on several columns: one bincount over the matching rows, cached per selection
+        prefix = result_cache.get_or_compute(
+            result_cache.key(dataset, "hourly-prefix", request),
+            lambda: hourly.prefix_for_rows(dataset.derived('filter_index', FilterIndex).rows(request))
+        )
+    try:
+        series = hourly.range_counts(prefix, request.start, request.end, request.resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"resolution": request.resolution, "counts": series.to_dict(orient='records')}
+
+BATCH_FORECAST_FIELDS = {"area": "areas", "crime": "crimes"}
+
+@app.post("/api/forecast/batch")
+def get_batch_forecast(request: BatchForecastRequest, dataset: Dataset = Depends(get_dataset)):
+    """
+    Forecasts every area (`by: "area"`) or the top_n crime types (`by: "crime"`) in one call.
+    Series come from one pass over the crime cube; models are fitted across a process pool and
+    streamed back as NDJSON lines, one per group, in completion order.
+    """
+    field = BATCH_FORECAST_FIELDS.get(request.by)
+    if field is None:
+        raise HTTPException(status_code=400, detail="by must be 'area' or 'crime'.")
+    if request.periods <= 0 or request.top_n < 0:
+        raise HTTPException(status_code=400, detail="periods must be positive and top_n non-negative.")
+
+    top_n = request.top_n if field == "crimes" else None
+    groups = dataset.derived('crime_cube', CrimeCube).monthly_counts_by(field, request, top_n=top_n)
+    try:
+        results = forecast_batch(groups, request.periods, request.method)
+        first = next(results, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def stream():
+        if first is None:
+            return
+        for label, series, forecast, error in itertools.chain([first], results):
+            line = {"group": label, "by": request.by, "counts": series.to_dict(orient='records'), "forecast": forecast or []}
+            if error:
+                line["error"] = error
+            yield json.dumps(line, default=str) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/api/severity-breakdown")
-def get_severity_breakdown(payload: FilterPayload, df: pd.DataFrame = Depends(get_dataframe)):
-    df_filtered = apply_filters(df, payload)
-    severity_counts = df_filtered['Severity'].value_counts()
+def get_severity_breakdown(payload: FilterPayload, dataset: Dataset = Depends(get_dataset)):
+    def compute():
+        severity_counts, severity_by_area = dataset.derived('crime_cube', CrimeCube).severity_breakdown(payload)
     
-    # 1. PIE CHART
-    pie_data = {
-        "labels": severity_counts.index.tolist(), 
-        "values": severity_counts.values.tolist()
-    }
+        # 1. PIE CHART
+        pie_data = {
+            "labels": severity_counts.index.tolist(), 
+            "values": severity_counts.values.tolist()
+        }
     
-    # 2. BAR CHART
-    bar_data = {}
-    if 'AREA NAME' in df_filtered.columns:
-        severity_by_area = df_filtered.groupby('AREA NAME')['Severity'].value_counts().unstack().fillna(0)
-        bar_data = severity_by_area.reset_index().to_dict(orient='list')
+        # 2. BAR CHART
+        bar_data = severity_by_area.reset_index().to_dict(orient='list') if not severity_by_area.empty else {}
     
+        return {
+            "pie_chart": pie_data, "bar_chart": bar_data,
+            "pieChart": pie_data, "barChart": bar_data
+        }
+
+    return result_cache.get_or_compute(result_cache.key(dataset, "severity-breakdown", payload), compute)
+
+@app.post("/api/train-model")
+def train_model(payload: TrainModelRequest, dataset: Dataset = Depends(get_dataset)):
+    def compute():
+        # A model already trained for this dataset version + filters is reused instead of retrained
+        model_id = model_registry.key(dataset, payload, mode=payload.mode, sample=payload.sample) if model_registry else None
+        model = model_registry.get(model_id) if model_registry else None
+        if model is None:
+            df_filtered = apply_filters(dataset, payload, columns=['hour', 'month', 'LAT', 'LON', 'AREA NAME', 'Severity'])
+            model = fit_risk_model(df_filtered, mode=payload.mode, sample=payload.sample)
+            if model is None:
+                return {"accuracy": "N/A"}
+            model_registry.put(model_id, model)
+        result = {**model.result, "model_id": model_id}
+        if "risk_factors" in result: result["riskFactors"] = result["risk_factors"]
+        return result
+
+    try:
+        return result_cache.get_or_compute(
+            result_cache.key(dataset, "train-model", payload, mode=payload.mode, sample=payload.sample), compute
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/predict-risk")
+def predict_risk(request: PredictRiskRequest, dataset: Dataset = Depends(get_dataset)):
+    """
+    Scores (hour, month, lat, lon, area) records with a stored model: predicted severity plus class probabilities.
+    Uses `model_id` when given, otherwise the model trained for this dataset version and filters.
+    """
+    if model_registry is None:
+        raise HTTPException(status_code=503, detail="Risk models are unavailable.")
+    model_id = request.model_id or model_registry.key(dataset, request)
+    try:
+        model = model_registry.get(model_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if model is None:
+        raise HTTPException(status_code=404, detail="No trained model for this selection. Call /api/train-model first.")
+    if not request.records:
+        return {"model_id": model_id, "classes": model.severity_classes, "predictions": []}
+
+    features = model.features(
+        [r.hour for r in request.records], [r.month for r in request.records],
+        [r.lat for r in request.records], [r.lon for r in request.records], [r.area for r in request.records],
+    )
+    proba = model.predict_proba(features)
+    labels = np.asarray(model.severity_classes, dtype=object)[proba.argmax(axis=1)]
     return {
-        "pie_chart": pie_data, "bar_chart": bar_data,
-        "pieChart": pie_data, "barChart": bar_data
+        "model_id": model_id,
+        "classes": model.severity_classes,
+        "predictions": [
+            {"severity": label, "probabilities": dict(zip(model.severity_classes, p.astype(float).round(4).tolist()))}
+            for label, p in zip(labels, proba)
+        ],
     }
 
-@app.post("/api/train-model")
-def train_model(payload: FilterPayload, df: pd.DataFrame = Depends(get_dataframe)):
-    df_filtered = apply_filters(df, payload)
-    result = train_risk_prediction_model(df_filtered.copy()) or {"accuracy": "N/A"}
-    if "risk_factors" in result: result["riskFactors"] = result["risk_factors"]
-    return result
+def _train_model_job(dataset: Dataset, request: JobRequest):
+    model_id = model_registry.key(dataset, request, mode=request.mode, sample=request.sample)
+    df_filtered = apply_filters(dataset, request, columns=['hour', 'month', 'LAT', 'LON', 'AREA NAME', 'Severity'])
+
+    def on_done(model):
+        if model is None:
+            return {"accuracy": "N/A"}
+        model_registry.put(model_id, model)
+        return {**model.result, "model_id": model_id}
+
+    task = dict(
+        fn=fit_risk_model, args=(df_filtered,), kwargs={"mode": request.mode, "sample": request.sample},
+        on_done=on_done, reports_progress=True
+    )
+    return task, {"mode": request.mode, "sample": request.sample}
+
+def _forecast_job(dataset: Dataset, request: JobRequest):
+    series = dataset.derived('crime_cube', CrimeCube).monthly_counts(request)
+    counts = series.to_dict(orient='records')
+    on_done = lambda forecast: {"counts": counts, "forecast": forecast or []}
+    return dict(fn=forecast_series, args=(series, request.periods, request.method), on_done=on_done), {"periods": request.periods, "method": request.method}
+
+def _hotspots_job(dataset: Dataset, request: JobRequest):
+    subset = apply_filters(dataset, request, columns=['LAT', 'LON'])
+    subset = subset[(subset['LAT'] != 0) & (subset['LON'] != 0)]
+    on_done = lambda clusters: {"clusters": clusters, "centers": [[c["lat"], c["lng"]] for c in clusters]}
+    return dict(fn=detect_hotspot_clusters, args=(subset, request.n_clusters), on_done=on_done), {"n_clusters": request.n_clusters}
+
+JOB_BUILDERS = {"train-model": _train_model_job, "forecast": _forecast_job, "hotspots": _hotspots_job}
+
+@app.post("/api/jobs")
+def submit_job(request: JobRequest, dataset: Dataset = Depends(get_dataset)):
+    """
+    Starts a heavy analytics task in the background and returns its job id immediately.
+    Identical submissions (same kind, dataset version, filters and parameters) share one job.
+    """
+    build = JOB_BUILDERS.get(request.kind)
+    if build is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{request.kind}'. Use one of: {', '.join(JOB_BUILDERS)}.")
+    if request.kind == "train-model" and model_registry is None:
+        raise HTTPException(status_code=503, detail="Risk models are unavailable.")
+    task, params = build(dataset, request)
+    key = result_cache.key(dataset, f"job:{request.kind}", request, **params)
+    job, deduplicated = jobs.submit(request.kind, key, **task)
+    return {**job.snapshot(include_result=False), "deduplicated": deduplicated}
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": jobs.list()}
+
+def _job_or_404(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, progress and (once done) the result of a job."""
+    return _job_or_404(job_id).snapshot()
+
+@app.get("/api/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    """Streams the job's state as NDJSON lines on every change until it finishes."""
+    job = _job_or_404(job_id)
+
+    def stream():
+        revision = -1
+        while True:
+            new_revision, state = jobs.wait(job, revision, timeout=15)
+            if new_revision != revision:
+                revision = new_revision
+                yield json.dumps(state, default=str) + "\n"
+            if state["status"] in TERMINAL_STATES:
+                return
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancels a queued or running job."""
+    _job_or_404(job_id)
+    return jobs.cancel(job_id).snapshot(include_result=False)
+
+@app.post("/api/risk-surface")
+def get_risk_surface(request: RiskSurfaceRequest, dataset: Dataset = Depends(get_dataset), accept: Optional[str] = Header(None)):
+    """
+    City-wide risk raster from a stored model: probability of the most severe level for every grid cell and
+    hour (month defaults to the latest month in the data), scored in one batched prediction and cached per model.
+    """
+    if model_registry is None:
+        raise HTTPException(status_code=503, detail="Risk models are unavailable.")
+    if not (0 < request.rows <= RISK_SURFACE_MAX_SIDE and 0 < request.cols <= RISK_SURFACE_MAX_SIDE):
+        raise HTTPException(status_code=400, detail=f"rows and cols must be between 1 and {RISK_SURFACE_MAX_SIDE}.")
+    if request.month is not None and not 1 <= request.month <= 12:
+        raise HTTPException(status_code=400, detail="month must be between 1 and 12.")
+    if request.bbox is not None and len(request.bbox) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be [south, west, north, east].")
+    model_id = request.model_id or model_registry.key(dataset, request)
+    try:
+        model = model_registry.get(model_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if model is None:
+        raise HTTPException(status_code=404, detail="No trained model for this selection. Call /api/train-model first.")
+
+    try:
+        surface = result_cache.get_or_compute(
+            result_cache.key(
+                dataset, "risk-surface", model_id=model_id, rows=request.rows, cols=request.cols,
+                month=request.month, bbox=request.bbox, risk_class=request.risk_class
+            ),
+            lambda: score_risk_surface(
+                model, dataset.df, rows=request.rows, cols=request.cols, month=request.month,
+                bbox=request.bbox, risk_class=request.risk_class
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    meta = {k: v for k, v in surface.items() if k not in ("risk", "areas")}
+    meta["model_id"] = model_id
+    media_type = negotiate(accept)
+    if media_type:
+        # risk is [24, rows, cols] and areas [rows, cols], both row-major from the south-west corner
+        return columns_response({"risk": surface["risk"].ravel(), "areas": surface["areas"].ravel()}, media_type, meta=meta)
+    return {**meta, "risk": surface["risk"].astype(float).round(4).tolist(), "areas": surface["areas"].tolist()}
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """
+    Hit/miss counters and size of the shared analytics result cache.
+    """
+    return result_cache.stats()
 
 @app.post("/api/generate-report-summary")
 def generate_report_summary(payload: ReportRequest):
@@ -1,53 +1,265 @@
+import os
+import math
+import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
-from prophet import Prophet
+from sklearn.neighbors import KDTree
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder
 
-def detect_hotspots(df, n_clusters=10):
-    """Detects high-crime areas using K-Means clustering."""
+from app.services.forecasting import FORECAST_HORIZON, monthly_series, forecast_series
+from app.services.risk_models import RiskModel, RISK_FEATURES
+
+# Hotspot grid: points are binned onto cells of this size (degrees, ~110 m) before clustering.
+# The grid is coarsened until at most HOTSPOT_MAX_CELLS cells are occupied.
+HOTSPOT_CELL_DEG = 0.001
+HOTSPOT_MAX_CELLS = 20000
+
+def _bin(lat, lon, weights, cell_deg):
+    row = np.floor(lat / cell_deg).astype(np.int64)
+    col = np.floor(lon / cell_deg).astype(np.int64)
+    width = col.max() - col.min() + 1
+    key = (row - row.min()) * width + (col - col.min())
+    span = int(key.max()) + 1
+
+    if span <= 1 << 24:
+        # Dense grid fits in memory: one linear bincount pass instead of a sort
+        counts = np.bincount(key, weights=weights, minlength=span)
+        occupied = np.flatnonzero(counts)
+        sum_lat = np.bincount(key, weights=lat if weights is None else lat * weights, minlength=span)[occupied]
+        sum_lon = np.bincount(key, weights=lon if weights is None else lon * weights, minlength=span)[occupied]
+        counts = counts[occupied]
+    else:
+        _, inverse = np.unique(key, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights)
+        sum_lat = np.bincount(inverse, weights=lat if weights is None else lat * weights)
+        sum_lon = np.bincount(inverse, weights=lon if weights is None else lon * weights)
+    return sum_lat / counts, sum_lon / counts, counts
+
+def bin_points(lat, lon, cell_deg=HOTSPOT_CELL_DEG, max_cells=HOTSPOT_MAX_CELLS):
+    """Bins coordinates onto a grid. Returns the mean position and point count of every occupied cell."""
+    cell_lat, cell_lon, counts = _bin(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), None, cell_deg)
+    while len(counts) > max_cells:
+        # Coarsen from the cells themselves: each fine cell falls entirely inside one coarse cell
+        cell_deg *= 2
+        cell_lat, cell_lon, counts = _bin(cell_lat, cell_lon, counts, cell_deg)
+    return cell_lat, cell_lon, counts.astype(np.int64)
+
+def detect_hotspot_clusters(df, n_clusters=10):
+    """
+    Detects high-crime areas with K-Means over grid cells weighted by their incident counts,
+    so the cost scales with occupied cells rather than incidents. Clusters are ordered by size.
+    """
     # Drop invalid rows first
     df_clean = df.dropna(subset=['LAT', 'LON'])
-    
-    if len(df_clean) < n_clusters:
+    if len(df_clean) == 0 or n_clusters <= 0:
         return []
 
-    coords = df_clean[['LAT', 'LON']]
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    kmeans.fit(coords)
-    
-    # Convert to list and ensure no NaNs
-    centers = []
-    for center in kmeans.cluster_centers_:
-        if not (pd.isna(center[0]) or pd.isna(center[1])):
-            centers.append([float(center[0]), float(center[1])])
-            
-    return centers
+    cell_lat, cell_lon, counts = bin_points(df_clean['LAT'].to_numpy(), df_clean['LON'].to_numpy())
+    k = min(n_clusters, len(counts))
+    coords = np.column_stack([cell_lat, cell_lon])
+
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(coords, sample_weight=counts)
+    cluster_counts = np.bincount(labels, weights=counts, minlength=k).astype(int)
+
+    clusters = []
+    for i in np.argsort(-cluster_counts, kind='stable'):
+        center = kmeans.cluster_centers_[i]
+        # Ensure no NaNs
+        if pd.isna(center[0]) or pd.isna(center[1]):
+            continue
+        clusters.append({"lat": float(center[0]), "lng": float(center[1]), "count": int(cluster_counts[i])})
+    for rank, cluster in enumerate(clusters):
+        cluster["label"] = f"#{rank + 1}"
+    return clusters
+
+def detect_hotspots(df, n_clusters=10):
+    """Detects high-crime areas using K-Means clustering. Returns [lat, lon] centers, largest cluster first."""
+    return [[c["lat"], c["lng"]] for c in detect_hotspot_clusters(df, n_clusters)]
+
+# Density hotspots: incidents are rasterized onto square cells (meters) and smoothed with a Gaussian kernel.
+# The grid is coarsened until neither side exceeds KDE_MAX_GRID cells, so the cost depends on grid size only.
+KDE_CELL_M = 100.0
+KDE_BANDWIDTH_M = 300.0
+KDE_MAX_GRID = 1024
+# Significance level of the one-sided Gi* test (z > 1.645 at 0.05)
+KDE_SIGNIFICANCE_ALPHA = 0.05
+METERS_PER_DEG_LAT = 111_320.0
+
+def _fft_convolve(grid, kernel):
+    """Same-size linear convolution of a 2D grid with an odd-sized kernel via real FFTs."""
+    kh, kw = kernel.shape
+    shape = (grid.shape[0] + kh - 1, grid.shape[1] + kw - 1)
+    spectrum = np.fft.rfft2(grid, shape) * np.fft.rfft2(kernel, shape)
+    full = np.fft.irfft2(spectrum, shape)
+    return full[kh // 2:kh // 2 + grid.shape[0], kw // 2:kw // 2 + grid.shape[1]]
+
+def _gaussian_kernel(sigma_cells):
+    radius = max(int(np.ceil(3 * sigma_cells)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    profile = np.exp(-0.5 * (offsets / sigma_cells) ** 2)
+    kernel = np.outer(profile, profile)
+    return kernel / kernel.sum()
+
+def rasterize(lat, lon, cell_m=KDE_CELL_M, pad_m=0.0, max_grid=KDE_MAX_GRID):
+    """
+    Counts points per square grid cell. Returns (counts[rows, cols], origin lat, origin lon, cell size in
+    degrees of latitude and longitude, cell size in meters); row 0 is the southernmost row.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    meters_per_deg_lon = METERS_PER_DEG_LAT * np.cos(np.radians(lat.mean()))
+    south, north = lat.min() - pad_m / METERS_PER_DEG_LAT, lat.max() + pad_m / METERS_PER_DEG_LAT
+    west, east = lon.min() - pad_m / meters_per_deg_lon, lon.max() + pad_m / meters_per_deg_lon
+    span_m = max((north - south) * METERS_PER_DEG_LAT, (east - west) * meters_per_deg_lon)
+    cell_m = max(cell_m, span_m / max_grid)
+
+    cell_lat, cell_lon = cell_m / METERS_PER_DEG_LAT, cell_m / meters_per_deg_lon
+    rows = min(int((north - south) / cell_lat) + 1, max_grid)
+    cols = min(int((east - west) / cell_lon) + 1, max_grid)
+    r = np.clip(((lat - south) / cell_lat).astype(np.int64), 0, rows - 1)
+    c = np.clip(((lon - west) / cell_lon).astype(np.int64), 0, cols - 1)
+    counts = np.bincount(r * cols + c, minlength=rows * cols).reshape(rows, cols).astype(np.float64)
+    return counts, south, west, cell_lat, cell_lon, cell_m
+
+def getis_ord_gi_star(grid, radius_cells):
+    """
+    Local Getis-Ord Gi* z-scores of every cell, using a square binary neighbourhood of the given radius
+    (cell included). Neighbourhood sums are one FFT convolution each; edge cells use their in-grid neighbours.
+    """
+    n = grid.size
+    mean = grid.mean()
+    std = np.sqrt(max((grid ** 2).mean() - mean ** 2, 0.0))
+    if std == 0 or n < 2:
+        return np.zeros_like(grid)
+    window = np.ones((2 * radius_cells + 1, 2 * radius_cells + 1))
+    local_sum = _fft_convolve(grid, window)
+    weight_sum = np.rint(_fft_convolve(np.ones_like(grid), window))
+    denominator = std * np.sqrt(np.maximum(n * weight_sum - weight_sum ** 2, 0) / (n - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (local_sum - mean * weight_sum) / denominator
+    return np.nan_to_num(z)
+
+def _local_maxima(surface):
+    """Cells that are not smaller than any of their 8 neighbours (and above zero)."""
+    padded = np.pad(surface, 1, constant_values=-np.inf)
+    rows, cols = surface.shape
+    peak = surface > 0
+    for dr in (0, 1, 2):
+        for dc in (0, 1, 2):
+            if dr == 1 and dc == 1:
+                continue
+            peak &= surface >= padded[dr:dr + rows, dc:dc + cols]
+    return peak
+
+def _gi_p_values(z):
+    """One-sided p-values P(Z >= z) of Gi* z-scores."""
+    return 0.5 * np.vectorize(math.erfc, otypes=[np.float64])(np.asarray(z, dtype=np.float64) / math.sqrt(2))
+
+def detect_density_hotspots(df, top_n=15, bandwidth_m=KDE_BANDWIDTH_M, cell_m=KDE_CELL_M, significance=False, include_raster=False):
+    """
+    Density-based hotspots: kernel density of the incidents on a raster grid (FFT convolution),
+    reported as the top-N local density peaks. With `significance`, every peak also gets its
+    Getis-Ord Gi* z-score and one-sided p-value (hotspots are high-value clusters only), and peaks with
+    p >= KDE_SIGNIFICANCE_ALPHA are dropped.
+    Unlike K-Means, no peaks are returned where there is no concentration of incidents.
+    """
+    df_clean = df.dropna(subset=['LAT', 'LON'])
+    df_clean = df_clean[(df_clean['LAT'] != 0) & (df_clean['LON'] != 0)]
+    if len(df_clean) == 0:
+        return {"peaks": [], "raster": None}
+
+    counts, south, west, cell_lat, cell_lon, cell_m = rasterize(
+        df_clean['LAT'].to_numpy(), df_clean['LON'].to_numpy(), cell_m, pad_m=3 * bandwidth_m
+    )
+    sigma = max(bandwidth_m / cell_m, 0.5)
+    # Expected incidents per cell after smoothing (the kernel sums to 1, so the total is preserved)
+    density = np.clip(_fft_convolve(counts, _gaussian_kernel(sigma)), 0, None)
+
+    peak_rows, peak_cols = np.nonzero(_local_maxima(density))
+    order = np.argsort(-density[peak_rows, peak_cols], kind='stable')
+    peak_rows, peak_cols = peak_rows[order], peak_cols[order]
+
+    gi_z = None
+    if significance:
+        gi_z = getis_ord_gi_star(counts, max(int(round(bandwidth_m / cell_m)), 1))
+        significant = _gi_p_values(gi_z[peak_rows, peak_cols]) < KDE_SIGNIFICANCE_ALPHA
+        peak_rows, peak_cols = peak_rows[significant], peak_cols[significant]
+
+    peaks = []
+    area_km2 = (cell_m / 1000.0) ** 2
+    for rank, (r, c) in enumerate(zip(peak_rows[:top_n], peak_cols[:top_n])):
+        peak = {
+            "lat": float(south + (r + 0.5) * cell_lat),
+            "lng": float(west + (c + 0.5) * cell_lon),
+            "density": float(density[r, c] / area_km2),
+            "label": f"#{rank + 1}",
+        }
+        if gi_z is not None:
+            peak["gi_z"] = float(gi_z[r, c])
+            peak["p_value"] = float(_gi_p_values(gi_z[r, c]))
+        peaks.append(peak)
+
+    raster = None
+    if include_raster:
+        raster = {
+            "south": float(south), "west": float(west),
+            "cell_lat": float(cell_lat), "cell_lon": float(cell_lon), "cell_m": float(cell_m),
+            "rows": int(density.shape[0]), "cols": int(density.shape[1]),
+            # Incidents per km², row-major from the south-west corner
+            "values": (density / area_km2).astype(np.float32),
+        }
+    return {"peaks": peaks, "raster": raster}
+
 def get_time_series_data(df):
     """Aggregates crime counts for time-series analysis."""
-    time_series_df = df.set_index('datetime_occ').resample('ME').size().reset_index(name='count')
-    time_series_df.columns = ['ds', 'y']
-    return time_series_df.to_dict(orient='records')
-
-def get_time_series_forecast(df):
-    """Generates a 12-month crime forecast using Prophet."""
-    time_series_df = df.set_index('datetime_occ').resample('ME').size().reset_index(name='count')
-    time_series_df.columns = ['ds', 'y']
-    
-    if len(time_series_df) < 3:
-        return None
+    return monthly_series(df).to_dict(orient='records')
 
-    m = Prophet()
-    m.fit(time_series_df)
-    future = m.make_future_dataframe(periods=12, freq='ME')
-    forecast = m.predict(future)
-    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict(orient='records')
+def get_time_series_forecast(df, periods=FORECAST_HORIZON, method=None):
+    """Generates a 12-month crime forecast (Prophet or the fast Holt-Winters backend, cached per series)."""
+    return forecast_series(monthly_series(df), periods, method)
 
-def train_risk_prediction_model(df):
-    """Trains an XGBoost classifier for crime severity."""
-    model_df = df[['hour', 'month', 'LAT', 'LON', 'AREA NAME', 'Severity']].copy()
+class _TrainingProgress(xgb.callback.TrainingCallback):
+    """Reports boosting rounds to a progress(fraction, message) callback."""
+    def __init__(self, progress, rounds, start=0.1, end=0.95):
+        super().__init__()
+        self.progress = progress
+        self.rounds = max(rounds, 1)
+        self.start, self.end = start, end
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.progress(self.start + (self.end - self.start) * min((epoch + 1) / self.rounds, 1.0), f"Boosting round {epoch + 1}")
+        return False
+
+# Risk model training: "standard" (in-memory XGBClassifier), "scalable" (float32 matrix, hist trees,
+# early stopping, optional adaptive sampling) or "auto" (scalable from RISK_SCALABLE_MIN_ROWS rows)
+RISK_TRAIN_MODE = os.getenv("RISK_TRAIN_MODE", "auto")
+RISK_TRAIN_MODES = ("auto", "standard", "scalable")
+RISK_SCALABLE_MIN_ROWS = int(os.getenv("RISK_SCALABLE_MIN_ROWS", 250_000))
+RISK_TRAIN_THREADS = int(os.getenv("RISK_TRAIN_THREADS", 0))  # 0 = all cores
+RISK_TRAIN_MAX_ROUNDS = 300
+RISK_EARLY_STOPPING_ROUNDS = 20
+# Adaptive sampling: start with this many training rows and double until accuracy gains fall below the tolerance
+RISK_SAMPLE_START = int(os.getenv("RISK_SAMPLE_START", 100_000))
+RISK_SAMPLE_TOLERANCE = float(os.getenv("RISK_SAMPLE_TOLERANCE", 0.002))
+
+def fit_risk_model(df, progress=None, mode=None, sample=False):
+    """
+    Trains an XGBoost classifier for crime severity. Returns a RiskModel (booster, label classes, result) or None.
+    `progress(fraction, message)` is called as training advances (used by background jobs).
+    """
+    mode = mode or RISK_TRAIN_MODE
+    if mode not in RISK_TRAIN_MODES:
+        raise ValueError(f"Unknown training mode '{mode}'. Use one of: {', '.join(RISK_TRAIN_MODES)}.")
+    if mode == "scalable" or sample or (mode == "auto" and len(df) >= RISK_SCALABLE_MIN_ROWS):
+        return _fit_risk_model_scalable(df, progress, sample)
+    return _fit_risk_model_standard(df, progress)
+
+def _fit_risk_model_standard(df, progress=None):
+    model_df = df[RISK_FEATURES + ['Severity']].copy()
     model_df.dropna(inplace=True)
 
     if len(model_df) <= 100:
@@ -55,26 +267,219 @@ def train_risk_prediction_model(df):
 
     le_area = LabelEncoder()
     le_sev = LabelEncoder()
-    model_df['AREA NAME'] = le_area.fit_transform(model_df['AREA NAME'])
-    model_df['Severity'] = le_sev.fit_transform(model_df['Severity'])
+    model_df['AREA NAME'] = le_area.fit_transform(model_df['AREA NAME'].astype(str))
+    model_df['Severity'] = le_sev.fit_transform(model_df['Severity'].astype(str))
+    if len(le_sev.classes_) < 2:
+        return None
 
-    X = model_df[['hour', 'month', 'LAT', 'LON', 'AREA NAME']]
+    X = model_df[RISK_FEATURES]
     y = model_df['Severity']
     
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
     
-    model = xgb.XGBClassifier(objective='multi:softmax', num_class=len(le_sev.classes_), use_label_encoder=False, eval_metric='mlogloss')
+    # softprob: predictions are class probabilities, so stored models can score risk, not just label it
+    model = xgb.XGBClassifier(objective='multi:softprob', num_class=len(le_sev.classes_), eval_metric='mlogloss')
+    if progress:
+        progress(0.1, "Features prepared")
+        model.set_params(callbacks=[_TrainingProgress(progress, model.get_params().get('n_estimators') or 100)])
     model.fit(X_train, y_train)
     
-    preds = model.predict(X_test)
+    # argmax of the probabilities: with two classes predict() returns the softprob matrix itself
+    preds = np.argmax(model.predict_proba(X_test), axis=1)
     accuracy = accuracy_score(y_test, preds)
     
     feature_importance = pd.DataFrame({
         'feature': X.columns, 
-        'importance': model.feature_importances_
+        'importance': model.feature_importances_.astype(float)
     }).sort_values('importance', ascending=False)
 
-    return {
-        "accuracy": accuracy,
+    result = {
+        "accuracy": float(accuracy),
         "feature_importance": feature_importance.to_dict(orient='records')
-    }
\ No newline at end of file
+    }
+    result["mode"] = "standard"
+    return RiskModel(model.get_booster(), le_area.classes_, le_sev.classes_, result)
+
+def _as_category(series):
+    return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+
+def risk_feature_matrix(df):
+    """
+    Risk features as one float32 matrix built column by column from the compact frame (area as its category
+    code), without an intermediate DataFrame copy. Rows with any missing value are dropped.
+    Returns (X, severity codes, area classes, severity classes).
+    """
+    area = _as_category(df['AREA NAME'])
+    severity = _as_category(df['Severity'])
+    area_codes = area.cat.codes.to_numpy()
+    lat = df['LAT'].to_numpy(dtype=np.float32, na_value=np.nan)
+    lon = df['LON'].to_numpy(dtype=np.float32, na_value=np.nan)
+    hour = df['hour'].to_numpy(dtype=np.float32, na_value=np.nan)
+    month = df['month'].to_numpy(dtype=np.float32, na_value=np.nan)
+    y = severity.cat.codes.to_numpy()
+    valid = (y >= 0) & (area_codes >= 0) & np.isfinite(lat) & np.isfinite(lon) & np.isfinite(hour) & np.isfinite(month)
+
+    X = np.empty((int(valid.sum()), len(RISK_FEATURES)), dtype=np.float32)
+    for i, column in enumerate((hour, month, lat, lon, area_codes)):
+        X[:, i] = column[valid]
+    # Only severities present in the data become classes, so labels are contiguous 0..k-1
+    present, y = np.unique(y[valid], return_inverse=True)
+    return X, y.astype(np.int32), list(area.cat.categories.astype(str)), [str(c) for c in severity.cat.categories[present]]
+
+def _stratified_indices(y, fraction, rng):
+    """Split of row indices into (taken, rest) with `fraction` of every class taken."""
+    taken = []
+    for label in np.unique(y):
+        rows = rng.permutation(np.flatnonzero(y == label))
+        taken.append(rows[:int(round(len(rows) * fraction))])
+    taken = np.sort(np.concatenate(taken))
+    rest = np.setdiff1d(np.arange(len(y)), taken, assume_unique=True)
+    return taken, rest
+
+def _fit_hist(X_train, y_train, X_val, y_val, n_classes, progress=None, span=(0.1, 0.95)):
+    """Histogram-based boosting with early stopping on the validation rows; returns the booster cut at its best round."""
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_train, feature_names=RISK_FEATURES, max_bin=256)
+    dval = xgb.QuantileDMatrix(X_val, label=y_val, feature_names=RISK_FEATURES, ref=dtrain)
+    params = {
+        "objective": "multi:softprob",
+        "num_class": n_classes,
+        "tree_method": "hist",
+        "max_bin": 256,
+        "eval_metric": "mlogloss",
+        "nthread": RISK_TRAIN_THREADS or os.cpu_count() or 1,
+    }
+    callbacks = [_TrainingProgress(progress, RISK_TRAIN_MAX_ROUNDS, *span)] if progress else None
+    booster = xgb.train(
+        params, dtrain, num_boost_round=RISK_TRAIN_MAX_ROUNDS, evals=[(dval, "validation")],
+        early_stopping_rounds=RISK_EARLY_STOPPING_ROUNDS, verbose_eval=False, callbacks=callbacks
+    )
+    return booster[:booster.best_iteration + 1]
+
+def _accuracy(booster, X, y):
+    preds = booster.inplace_predict(X).reshape(len(X), -1).argmax(axis=1)
+    return float((preds == y).mean())
+
+def _fit_risk_model_scalable(df, progress=None, sample=False):
+    X, y, area_classes, severity_classes = risk_feature_matrix(df)
+    if len(X) <= 100 or len(severity_classes) < 2:
+        return None
+    if progress:
+        progress(0.05, "Features prepared")
+
+    rng = np.random.default_rng(42)
+    # Same 70/30 train/test proportions as the standard path; 10% of the training rows are a validation slice
+    # that drives early stopping and the sample-size choice, so the test rows are only used for the reported accuracy
+    test, train = _stratified_indices(y, 0.3, rng)
+    val_pos, fit_pos = _stratified_indices(y[train], 0.1, rng)
+    val, fit = train[val_pos], train[fit_pos]
+
+    sizes = [len(fit)]
+    if sample:
+        size = min(RISK_SAMPLE_START, len(fit))
+        sizes = [size]
+        while size < len(fit):
+            size = min(size * 2, len(fit))
+            sizes.append(size)
+
+    booster, val_accuracy, used, history = None, None, 0, []
+    for step, size in enumerate(sizes):
+        rows = fit if size == len(fit) else fit[_stratified_indices(y[fit], size / len(fit), rng)[0]]
+        span = (0.05 + 0.9 * step / len(sizes), 0.05 + 0.9 * (step + 1) / len(sizes))
+        candidate = _fit_hist(X[rows], y[rows], X[val], y[val], len(severity_classes), progress, span)
+        candidate_accuracy = _accuracy(candidate, X[val], y[val])
+        history.append({"rows": int(len(rows)), "validation_accuracy": candidate_accuracy, "rounds": int(candidate.num_boosted_rounds())})
+        plateaued = val_accuracy is not None and candidate_accuracy - val_accuracy < RISK_SAMPLE_TOLERANCE
+        if val_accuracy is None or candidate_accuracy >= val_accuracy:
+            booster, val_accuracy, used = candidate, candidate_accuracy, len(rows)
+        if plateaued:
+            break
+    accuracy = _accuracy(booster, X[test], y[test])
+
+    gain = booster.get_score(importance_type='gain')
+    total_gain = sum(gain.values()) or 1.0
+    feature_importance = sorted(
+        ({"feature": f, "importance": float(gain.get(f, 0.0) / total_gain)} for f in RISK_FEATURES),
+        key=lambda item: item["importance"], reverse=True
+    )
+    result = {
+        "accuracy": accuracy,
+        "validation_accuracy": val_accuracy,
+        "feature_importance": feature_importance,
+        "mode": "scalable",
+        "training_rows": int(used),
+        "rounds": int(booster.num_boosted_rounds()),
+    }
+    if sample:
+        result["sampling"] = history
+    return RiskModel(booster, area_classes, severity_classes, result)
+
+def train_risk_prediction_model(df):
+    """Trains an XGBoost classifier for crime severity."""
+    model = fit_risk_model(df)
+    return model.result if model is not None else None
+
+# Risk surfaces: grid size limits and the cell size used to thin incidents for the nearest-area lookup
+RISK_SURFACE_MAX_SIDE = 400
+RISK_AREA_CELL_DEG = 0.002
+
+def nearest_area(df, lat, lon):
+    """Area name of the nearest incident to every (lat, lon), via a KD-tree over grid-thinned incident positions."""
+    points = df[['LAT', 'LON', 'AREA NAME']].dropna()
+    points = points[(points['LAT'] != 0) & (points['LON'] != 0)]
+    row = np.floor(points['LAT'].to_numpy(dtype=np.float64) / RISK_AREA_CELL_DEG).astype(np.int64)
+    col = np.floor(points['LON'].to_numpy(dtype=np.float64) / RISK_AREA_CELL_DEG).astype(np.int64)
+    # One representative incident per small cell keeps the tree small on multi-million-row datasets
+    first = ~pd.Index((row << 32) ^ (col & 0xFFFFFFFF)).duplicated()
+    reps = points[first]
+    tree = KDTree(reps[['LAT', 'LON']].to_numpy(dtype=np.float64))
+    _, nearest = tree.query(np.column_stack([lat, lon]), k=1)
+    return reps['AREA NAME'].astype(str).to_numpy()[nearest[:, 0]]
+
+def score_risk_surface(model, df, rows=200, cols=200, month=None, bbox=None, risk_class=None):
+    """
+    Scores a rows x cols lat/lon grid for all 24 hours in one batched prediction.
+    Returns the probability of `risk_class` (default: the most severe level the model knows) as a
+    float32 array [24, rows, cols], row 0 being the southern edge, plus the grid's area codes.
+    """
+    if bbox is None:
+        coords = df[['LAT', 'LON']].dropna()
+        coords = coords[(coords['LAT'] != 0) & (coords['LON'] != 0)]
+        # Percentiles rather than min/max so a few mis-geocoded incidents do not stretch the grid
+        south, north = np.percentile(coords['LAT'], [0.5, 99.5])
+        west, east = np.percentile(coords['LON'], [0.5, 99.5])
+        bbox = (float(south), float(west), float(north), float(east))
+    south, west, north, east = bbox
+    if month is None:
+        month = int(df['datetime_occ'].max().month)
+
+    if risk_class is None:
+        severity = df['Severity']
+        levels = severity.cat.categories if isinstance(severity.dtype, pd.CategoricalDtype) else []
+        risk_class = next((str(level) for level in levels if str(level) in model.severity_classes), model.severity_classes[0])
+    if risk_class not in model.severity_classes:
+        raise ValueError(f"Unknown risk class '{risk_class}'. Use one of: {', '.join(model.severity_classes)}.")
+
+    lat = south + (np.arange(rows) + 0.5) * (north - south) / rows
+    lon = west + (np.arange(cols) + 0.5) * (east - west) / cols
+    grid_lat, grid_lon = (a.ravel() for a in np.meshgrid(lat, lon, indexing='ij'))
+    areas = nearest_area(df, grid_lat, grid_lon)
+
+    # Every grid cell repeated for every hour: one feature matrix, one predict call
+    n_cells = len(grid_lat)
+    hours = np.repeat(np.arange(24), n_cells)
+    features = model.features(
+        hours, np.full(24 * n_cells, month), np.tile(grid_lat, 24), np.tile(grid_lon, 24), np.tile(areas, 24)
+    )
+    proba = model.predict_proba(features)[:, model.severity_classes.index(risk_class)]
+
+    area_labels = sorted(set(areas))
+    return {
+        "bbox": [float(south), float(west), float(north), float(east)],
+        "rows": rows,
+        "cols": cols,
+        "month": month,
+        "risk_class": risk_class,
+        "risk": proba.astype(np.float32).reshape(24, rows, cols),
+        "area_labels": area_labels,
+        "areas": pd.Categorical(areas, categories=area_labels).codes.astype(np.uint8 if len(area_labels) < 256 else np.uint16).reshape(rows, cols),
+    }
@@ -0,0 +1,163 @@
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+
+# Analytics result cache limits
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 256))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 3600))
+# Memory budget for cached results (estimated payload size); least-recently-used results are evicted first
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", 512))
+# Long lists are sized from a sample of their items
+_SIZE_SAMPLE = 64
+
+FILTER_FIELDS = ('areas', 'crimes', 'severities')
+
+def canonical_filters(filters):
+    """Filter lists sorted and de-duplicated, so the same selection in any order maps to one key."""
+    return {field: sorted(set(getattr(filters, field, None) or [])) for field in FILTER_FIELDS}
+
+def filters_hash(filters):
+    payload = json.dumps(canonical_filters(filters), sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def estimate_size(value, _depth=0):
+    """
+    Approximate memory footprint in bytes of a cached result: NumPy / pandas buffers, containers and
+    the attributes of result objects (tile pyramids, ...). Cheap on large payloads: lists are sampled.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=False))
+    if isinstance(value, (str, bytes)):
+        return len(value) + 49
+    if value is None or isinstance(value, (bool, int, float, np.generic)):
+        return 32
+    if _depth > 8:
+        return 64
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[:_SIZE_SAMPLE]
+        per_item = sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in sample)
+        return 64 + per_item * len(items) // max(len(sample), 1)
+    if isinstance(value, (list, tuple, set)):
+        items = value if isinstance(value, (list, tuple)) else list(value)
+        sample = items[:_SIZE_SAMPLE]
+        per_item = sum(estimate_size(v, _depth + 1) for v in sample)
+        return 56 + 8 * len(items) + per_item * len(items) // max(len(sample), 1)
+    # Structures that know their own footprint (e.g. HourlyCounts) report it as nbytes
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes) + 64
+    if hasattr(value, '__dict__'):
+        return 64 + estimate_size(vars(value), _depth + 1)
+    return 64
+
+class ResultCache:
+    """
+    LRU + TTL cache for analytics results keyed by (dataset version, endpoint, filters, parameters), bounded
+    by entry count and by the estimated size of the cached values.
+    Concurrent identical requests are coalesced: one caller computes, the others wait for its result.
+    """
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl_seconds=RESULT_CACHE_TTL_SECONDS, max_mb=RESULT_CACHE_MAX_MB):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, dataset_id, value, size in bytes)
+        self._pending = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, dataset, endpoint, filters=None, **params):
+        return (
+            dataset.id,
+            dataset.version,
+            endpoint,
+            json.dumps(canonical_filters(filters), sort_keys=True) if filters is not None else None,
+            json.dumps(params, sort_keys=True, default=str),
+        )
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for key, computing it once (across concurrent callers) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                self._drop(key)
+
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                future = Future()
+                self._pending[key] = future
+                self.misses += 1
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        size = estimate_size(value)
+        with self._lock:
+            self._pending.pop(key, None)
+            # Results larger than the whole budget are returned but not kept
+            if size <= self.max_bytes:
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, key[0], value, size)
+                self.bytes += size
+                while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+        future.set_result(value)
+        return value
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[3]
+
+    def invalidate(self, dataset_id=None):
+        """Drops every cached result (or only those of one dataset)."""
+        with self._lock:
+            if dataset_id is None:
+                self._entries.clear()
+                self.bytes = 0
+                return
+            for key in [k for k, entry in self._entries.items() if entry[1] == dataset_id]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "memory_mb": round(self.bytes / 1024 ** 2, 2),
+                "max_mb": round(self.max_bytes / 1024 ** 2, 2),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+result_cache = ResultCache()
@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from app.services.indexing import FILTER_COLUMNS
+
+# Packed cube cell key: one bit field per dimension, least significant last. Category codes are stored +1 so
+# missing values (-1) become 0; months are stored relative to the cube's first month. Field widths are sized
+# from each dataset's cardinalities, so values can never spill into a neighbouring field.
+_FIELDS = ('areas', 'crimes', 'severities', 'bucket', 'hour')
+_HOUR_BITS = 5
+_KEY_BITS = 63
+
+def _layout(widths):
+    """Bit shift of every field for the given field widths; raises ValueError when they do not fit one int64 key."""
+    if sum(widths.values()) > _KEY_BITS:
+        raise ValueError(f"Crime cube key needs {sum(widths.values())} bits (max {_KEY_BITS}): too many categories or months.")
+    shifts = {}
+    offset = 0
+    for field in reversed(_FIELDS):
+        shifts[field] = offset
+        offset += widths[field]
+    return shifts
+
+def _aggregate(keys, counts=None):
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(uniques)).astype(np.int64)
+    return uniques, totals
+
+class CrimeCube:
+    """
+    Sparse count cube over area x crime description x severity x month bucket x hour, built once per dataset.
+    Breakdowns and monthly counts for any filter combination sum cube cells instead of scanning incidents.
+    """
+    def __init__(self, df=None):
+        self.categories = {}
+        self.bits = {field: 1 for field in _FIELDS}
+        self.bits['hour'] = _HOUR_BITS
+        self.shifts = _layout(self.bits)
+        self.first_bucket = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        if df is not None:
+            self._set_categories(df)
+            buckets = self._buckets(df)
+            self.first_bucket = int(buckets.min()) if len(buckets) else 0
+            span = int(buckets.max()) - self.first_bucket + 1 if len(buckets) else 1
+            self._set_layout(span)
+            self.keys, self.counts = _aggregate(self._cell_keys(df))
+            self._build_rollup()
+
+    def _set_layout(self, bucket_span):
+        # Codes run 0..len(categories) after the +1 shift; one spare bit per field leaves room for appended
+        # categories and months before extended() has to rebuild with a wider layout
+        for field in FILTER_COLUMNS:
+            self.bits[field] = len(self.categories[field]).bit_length() + 1
+        self.bits['bucket'] = int(bucket_span - 1).bit_length() + 1
+        self.shifts = _layout(self.bits)
+
+    def _fits(self, field, values):
+        return len(values) == 0 or (values.min() >= 0 and values.max() < (1 << self.bits[field]))
+
+    def _pack(self, fields):
+        key = np.zeros(len(fields['hour']), dtype=np.int64)
+        for field in _FIELDS:
+            key |= fields[field].astype(np.int64) << self.shifts[field]
+        return key
+
+    def _unpack(self, keys, field):
+        values = (keys >> self.shifts[field]) & ((1 << self.bits[field]) - 1)
+        return values + self.first_bucket if field == 'bucket' else values
+
+    @staticmethod
+    def _buckets(df):
+        dt = df['datetime_occ'].dt
+        return dt.year.to_numpy() * 12 + dt.month.to_numpy() - 1
+
+    def _set_categories(self, df):
+        for field, col in FILTER_COLUMNS.items():
+            series = df[col]
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+            self.categories[field] = series.cat.categories
+
+    def _cell_keys(self, df):
+        fields = {}
+        for field, col in FILTER_COLUMNS.items():
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype) and series.cat.categories.equals(self.categories[field]):
+                codes = series.cat.codes.to_numpy()
+            else:
+                codes = pd.Categorical(series, categories=self.categories[field]).codes
+            fields[field] = codes.astype(np.int64) + 1
+        fields['bucket'] = self._buckets(df) - self.first_bucket
+        fields['hour'] = df['datetime_occ'].dt.hour.to_numpy()
+        for field in _FIELDS:
+            if not self._fits(field, fields[field]):
+                raise ValueError(f"Crime cube field '{field}' does not fit its {self.bits[field]}-bit layout.")
+        return self._pack(fields)
+
+    def _build_rollup(self):
+        # Same cells with the hour summed out: what breakdowns and monthly series read
+        hour_mask = np.int64(((1 << self.bits['hour']) - 1) << self.shifts['hour'])
+        self.rollup_keys, self.rollup_counts = _aggregate(self.keys & ~hour_mask, self.counts)
+
+    def extended(self, df, start):
+        """Returns a cube covering df by adding the cells of the rows appended from position `start`."""
+        cube = CrimeCube()
+        cube._set_categories(df)
+        for field, categories in self.categories.items():
+            # Appends only add categories at the end; anything else means the codes moved
+            if not cube.categories[field][:len(categories)].equals(categories):
+                return CrimeCube(df)
+        cube.bits, cube.shifts, cube.first_bucket = self.bits, self.shifts, self.first_bucket
+        delta_buckets = self._buckets(df.iloc[start:]) - self.first_bucket
+        # New categories or months outside the current bit widths need a wider layout
+        if not cube._fits('bucket', delta_buckets) or any(
+            not cube._fits(field, np.array([len(cube.categories[field])])) for field in FILTER_COLUMNS
+        ):
+            return CrimeCube(df)
+        delta_keys, delta_counts = _aggregate(cube._cell_keys(df.iloc[start:]))
+        cube.keys, cube.counts = _aggregate(np.concatenate([self.keys, delta_keys]), np.concatenate([self.counts, delta_counts]))
+        cube._build_rollup()
+        return cube
+
+    def _select(self, keys, filters):
+        mask = np.ones(len(keys), dtype=bool)
+        for field in FILTER_COLUMNS:
+            values = getattr(filters, field, None) or []
+            if not values:
+                continue
+            categories = self.categories[field]
+            codes = categories.get_indexer(pd.Index(list(set(values)), dtype=categories.dtype))
+            mask &= np.isin(self._unpack(keys, field), codes[codes >= 0] + 1)
+        return mask
+
+    def _labels(self, field, codes):
+        return self.categories[field].take(codes - 1)
+
+    def severity_breakdown(self, filters):
+        """Pie (counts per severity) and bar (area x severity) data for the filtered cells."""
+        mask = self._select(self.rollup_keys, filters)
+        keys, counts = self.rollup_keys[mask], self.rollup_counts[mask]
+        severities, areas = self._unpack(keys, 'severities'), self._unpack(keys, 'areas')
+        known = (severities > 0) & (areas > 0)
+
+        cells = pd.DataFrame({
+            'AREA NAME': self._labels('areas', areas[known]),
+            'Severity': self._labels('severities', severities[known]),
+            'count': counts[known],
+        })
+        severity_counts = cells.groupby('Severity', observed=True)['count'].sum().sort_values(ascending=False, kind='stable')
+        severity_by_area = cells.pivot_table(index='AREA NAME', columns='Severity', values='count', aggfunc='sum', observed=True).fillna(0)
+        ordered = [s for s in self.categories['severities'] if s in severity_by_area.columns]
+        severity_by_area = severity_by_area[ordered].sort_index()
+        severity_by_area.columns.name = None
+        return severity_counts, severity_by_area
+
+    @staticmethod
+    def _month_frame(first_bucket, totals):
+        start = pd.Timestamp(year=int(first_bucket // 12), month=int(first_bucket % 12) + 1, day=1)
+        return pd.DataFrame({'ds': pd.date_range(start, periods=len(totals), freq='ME'), 'y': totals})
+
+    def monthly_counts(self, filters):
+        """Month-end counts for the filtered cells, with empty months in between filled with 0."""
+        mask = self._select(self.rollup_keys, filters)
+        if not mask.any():
+            return pd.DataFrame({'ds': pd.DatetimeIndex([]), 'y': np.empty(0, dtype=np.int64)})
+        buckets = self._unpack(self.rollup_keys[mask], 'bucket')
+        first = buckets.min()
+        totals = np.bincount(buckets - first, weights=self.rollup_counts[mask]).astype(np.int64)
+        return self._month_frame(first, totals)
+
+    def monthly_counts_by(self, field, filters, top_n=None):
+        """
+        Monthly counts of every group of one field ('areas', 'crimes' or 'severities') in one pass over the
+        cells, as [(label, ds/y frame)] with the largest groups first. Each series spans its own first to
+        last month, exactly like monthly_counts filtered to that group.
+        """
+        mask = self._select(self.rollup_keys, filters)
+        groups = self._unpack(self.rollup_keys[mask], field)
+        buckets = self._unpack(self.rollup_keys[mask], 'bucket')
+        counts = self.rollup_counts[mask]
+        known = groups > 0
+        groups, buckets, counts = groups[known], buckets[known], counts[known]
+        if len(groups) == 0:
+            return []
+
+        first = buckets.min()
+        n_months = int(buckets.max() - first) + 1
+        matrix = np.zeros((int(groups.max()) + 1, n_months), dtype=np.int64)
+        np.add.at(matrix, (groups, buckets - first), counts)
+
+        totals = matrix.sum(axis=1)
+        order = [g for g in np.argsort(-totals, kind='stable') if totals[g] > 0]
+        if top_n:
+            order = order[:top_n]
+        result = []
+        for g in order:
+            months = np.flatnonzero(matrix[g])
+            label = self._labels(field, np.array([g]))[0]
+            result.append((label, self._month_frame(first + months[0], matrix[g, months[0]:months[-1] + 1])))
+        return result
@@ -1,68 +1,405 @@
+import os
+import json
+import hashlib
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-def load_and_preprocess_data(file_stream):
-    """Loads and preprocesses data from an in-memory file."""
-    try:
-        df = pd.read_csv(file_stream, encoding='utf-8')
-    except Exception as e:
-        raise ValueError(f"Error reading CSV: {e}")
+# Version of the preprocessing output. Part of every snapshot key, so bump it whenever parsing, compaction
+# or severity classification changes and re-uploads are processed again instead of reusing stale snapshots.
+PIPELINE_VERSION = 2
+
+# Required columns for every upload
+REQUIRED_COLUMNS = ['DATE OCC', 'TIME OCC', 'LAT', 'LON', 'Crm Cd Desc', 'AREA NAME']
+
+# Streaming ingestion: rows parsed per chunk. Only one chunk of raw strings is held at a time.
+CHUNK_SIZE = 200_000
+# String columns outside COMPACT_DTYPES become categoricals only below this distinct-values / rows ratio
+# (decided on the first chunk, so every chunk of an upload gets the same layout)
+CATEGORY_MAX_UNIQUE_RATIO = 0.05
+
+# Candidate DATE OCC formats, tried in order on a sample of each upload.
+# Standard LAPD format is usually 'MM/DD/YYYY hh:mm:ss AM/PM'
+DATE_FORMATS = [
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y',
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y',
+]
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+class DateParser:
+    """
+    Parses DATE OCC strings for one upload.
+    The format is detected once and every unique string is parsed only once, even across chunks.
+    """
+    def __init__(self, sample_size=200):
+        self.fmt = None
+        self.sample_size = sample_size
+        self.cache = {}
 
+    def _detect_format(self, uniques):
+        sample = uniques[:self.sample_size]
+        scores = {fmt: pd.to_datetime(sample, format=fmt, errors='coerce').notna().mean() for fmt in DATE_FORMATS}
+        best = max(scores, key=scores.get)
+        if scores[best] > 0:
+            print(f"📅 Detected DATE OCC format: {best}")
+            return best
+        print("⚠️ Unknown DATE OCC format, falling back to inference.")
+        return None
+
+    def _parse_uniques(self, uniques):
+        if self.fmt is None:
+            self.fmt = self._detect_format(uniques) or ''
+        if not self.fmt:
+            return pd.to_datetime(uniques, errors='coerce')
+
+        parsed = pd.to_datetime(uniques, format=self.fmt, errors='coerce')
+        failed = parsed.isna() & pd.notna(uniques)
+        if failed.any():
+            # Stray rows in another format: infer just those
+            parsed = parsed.where(~failed, pd.to_datetime(uniques[failed], errors='coerce').reindex(parsed.index))
+        return parsed
+
+    def parse(self, series):
+        codes, uniques = pd.factorize(series)
+        missing = pd.Index([u for u in uniques if u not in self.cache], dtype=object)
+        if len(missing):
+            parsed = pd.Series(self._parse_uniques(pd.Series(missing, dtype=object)).to_numpy(dtype='datetime64[ns]'))
+            self.cache.update(zip(missing, parsed.to_numpy()))
+
+        # Trailing NaT catches missing strings (factorize code -1)
+        lookup = np.array([self.cache[u] for u in uniques] + [np.datetime64('NaT')], dtype='datetime64[ns]')
+        return pd.Series(lookup[codes], index=series.index)
+
+def _padded_time_occ(time_occ):
+    """Zero-pads integer HHMM values as a categorical, formatting each unique value once."""
+    codes, uniques = pd.factorize(time_occ.round())
+    return pd.Categorical.from_codes(codes, categories=[f"{int(u):04d}" for u in uniques])
+
+def _preprocess_frame(df, date_parser=None):
+    """Applies the preprocessing steps to a raw (chunk of a) crime frame."""
     # Ensure required columns exist
-    required_columns = ['DATE OCC', 'TIME OCC', 'LAT', 'LON', 'Crm Cd Desc', 'AREA NAME']
-    if not all(col in df.columns for col in required_columns):
-        raise ValueError(f"Missing one or more required columns: {required_columns}")
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        raise ValueError(f"Missing one or more required columns: {REQUIRED_COLUMNS}")
+
+    date_parser = date_parser or DateParser()
 
     # Data Preprocessing
-    # 1. Pad TIME OCC (e.g., '930' -> '0930')
-    df['TIME OCC'] = df['TIME OCC'].astype(str).str.zfill(4)
+    # 1. Split TIME OCC (e.g. 930 -> 09:30) with integer arithmetic
+    time_occ = pd.to_numeric(df['TIME OCC'], errors='coerce')
+    minutes_of_day = (time_occ // 100) * 60 + (time_occ % 100)
+    df['TIME OCC'] = _padded_time_occ(time_occ)
 
-    # 2. Convert DATE OCC to datetime objects
-    # Fix: Added explicit format to suppress UserWarning and improve speed.
-    # Standard LAPD format is usually 'MM/DD/YYYY hh:mm:ss AM/PM'
-    # If your CSV uses a different format (like 'YYYY-MM-DD'), change the format string below.
-    try:
-        df['date_only'] = pd.to_datetime(df['DATE OCC'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-    except:
-        # Fallback if the specific format fails
-        df['date_only'] = pd.to_datetime(df['DATE OCC'], errors='coerce')
+    # 2. Convert DATE OCC to datetime objects (format detected once per upload, unique strings parsed once)
+    date_only = date_parser.parse(df['DATE OCC'])
 
     # 3. Create a full datetime column by combining Date + Time
-    # We take the date part and add the hours and minutes from TIME OCC
-    df['datetime_occ'] = df['date_only'] + \
-                         pd.to_timedelta(df['TIME OCC'].str[:2].astype(int), unit='h') + \
-                         pd.to_timedelta(df['TIME OCC'].str[2:].astype(int), unit='m')
-
-    # 4. Extract features for analysis
-    df['hour'] = df['datetime_occ'].dt.hour
-    df['month'] = df['datetime_occ'].dt.month
-    df['day_of_week'] = df['datetime_occ'].dt.day_name()
-    
-    # 5. Clean data
+    df['datetime_occ'] = date_only + pd.to_timedelta(minutes_of_day, unit='m')
+
+    # 4. Clean data
     # Remove rows with invalid coordinates (0,0 is often used as a placeholder for null location)
     df = df[(df['LAT'] != 0) & (df['LON'] != 0)]
-    
+
     # Drop rows where critical data is missing
-    df.dropna(subset=['datetime_occ', 'LAT', 'LON', 'Crm Cd Desc'], inplace=True)
-    
-    # Clean up temporary columns if desired, or keep them if needed
-    if 'date_only' in df.columns:
-        df.drop(columns=['date_only'], inplace=True)
+    df = df.dropna(subset=['datetime_occ', 'LAT', 'LON', 'Crm Cd Desc'])
+
+    # 5. Extract features for analysis
+    dt = df['datetime_occ'].dt
+    df = df.assign(
+        hour=dt.hour.astype('int8'),
+        month=dt.month.astype('int8'),
+        day_of_week=pd.Categorical.from_codes(dt.dayofweek.to_numpy(), categories=DAY_NAMES),
+    )
 
     return df
 
-def classify_severity(df):
-    """Tags crimes with a severity level."""
-    def get_severity(crime_desc):
-        crime_desc = str(crime_desc).upper()
-        # High Severity: Violent crimes or crimes involving weapons
-        if any(word in crime_desc for word in ['HOMICIDE', 'ROBBERY', 'ASSAULT', 'WEAPON', 'RAPE', 'KIDNAPPING']):
-            return 'High'
-        # Medium Severity: Property crimes, major theft
-        elif any(word in crime_desc for word in ['BURGLARY', 'THEFT', 'VEHICLE STOLEN', 'VANDALISM']):
-            return 'Medium'
-        # Low Severity: Minor offenses
-        else:
-            return 'Low'
-
-    df['Severity'] = df['Crm Cd Desc'].apply(get_severity)
-    return df
\ No newline at end of file
+def _is_read_column(col):
+    """Raw CSV columns worth parsing: those preprocessing needs plus the compact layout. Free text is never read."""
+    return col in REQUIRED_COLUMNS or col in COMPACT_DTYPES
+
+def _trim_frame(df):
+    """Keeps only the compact layout's columns of a preprocessed frame (drops DATE OCC and other raw inputs)."""
+    return df[[col for col in df.columns if col in COMPACT_DTYPES]]
+
+def load_and_preprocess_data(file_stream):
+    """Loads and preprocesses data from an in-memory file."""
+    try:
+        df = pd.read_csv(file_stream, encoding='utf-8', usecols=_is_read_column)
+    except Exception as e:
+        raise ValueError(f"Error reading CSV: {e}")
+
+    return _trim_frame(_preprocess_frame(df))
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+def _categorical_columns(df):
+    """
+    String columns worth storing as categoricals: the known low-cardinality columns of COMPACT_DTYPES plus any
+    other string column with few distinct values. High-cardinality text stays as strings.
+    """
+    columns = []
+    for col in df.columns:
+        if not _is_text(df[col]):
+            continue
+        if COMPACT_DTYPES.get(col) == 'category' or df[col].nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(df):
+            columns.append(col)
+    return columns
+
+def _compact_chunk(df, columns):
+    """Stores the given string columns of a preprocessed chunk as categoricals so raw strings can be released."""
+    for col in columns:
+        if col in df.columns and _is_text(df[col]):
+            df[col] = df[col].astype('category')
+    return df
+
+def _sampled_memory_mb(df, sample_size=2000):
+    """Deep memory footprint of a frame in MB, extrapolated from a row sample (cheap on large string frames)."""
+    if len(df) <= sample_size:
+        return df.memory_usage(deep=True).sum() / 1024 ** 2
+    sample = df.iloc[:sample_size]
+    return sample.memory_usage(deep=True).sum() / 1024 ** 2 * len(df) / sample_size
+
+def _concat_chunks(chunks):
+    """Concatenates compacted chunks, unifying the categories of each categorical column."""
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+
+    unified = {}
+    for col in chunks[0].columns:
+        if all(isinstance(c[col].dtype, pd.CategoricalDtype) for c in chunks):
+            unified[col] = union_categoricals([c[col] for c in chunks]).categories
+
+    for chunk in chunks:
+        for col, categories in unified.items():
+            chunk[col] = chunk[col].cat.set_categories(categories)
+
+    return pd.concat(chunks, ignore_index=True)
+
+def append_frames(base, delta):
+    """
+    Appends preprocessed rows to an existing frame without mutating it.
+    New categories are appended after the existing ones so the base frame's category codes stay valid.
+    """
+    delta = delta[[col for col in base.columns if col in delta.columns]].copy()
+    base_columns = {}
+    for col in base.columns:
+        if col not in delta.columns:
+            continue
+        if isinstance(base[col].dtype, pd.CategoricalDtype):
+            categories = base[col].cat.categories
+            new = pd.Index(pd.unique(delta[col].dropna().astype(categories.dtype)))
+            new = new[~new.isin(categories)]
+            if len(new):
+                base_columns[col] = base[col].cat.add_categories(new)
+                categories = base_columns[col].cat.categories
+            delta[col] = pd.Categorical(delta[col], categories=categories)
+        elif delta[col].dtype != base[col].dtype:
+            try:
+                delta[col] = delta[col].astype(base[col].dtype)
+            except (TypeError, ValueError):
+                pass
+
+    if base_columns:
+        base = base.assign(**base_columns)
+    return pd.concat([base, delta], ignore_index=True)
+
+def _stream_position(file_stream):
+    try:
+        return file_stream.tell()
+    except Exception:
+        return None
+
+def _stream_size(file_stream):
+    try:
+        pos = file_stream.tell()
+        file_stream.seek(0, 2)
+        size = file_stream.tell()
+        file_stream.seek(pos)
+        return size
+    except Exception:
+        return None
+
+def load_and_preprocess_data_chunked(file_stream, chunksize=CHUNK_SIZE, progress_callback=None):
+    """
+    Streams the CSV in chunks, preprocessing each chunk and appending it to a compact store. Only the columns
+    of the compact layout are parsed and kept, so free text (addresses, raw date strings) never accumulates.
+    progress_callback(rows_read, rows_kept, fraction) is called after every chunk (fraction may be None).
+    """
+    total_bytes = _stream_size(file_stream)
+    date_parser = DateParser()
+    chunks = []
+    rows_read = 0
+    rows_kept = 0
+    categorical = None
+    # Footprint of the kept columns before any categorical conversion (reported by compact_dataframe)
+    raw_memory_mb = 0.0
+
+    try:
+        reader = pd.read_csv(file_stream, encoding='utf-8', chunksize=chunksize, usecols=_is_read_column)
+        for raw in reader:
+            rows_read += len(raw)
+            chunk = _trim_frame(_preprocess_frame(raw, date_parser))
+            del raw
+            if categorical is None:
+                categorical = _categorical_columns(chunk)
+            raw_memory_mb += _sampled_memory_mb(chunk)
+            chunk = _compact_chunk(chunk, categorical)
+            rows_kept += len(chunk)
+            chunks.append(chunk)
+
+            if progress_callback:
+                pos = _stream_position(file_stream)
+                fraction = min(pos / total_bytes, 1.0) if pos is not None and total_bytes else None
+                progress_callback(rows_read, rows_kept, fraction)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error reading CSV: {e}")
+
+    df = _concat_chunks(chunks)
+    df.attrs['raw_memory_mb'] = round(float(raw_memory_mb), 2)
+    if progress_callback:
+        progress_callback(rows_read, rows_kept, 1.0)
+    return df
+
+# Compact layout: columns the API reads and the dtype each one is stored as
+COMPACT_DTYPES = {
+    'DR_NO': 'int64',
+    'AREA': 'int8',
+    'AREA NAME': 'category',
+    'Crm Cd': 'int16',
+    'Crm Cd Desc': 'category',
+    'Severity': 'category',
+    'TIME OCC': 'category',
+    'LAT': 'float32',
+    'LON': 'float32',
+    'datetime_occ': None,  # kept as datetime64
+    'hour': 'int8',
+    'month': 'int8',
+    'day_of_week': 'category',
+}
+
+def memory_usage_mb(df):
+    """Deep memory footprint of a frame in MB."""
+    return round(df.memory_usage(deep=True).sum() / 1024 ** 2, 2)
+
+def compact_dataframe(df):
+    """
+    Final ingestion step: drops columns the API never reads and stores the rest in compact dtypes.
+    Returns the compacted frame and a before/after memory report; "before" is the footprint of the kept columns
+    as plain strings (measured during chunked ingestion, which already stores some columns as categoricals).
+    """
+    before = df.attrs.get('raw_memory_mb') or memory_usage_mb(df)
+
+    keep = [col for col in COMPACT_DTYPES if col in df.columns]
+    df = df[keep].copy()
+
+    for col in keep:
+        dtype = COMPACT_DTYPES[col]
+        if dtype is None or str(df[col].dtype) == dtype:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype('category')
+        elif pd.api.types.is_numeric_dtype(df[col]) and not df[col].isna().any():
+            # Only downcast when the values survive the round trip (e.g. unexpected codes stay int64)
+            converted = df[col].astype(dtype)
+            if dtype.startswith('float') or (converted == df[col]).all():
+                df[col] = converted
+
+    after = memory_usage_mb(df)
+    ratio = round(before / after, 1) if after else None
+    print(f"🗜️ Compacted frame: {before} MB -> {after} MB ({ratio}x)")
+    return df, {"before_mb": before, "after_mb": after, "ratio": ratio}
+
+# Severity rule table: first matching rule wins, crime-code matches take precedence over keywords.
+# Override with a JSON file of the same shape via SEVERITY_RULES_PATH.
+SEVERITY_RULES = [
+    # High Severity: Violent crimes or crimes involving weapons
+    {"level": "High", "keywords": ['HOMICIDE', 'ROBBERY', 'ASSAULT', 'WEAPON', 'RAPE', 'KIDNAPPING'], "codes": []},
+    # Medium Severity: Property crimes, major theft
+    {"level": "Medium", "keywords": ['BURGLARY', 'THEFT', 'VEHICLE STOLEN', 'VANDALISM'], "codes": []},
+]
+# Low Severity: Minor offenses
+DEFAULT_SEVERITY = 'Low'
+
+def load_severity_rules(path=None):
+    """Loads the severity rule table from JSON, falling back to the built-in rules."""
+    path = path or os.getenv("SEVERITY_RULES_PATH")
+    if not path:
+        return SEVERITY_RULES
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        return [
+            {"level": r["level"],
+             "keywords": [str(k).upper() for k in r.get("keywords", [])],
+             "codes": [int(c) for c in r.get("codes", [])]}
+            for r in rules
+        ]
+    except Exception as e:
+        print(f"❌ Severity Rules Error ({path}): {e}. Using built-in rules.")
+        return SEVERITY_RULES
+
+def pipeline_fingerprint():
+    """Identifies the preprocessing pipeline: its version plus the active severity rule table."""
+    rules = json.dumps(load_severity_rules(), sort_keys=True)
+    return f"pipeline-v{PIPELINE_VERSION}:{hashlib.sha256(rules.encode('utf-8')).hexdigest()[:16]}"
+
+def _severity_levels(rules):
+    levels = []
+    for rule in rules:
+        if rule["level"] not in levels:
+            levels.append(rule["level"])
+    if DEFAULT_SEVERITY not in levels:
+        levels.append(DEFAULT_SEVERITY)
+    return levels
+
+def _level_for_description(crime_desc, rules):
+    crime_desc = str(crime_desc).upper()
+    for rule in rules:
+        if any(word in crime_desc for word in rule["keywords"]):
+            return rule["level"]
+    return DEFAULT_SEVERITY
+
+def classify_severity(df, rules=None):
+    """
+    Tags crimes with a severity level.
+    Each distinct 'Crm Cd Desc' (and 'Crm Cd') is classified once and broadcast back through category codes.
+    """
+    rules = rules or load_severity_rules()
+    levels = _severity_levels(rules)
+    level_index = {level: i for i, level in enumerate(levels)}
+    default_code = level_index[DEFAULT_SEVERITY]
+
+    # 1. Keyword rules, evaluated once per unique description
+    desc = df['Crm Cd Desc']
+    if not isinstance(desc.dtype, pd.CategoricalDtype):
+        desc = desc.astype('category')
+    desc_levels = np.array(
+        [level_index[_level_for_description(d, rules)] for d in desc.cat.categories] + [default_code],
+        dtype=np.int8
+    )
+    # Missing descriptions have code -1, which indexes the trailing default entry
+    codes = desc_levels[desc.cat.codes.to_numpy()]
+
+    # 2. Crime-code rules, evaluated once per unique code
+    code_rules = {}
+    for rule in rules:
+        for crime_code in rule.get("codes", []):
+            code_rules.setdefault(int(crime_code), level_index[rule["level"]])
+    if code_rules and 'Crm Cd' in df.columns:
+        crm_cd = pd.to_numeric(df['Crm Cd'], errors='coerce')
+        uniques, inverse = np.unique(crm_cd.fillna(-1).to_numpy(dtype=np.int64), return_inverse=True)
+        code_levels = np.array([code_rules.get(int(u), -1) for u in uniques], dtype=np.int8)[inverse]
+        codes = np.where(code_levels >= 0, code_levels, codes)
+
+    df['Severity'] = pd.Categorical.from_codes(codes, categories=levels)
+    return df
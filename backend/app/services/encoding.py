@@ -0,0 +1,76 @@
+import json
+import struct
+import numpy as np
+from fastapi.responses import Response
+
+# Binary response formats for large geo payloads (JSON stays the default)
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Simple typed-array format: u32 header length, JSON header, then 8-byte aligned little-endian column buffers
+COLUMNS_MEDIA_TYPE = "application/x-crimelens-columns"
+BINARY_MEDIA_TYPES = (ARROW_MEDIA_TYPE, COLUMNS_MEDIA_TYPE)
+# Category codes are sent as uint8; this value marks a missing category. Columns with more categories than
+# fit are sent as uint16, with the uint16 maximum as the missing marker.
+UNKNOWN_CODE = 255
+
+def negotiate(accept):
+    """Returns the binary media type the client asked for in its Accept header, or None for JSON."""
+    if not accept:
+        return None
+    for part in accept.split(','):
+        media_type = part.split(';')[0].strip().lower()
+        if media_type in BINARY_MEDIA_TYPES:
+            return media_type
+    return None
+
+def category_codes(series):
+    """uint8 codes of a categorical column, UNKNOWN_CODE where the value is missing (uint16 for many categories)."""
+    codes = series.cat.codes.to_numpy()
+    dtype = np.uint8 if len(series.cat.categories) < UNKNOWN_CODE else np.uint16
+    return np.where(codes >= 0, codes, np.iinfo(dtype).max).astype(dtype)
+
+def decode_codes(codes, labels):
+    """Labels for category codes (None for the missing marker), for JSON responses."""
+    codes = np.asarray(codes)
+    unknown = np.iinfo(codes.dtype).max if codes.dtype.kind == 'u' else UNKNOWN_CODE
+    return [labels[c] if c != unknown else None for c in codes.tolist()]
+
+def _encode_typed_arrays(columns, meta):
+    header = {"columns": [], "meta": meta or {}}
+    buffers = []
+    offset = 0
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        buffer = values.astype(values.dtype.newbyteorder('<'), copy=False).tobytes()
+        header["columns"].append({"name": name, "dtype": values.dtype.name, "length": int(len(values)), "offset": offset})
+        padding = (-len(buffer)) % 8
+        buffers.append(buffer + b"\0" * padding)
+        offset += len(buffer) + padding
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b" " * ((-(len(header_bytes) + 4)) % 8)
+    return struct.pack('<I', len(header_bytes)) + header_bytes + b"".join(buffers)
+
+def _encode_arrow(columns, meta):
+    import pyarrow as pa
+
+    # One row whose cells are whole columns, so columns of different lengths share one record batch
+    arrays = {
+        name: pa.ListArray.from_arrays(pa.array([0, len(values)], type=pa.int32()), pa.array(np.ascontiguousarray(values)))
+        for name, values in columns.items()
+    }
+    table = pa.table(arrays).replace_schema_metadata({"meta": json.dumps(meta or {})})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def columns_response(columns, media_type, meta=None):
+    """
+    Encodes named 1-D NumPy columns straight from their buffers, without a Python-object round trip.
+    Categorical values are sent as small integer codes with their labels in `meta`.
+    """
+    if media_type == ARROW_MEDIA_TYPE:
+        content = _encode_arrow(columns, meta)
+    else:
+        content = _encode_typed_arrays(columns, meta)
+    return Response(content=content, media_type=media_type)
@@ -0,0 +1,241 @@
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+# Fitted forecasts are cached by a hash of the monthly series + horizon + method, in memory and as JSON files on disk
+FORECAST_CACHE_DIR = os.getenv("FORECAST_CACHE_DIR", os.path.join("cache", "forecasts"))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", 512))
+FORECAST_HORIZON = 12
+# Default forecasting backend: "fast" (Holt-Winters, NumPy) or "prophet"
+FORECAST_METHOD = os.getenv("FORECAST_METHOD", "prophet")
+FORECAST_METHODS = ("fast", "prophet")
+SEASON_LENGTH = 12
+# Central interval width of yhat_lower / yhat_upper (Prophet's default is 80%)
+INTERVAL_Z = 1.2816
+# Holt-Winters smoothing parameters are chosen by grid search over these values
+_ALPHAS = (0.1, 0.2, 0.35, 0.5, 0.7, 0.9)
+_BETAS = (0.0, 0.05, 0.1, 0.2, 0.4)
+_GAMMAS = (0.0, 0.1, 0.2, 0.4, 0.6)
+# Worker processes for batch forecasts (one model fit per group)
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+
+def monthly_series(df):
+    """Month-end incident counts (ds, y) of a frame, resampled once."""
+    series = df.set_index('datetime_occ').resample('ME').size().reset_index(name='count')
+    series.columns = ['ds', 'y']
+    return series
+
+def series_hash(series, periods, method='prophet'):
+    digest = hashlib.sha256()
+    digest.update(f"{method}:{periods}:".encode('utf-8'))
+    digest.update(pd.to_datetime(series['ds']).to_numpy().astype('datetime64[D]').astype(np.int64).tobytes())
+    digest.update(np.asarray(series['y'], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def fit_prophet(series, periods):
+    # Imported on first use: Prophet is slow to import and only needed by this backend
+    from prophet import Prophet
+
+    m = Prophet()
+    m.fit(series)
+    future = m.make_future_dataframe(periods=periods, freq='ME')
+    return m.predict(future)[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+def _holt_winters(y, season_length, alphas, betas, gammas):
+    """
+    Additive Holt-Winters run for many parameter sets at once (arrays of shape [K]); the loop is over time only.
+    Returns one-step fitted values [K, n] and the final level, trend and seasonal states.
+    """
+    n = len(y)
+    if season_length > 1:
+        first, second = y[:season_length], y[season_length:2 * season_length]
+        level0 = first.mean()
+        trend0 = (second.mean() - first.mean()) / season_length
+        season0 = first - level0
+    else:
+        level0, trend0, season0 = y[0], (y[-1] - y[0]) / max(n - 1, 1), np.zeros(1)
+
+    k = len(alphas)
+    level = np.full(k, level0)
+    trend = np.full(k, trend0)
+    season = np.tile(season0, (k, 1))
+    fitted = np.empty((k, n))
+    for t in range(n):
+        slot = t % season_length
+        s = season[:, slot]
+        fitted[:, t] = level + trend + s
+        new_level = alphas * (y[t] - s) + (1 - alphas) * (level + trend)
+        trend = betas * (new_level - level) + (1 - betas) * trend
+        season[:, slot] = gammas * (y[t] - new_level) + (1 - gammas) * s
+        level = new_level
+    return fitted, level, trend, season
+
+def fit_fast(series, periods, season_length=SEASON_LENGTH):
+    """
+    Additive Holt-Winters forecast (seasonal when the series covers two full seasons, Holt's linear trend
+    otherwise) with grid-searched smoothing parameters and ETS(A,A,A) prediction intervals.
+    Returns the same ds/yhat/yhat_lower/yhat_upper frame as the Prophet backend, counts clipped at 0.
+    """
+    y = np.asarray(series['y'], dtype=np.float64)
+    n = len(y)
+    m = season_length if n >= 2 * season_length else 1
+    grid = np.array(np.meshgrid(_ALPHAS, _BETAS, _GAMMAS if m > 1 else (0.0,), indexing='ij')).reshape(3, -1)
+    alphas, betas, gammas = grid
+
+    fitted, level, trend, season = _holt_winters(y, m, alphas, betas, gammas)
+    sse = ((fitted - y) ** 2).sum(axis=1)
+    best = int(np.argmin(sse))
+    alpha, beta, gamma = alphas[best], betas[best], gammas[best]
+    sigma = np.sqrt(sse[best] / max(n - 1, 1))
+
+    h = np.arange(1, periods + 1)
+    future = level[best] + h * trend[best] + season[best, (n + h - 1) % m]
+    # Variance of the h-step error for additive Holt-Winters (Hyndman et al., ETS class 1)
+    j = np.arange(1, periods)
+    c = alpha * (1 + j * beta) + gamma * ((j % m) == 0) * (m > 1)
+    steps = sigma * np.sqrt(1 + np.concatenate([[0.0], np.cumsum(c ** 2)]))
+
+    yhat = np.concatenate([fitted[best], future])
+    spread = np.concatenate([np.full(n, sigma), steps]) * INTERVAL_Z
+    history = pd.to_datetime(series['ds'])
+    future_ds = pd.date_range(history.iloc[-1], periods=periods + 1, freq='ME')[1:]
+    return pd.DataFrame({
+        'ds': history.tolist() + list(future_ds),
+        'yhat': np.clip(yhat, 0, None),
+        'yhat_lower': np.clip(yhat - spread, 0, None),
+        'yhat_upper': np.clip(yhat + spread, 0, None),
+    })
+
+FORECASTERS = {"fast": fit_fast, "prophet": fit_prophet}
+
+def _records(forecast):
+    forecast = forecast.assign(ds=pd.to_datetime(forecast['ds']).dt.strftime('%Y-%m-%dT%H:%M:%S'))
+    return forecast.to_dict(orient='records')
+
+class ForecastCache:
+    """
+    Forecast records keyed by series hash: an in-memory LRU in front of one JSON file per forecast,
+    so fitted forecasts survive restarts.
+    """
+    def __init__(self, cache_dir=FORECAST_CACHE_DIR, max_entries=FORECAST_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key, records):
+        with self._lock:
+            self._entries[key] = records
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except Exception as e:
+            print(f"❌ Forecast Cache Read Error: {e}")
+            return None
+        self._remember(key, records)
+        return records
+
+    def put(self, key, records):
+        self._remember(key, records)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            print(f"❌ Forecast Cache Write Error: {e}")
+
+forecast_cache = ForecastCache()
+
+def forecast_series(series, periods=FORECAST_HORIZON, method=None):
+    """
+    Forecast records (ds, yhat, yhat_lower, yhat_upper) for a monthly (ds, y) series, or None when the
+    series is too short. `method` picks the backend ("fast" or "prophet", default FORECAST_METHOD).
+    Identical series + horizon + method are fitted only once.
+    """
+    method = method or FORECAST_METHOD
+    if method not in FORECASTERS:
+        raise ValueError(f"Unknown forecast method '{method}'. Use one of: {', '.join(FORECAST_METHODS)}.")
+    if len(series) < 3:
+        return None
+    key = series_hash(series, periods, method)
+    records = forecast_cache.get(key)
+    if records is None:
+        records = _records(FORECASTERS[method](series, periods))
+        forecast_cache.put(key, records)
+    return records
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _forecast_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned (not forked) workers: the server process holds threads and locks a fork would copy
+            _pool = ProcessPoolExecutor(max_workers=max(FORECAST_WORKERS, 1), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _fit_records(ds, y, periods, method):
+    return _records(FORECASTERS[method](pd.DataFrame({'ds': pd.to_datetime(ds), 'y': y}), periods))
+
+def forecast_batch(groups, periods=FORECAST_HORIZON, method=None):
+    """
+    Forecasts many (label, series) groups, yielding (label, series, records or None, error or None) as each
+    group finishes. Cached forecasts are yielded first; the remaining Prophet fits run across the worker pool
+    (fast fits cost less than a round trip to a worker and run inline).
+    """
+    method = method or FORECAST_METHOD
+    if method not in FORECASTERS:
+        raise ValueError(f"Unknown forecast method '{method}'. Use one of: {', '.join(FORECAST_METHODS)}.")
+    ready, pending = [], {}
+    for label, series in groups:
+        if len(series) < 3:
+            ready.append((label, series, None, None))
+            continue
+        if method == "fast":
+            ready.append((label, series, forecast_series(series, periods, method), None))
+            continue
+        key = series_hash(series, periods, method)
+        records = forecast_cache.get(key)
+        if records is not None:
+            ready.append((label, series, records, None))
+            continue
+        future = _forecast_pool().submit(_fit_records, series['ds'].to_numpy(), series['y'].to_numpy(), periods, method)
+        pending[future] = (label, series, key)
+
+    # Every fit is submitted before anything is yielded, so a slow consumer does not delay the pool
+    yield from ready
+
+    for future in as_completed(pending):
+        label, series, key = pending[future]
+        try:
+            records = future.result()
+        except Exception as e:
+            print(f"❌ Batch Forecast Error ({label}): {e}")
+            yield label, series, None, str(e)
+            continue
+        forecast_cache.put(key, records)
+        yield label, series, records, None
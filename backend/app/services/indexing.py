@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# FilterPayload field -> column it filters on
+FILTER_COLUMNS = {
+    'areas': 'AREA NAME',
+    'crimes': 'Crm Cd Desc',
+    'severities': 'Severity',
+}
+
+class _ColumnIndex:
+    """Category codes of one column plus, for every category, the sorted row positions holding it."""
+    def __init__(self, codes, categories, postings):
+        self.codes = codes
+        self.lookup = {value: i for i, value in enumerate(categories)}
+        self.postings = postings
+
+def _build_column(series):
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    codes = series.cat.codes.to_numpy()
+    n_categories = len(series.cat.categories)
+
+    # Stable sort keeps the positions inside each posting list in ascending order
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes.astype(np.int64) + 1, minlength=n_categories + 1)
+    postings = np.split(order, np.cumsum(counts)[:-1])[1:]  # first split holds missing values (code -1)
+    return _ColumnIndex(codes, series.cat.categories, postings)
+
+def _extend_column(column, series, start):
+    codes = series.cat.codes.to_numpy()
+    categories = series.cat.categories
+    postings = list(column.postings) + [np.empty(0, dtype=np.int64)] * (len(categories) - len(column.postings))
+
+    new_codes = codes[start:]
+    for code in np.unique(new_codes[new_codes >= 0]):
+        positions = np.flatnonzero(new_codes == code) + start
+        postings[code] = np.concatenate([postings[code], positions])
+    return _ColumnIndex(codes, categories, postings)
+
+class FilterIndex:
+    """
+    Inverted index over the filterable columns of a dataset, built once per dataset version.
+    A filter resolves to row positions instead of copy-then-isin scans over the frame.
+    """
+    def __init__(self, df=None):
+        self.n_rows = 0
+        self.columns = {}
+        if df is not None:
+            self.n_rows = len(df)
+            for key, col in FILTER_COLUMNS.items():
+                if col in df.columns:
+                    self.columns[key] = _build_column(df[col])
+
+    def extended(self, df, start):
+        """Returns a new index covering df, indexing only the rows appended from position `start`."""
+        if any(not isinstance(df[FILTER_COLUMNS[key]].dtype, pd.CategoricalDtype) for key in self.columns):
+            return FilterIndex(df)
+        index = FilterIndex()
+        index.n_rows = len(df)
+        index.columns = {key: _extend_column(column, df[FILTER_COLUMNS[key]], start) for key, column in self.columns.items()}
+        return index
+
+    def rows(self, filters):
+        """Sorted row positions matching the filters, or None when no filter is set."""
+        selections = []
+        for key, column in self.columns.items():
+            values = getattr(filters, key, None) or []
+            if not values:
+                continue
+            codes = [column.lookup[v] for v in set(values) if v in column.lookup]
+            if not codes:
+                return np.empty(0, dtype=np.int64)
+            selections.append((sum(len(column.postings[c]) for c in codes), column, codes))
+
+        if not selections:
+            return None
+
+        # Union the smallest selection's posting lists, then check the remaining columns by code
+        selections.sort(key=lambda s: s[0])
+        _, column, codes = selections[0]
+        if len(codes) == 1:
+            rows = column.postings[codes[0]]
+        else:
+            rows = np.sort(np.concatenate([column.postings[c] for c in codes]))
+        for _, other, other_codes in selections[1:]:
+            rows = rows[np.isin(other.codes[rows], other_codes)]
+        return rows
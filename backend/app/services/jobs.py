@@ -0,0 +1,185 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for heavy analytics: at most JOB_WORKERS run at once, each in its own worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Finished jobs (and their results) are kept this long for polling and deduplication
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 3600))
+JOB_POLL_SECONDS = 0.2
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+def _run_job(conn, fn, args, kwargs, reports_progress):
+    """Worker process entry point: runs fn and sends progress / result / error messages back over conn."""
+    def progress(fraction, message=None):
+        conn.send(("progress", float(fraction), message))
+
+    try:
+        if reports_progress:
+            kwargs = {**kwargs, "progress": progress}
+        conn.send(("result", fn(*args, **kwargs)))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+class Job:
+    """State of one submitted job. `revision` increases on every change so watchers can wait for updates."""
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.revision = 0
+        self.cancel_requested = False
+        self.future = None
+
+    def snapshot(self, include_result=True):
+        state = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if include_result and self.status == "done":
+            state["result"] = self.result
+        return state
+
+class JobManager:
+    """
+    Runs submitted functions in worker processes (bounded by JOB_WORKERS), with progress reporting,
+    cancellation (queued jobs are dropped, running ones terminated) and deduplication: submitting a job
+    whose key matches a queued, running or finished job returns that job instead.
+    """
+    def __init__(self, workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="job")
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = {}
+        self._by_key = {}
+        self._changed = threading.Condition()
+
+    def submit(self, kind, key, fn, args=(), kwargs=None, on_done=None, reports_progress=False):
+        """
+        Queues fn(*args, **kwargs) (fn must be importable by worker processes) and returns (job, deduplicated).
+        on_done(result) runs in the server process and its return value becomes the job result.
+        """
+        with self._changed:
+            self._prune()
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status not in ("failed", "cancelled"):
+                return existing, True
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+        job.future = self._executor.submit(self._supervise, job, fn, args, kwargs or {}, on_done, reports_progress)
+        return job, False
+
+    def get(self, job_id):
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._changed:
+            return [job.snapshot(include_result=False) for job in self._jobs.values()]
+
+    def cancel(self, job_id):
+        """Requests cancellation. Returns the job, or None if it does not exist."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return job
+            job.cancel_requested = True
+        if job.future is not None and job.future.cancel():
+            self._update(job, status="cancelled", finished_at=time.time())
+        return job
+
+    def wait(self, job, revision, timeout):
+        """Blocks until the job changes past `revision` (or timeout) and returns its snapshot."""
+        with self._changed:
+            self._changed.wait_for(lambda: job.revision > revision, timeout=timeout)
+            return job.revision, job.snapshot()
+
+    def _update(self, job, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.revision += 1
+            self._changed.notify_all()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+
+    def _supervise(self, job, fn, args, kwargs, on_done, reports_progress):
+        if job.cancel_requested:
+            self._update(job, status="cancelled", finished_at=time.time())
+            return
+
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_run_job, args=(sender, fn, args, kwargs, reports_progress), daemon=True)
+        try:
+            process.start()
+        except Exception as e:
+            self._update(job, status="failed", error=f"Could not start worker: {e}", finished_at=time.time())
+            return
+        sender.close()
+        self._update(job, status="running")
+        print(f"⏳ Job {job.id} ({job.kind}) started")
+
+        try:
+            while True:
+                if job.cancel_requested:
+                    process.terminate()
+                    self._update(job, status="cancelled", finished_at=time.time())
+                    print(f"🛑 Job {job.id} cancelled")
+                    return
+                if not receiver.poll(JOB_POLL_SECONDS):
+                    if not process.is_alive() and not receiver.poll():
+                        self._update(job, status="failed", error=f"Worker exited with code {process.exitcode}", finished_at=time.time())
+                        return
+                    continue
+                try:
+                    message = receiver.recv()
+                except EOFError:
+                    # The worker closed its end without a result: it died (killed, out of memory, ...)
+                    process.join(timeout=5)
+                    self._update(job, status="failed", error=f"Worker exited with code {process.exitcode}", finished_at=time.time())
+                    return
+
+                if message[0] == "progress":
+                    self._update(job, progress=min(max(message[1], 0.0), 1.0), message=message[2])
+                elif message[0] == "error":
+                    self._update(job, status="failed", error=message[1], finished_at=time.time())
+                    print(f"❌ Job {job.id} failed: {message[1]}")
+                    return
+                else:
+                    result = on_done(message[1]) if on_done else message[1]
+                    self._update(job, status="done", progress=1.0, result=result, finished_at=time.time())
+                    print(f"✅ Job {job.id} ({job.kind}) done")
+                    return
+        except Exception as e:
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            receiver.close()
+            process.join(timeout=5)
+
+jobs = JobManager()
@@ -0,0 +1,335 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+from app.services.data_processing import memory_usage_mb, append_frames
+from app.services.storage import has_snapshot, save_snapshot, load_snapshot, remove_snapshot, read_index, write_index
+from app.services.cache import estimate_size
+
+# RAM budget for datasets held in memory, derived structures (indexes, aggregates) included.
+# Least-recently-used datasets fall back to their disk snapshot.
+DATASET_MEMORY_BUDGET_MB = float(os.getenv("DATASET_MEMORY_BUDGET_MB", 2048))
+# Appended deltas are snapshotted as separate parts next to the base snapshot; at this many parts they are
+# merged into one snapshot in the background
+SNAPSHOT_MAX_PARTS = int(os.getenv("SNAPSHOT_MAX_PARTS", 32))
+
+def dataset_id_for(key):
+    """Short dataset id derived from the upload's content hash."""
+    return key[:12]
+
+class Dataset:
+    """Request-scoped handle on a registered dataset: its id, version and frame."""
+    def __init__(self, registry, dataset_id, version, df):
+        self._registry = registry
+        self.id = dataset_id
+        self.version = version
+        self.df = df
+
+    def derived(self, name, build):
+        """Returns a structure derived from this dataset (filter index, aggregates, ...), building it once per version."""
+        return self._registry.derived(self, name, build)
+
+class DatasetRegistry:
+    """
+    Holds every uploaded dataset by id. Frames stay in memory in LRU order and are evicted
+    to their Parquet snapshot when the total footprint exceeds the memory budget.
+    A dataset's id is that of its original upload and survives appends: re-uploading the original file
+    returns the dataset with every delta appended since, not the file's own rows.
+    """
+    def __init__(self, budget_mb=DATASET_MEMORY_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self._frames = OrderedDict()
+        self._index = None
+        self._lock = threading.RLock()
+        self._listeners = []
+        # dataset_id -> {name: (version, structure)}
+        self._derived = {}
+        # (dataset_id, name, version) -> lock held while that structure is built
+        self._building = {}
+        # dataset_id -> lock serializing appends to that dataset
+        self._append_locks = {}
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = read_index()
+        return self._index
+
+    def resolve(self, dataset_id=None):
+        """Returns a known dataset id (the most recent upload when none is given) or raises KeyError."""
+        with self._lock:
+            dataset_id = dataset_id or self.index["default"]
+            if not dataset_id or dataset_id not in self.index["datasets"]:
+                raise KeyError(dataset_id)
+            return dataset_id
+
+    def get(self, dataset_id=None):
+        """Returns the frame for a dataset, reloading it from its snapshot if it was evicted."""
+        with self._lock:
+            dataset_id = self.resolve(dataset_id)
+            if dataset_id in self._frames:
+                self._frames.move_to_end(dataset_id)
+                return self._frames[dataset_id]
+
+            df = self._load_frame(self.index["datasets"][dataset_id])
+            if df is None:
+                raise KeyError(dataset_id)
+            self._frames[dataset_id] = df
+            self._enforce_budget(keep=dataset_id)
+            return df
+
+    def get_dataset(self, dataset_id=None):
+        """Returns a Dataset handle (id, version, frame) for the given or default dataset."""
+        with self._lock:
+            df = self.get(dataset_id)
+            dataset_id = self.resolve(dataset_id)
+            return Dataset(self, dataset_id, self.index["datasets"][dataset_id].get("version", 1), df)
+
+    def derived(self, dataset, name, build):
+        """
+        Returns the structure `name` built by build(df) for the dataset's current version.
+        The build runs outside the registry lock: concurrent callers for the same structure wait for one build,
+        everything else proceeds. Handles from an older version (a request that raced an append) get a transient build.
+        """
+        build_key = (dataset.id, name, dataset.version)
+        with self._lock:
+            entry = self._derived.get(dataset.id, {}).get(name)
+            if entry and entry[0] == dataset.version:
+                return entry[1]
+            build_lock = self._building.setdefault(build_key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                entry = self._derived.get(dataset.id, {}).get(name)
+                if entry and entry[0] == dataset.version:
+                    return entry[1]
+            try:
+                structure = build(dataset.df)
+                with self._lock:
+                    current = self.index["datasets"].get(dataset.id, {}).get("version")
+                    if current == dataset.version and dataset.id in self._frames:
+                        self._derived.setdefault(dataset.id, {})[name] = (dataset.version, structure)
+                        self._enforce_budget(keep=dataset.id)
+            finally:
+                with self._lock:
+                    if self._building.get(build_key) is build_lock:
+                        del self._building[build_key]
+            return structure
+
+    def meta(self, dataset_id=None):
+        with self._lock:
+            return dict(self.index["datasets"][self.resolve(dataset_id)])
+
+    def lookup(self, key):
+        """
+        Returns (dataset_id, frame) for an already-known upload hash and makes it the default, else (None, None).
+        The frame is the dataset's current version, deltas appended since the upload included.
+        """
+        with self._lock:
+            dataset_id = dataset_id_for(key)
+            if dataset_id not in self.index["datasets"]:
+                return None, None
+            df = self.get(dataset_id)
+            self._set_default(dataset_id)
+            return dataset_id, df
+
+    def register(self, df, key, **meta):
+        """Adds a dataset (snapshotting it if needed), makes it the default and enforces the budget."""
+        dataset_id = dataset_id_for(key)
+        # The Parquet write and the deep size estimate can take seconds: both run before taking the registry lock
+        if not has_snapshot(key):
+            save_snapshot(df, key)
+        memory_mb = memory_usage_mb(df)
+
+        with self._lock:
+            previous = self.index["datasets"].get(dataset_id, {})
+            self.index["datasets"][dataset_id] = {
+                **meta,
+                "key": key,
+                "rows": len(df),
+                "memory_mb": memory_mb,
+                "version": previous.get("version", 0) + 1,
+            }
+            self._frames[dataset_id] = df
+            self._frames.move_to_end(dataset_id)
+            self._derived.pop(dataset_id, None)
+            self._set_default(dataset_id)
+            self._notify("register", dataset_id, df, None)
+            self._enforce_budget(keep=dataset_id)
+            return dataset_id
+
+    def append(self, dataset_id, delta, delta_key, key_column='DR_NO'):
+        """
+        Appends preprocessed rows to a dataset, skipping records whose key_column is already present
+        (key_column=None appends without deduplication). Appends to one dataset are serialized. Only the new
+        rows are snapshotted, as a part listed next to the base snapshot; once that part is written the index
+        lists it, the version bumps and listeners get notified with the delta. Raises ValueError when
+        key_column is missing from either frame.
+        """
+        dataset_id = self.resolve(dataset_id)
+        with self._lock:
+            append_lock = self._append_lock(dataset_id)
+
+        with append_lock:
+            with self._lock:
+                base = self.get(dataset_id)
+                meta = self.index["datasets"][dataset_id]
+                previous_key, previous_parts = meta["key"], list(meta.get("parts", []))
+            received = len(delta)
+
+            if key_column:
+                for name, frame in (("dataset", base), ("delta", delta)):
+                    if key_column not in frame.columns:
+                        raise ValueError(f"Key column '{key_column}' is missing from the {name}; pass an empty key_column to append without deduplication.")
+                delta = delta.drop_duplicates(subset=key_column)
+                delta = delta[~delta[key_column].isin(base[key_column])]
+
+            if len(delta) == 0:
+                return {"dataset_id": dataset_id, "appended": 0, "duplicates": received, **self.meta(dataset_id)}
+
+            # Build the new frame and snapshot the delta outside the registry lock; readers keep the current version meanwhile
+            df = append_frames(base, delta)
+            memory_mb = memory_usage_mb(df)
+            state = previous_parts[-1] if previous_parts else previous_key
+            part_key = hashlib.sha256(f"{state}:{delta_key}".encode('utf-8')).hexdigest()
+            if not has_snapshot(part_key) and not save_snapshot(delta, part_key):
+                raise ValueError("Could not write the delta snapshot; the append was not applied.")
+
+            with self._lock:
+                meta = self.index["datasets"].get(dataset_id)
+                if meta is None or meta["key"] != previous_key or meta.get("parts", []) != previous_parts:
+                    # Replaced by a re-upload while the snapshot was written
+                    remove_snapshot(part_key)
+                    raise ValueError(f"Dataset {dataset_id} changed during the append; retry it.")
+                meta.update({
+                    "parts": previous_parts + [part_key],
+                    "appends": meta.get("appends", 0) + 1,
+                    "rows": len(df),
+                    "memory_mb": memory_mb,
+                    "version": meta.get("version", 0) + 1,
+                })
+                write_index(self.index)
+                self._frames[dataset_id] = df
+                self._frames.move_to_end(dataset_id)
+                self._extend_derived(dataset_id, df, len(base), meta["version"])
+                self._notify("append", dataset_id, df, delta)
+                self._enforce_budget(keep=dataset_id)
+                result = {"dataset_id": dataset_id, "appended": len(delta), "duplicates": received - len(delta), **meta}
+
+        if len(result["parts"]) >= SNAPSHOT_MAX_PARTS:
+            threading.Thread(target=self.merge_parts, args=(dataset_id,), daemon=True).start()
+        return result
+
+    def merge_parts(self, dataset_id):
+        """
+        Rewrites a dataset's base snapshot and appended parts as one snapshot, so reloads read a single file.
+        Runs under the dataset's append lock; the index switches to the merged snapshot once it is written.
+        """
+        with self._lock:
+            append_lock = self._append_lock(dataset_id)
+
+        with append_lock:
+            with self._lock:
+                meta = self.index["datasets"].get(dataset_id)
+                if meta is None or not meta.get("parts"):
+                    return False
+                df = self.get(dataset_id)
+                previous_key, parts = meta["key"], list(meta["parts"])
+
+            key = hashlib.sha256(f"{parts[-1]}:merged".encode('utf-8')).hexdigest()
+            if not has_snapshot(key) and not save_snapshot(df, key):
+                return False
+
+            with self._lock:
+                meta = self.index["datasets"].get(dataset_id)
+                if meta is None or meta["key"] != previous_key or meta.get("parts") != parts:
+                    remove_snapshot(key)
+                    return False
+                meta.update({"key": key, "parts": []})
+                write_index(self.index)
+
+        for stale in [previous_key] + parts:
+            remove_snapshot(stale)
+        print(f"🗂️ Merged {len(parts)} appended parts of dataset {dataset_id} into one snapshot")
+        return True
+
+    def subscribe(self, callback):
+        """
+        Registers callback(event, dataset_id, df, delta) for derived structures
+        (indexes, aggregates, caches). event is "register" or "append"; delta is None on register.
+        """
+        self._listeners.append(callback)
+
+    def list(self):
+        with self._lock:
+            return [
+                {"id": dataset_id, **meta, "in_memory": dataset_id in self._frames, "derived_mb": self._derived_mb(dataset_id),
+                 "default": dataset_id == self.index["default"]}
+                for dataset_id, meta in self.index["datasets"].items()
+            ]
+
+    def _notify(self, event, dataset_id, df, delta):
+        for callback in self._listeners:
+            try:
+                callback(event, dataset_id, df, delta)
+            except Exception as e:
+                print(f"❌ Dataset Listener Error ({event}): {e}")
+
+    def _extend_derived(self, dataset_id, df, start, version):
+        """
+        Carries derived structures over an append: those with extended(df, start) are updated
+        incrementally from the new rows, the rest are dropped and rebuilt on next use.
+        """
+        carried = {}
+        for name, (_, structure) in self._derived.get(dataset_id, {}).items():
+            if hasattr(structure, 'extended'):
+                try:
+                    carried[name] = (version, structure.extended(df, start))
+                except Exception as e:
+                    print(f"❌ Derived Update Error ({name}): {e}")
+        self._derived[dataset_id] = carried
+
+    def _append_lock(self, dataset_id):
+        return self._append_locks.setdefault(dataset_id, threading.Lock())
+
+    @staticmethod
+    def _load_frame(meta):
+        """Loads a dataset's base snapshot plus its appended parts (None if any file is missing)."""
+        df = load_snapshot(meta["key"])
+        parts = meta.get("parts", [])
+        if df is None or not parts:
+            return df
+        deltas = [load_snapshot(key) for key in parts]
+        if any(delta is None for delta in deltas):
+            return None
+        # One join for all parts; new categories keep their order of first appearance, as in the original appends
+        return append_frames(df, pd.concat(deltas, ignore_index=True))
+
+    def _set_default(self, dataset_id):
+        self.index["default"] = dataset_id
+        write_index(self.index)
+
+    def _derived_mb(self, dataset_id):
+        """Estimated footprint of a dataset's derived structures (they can outgrow the frame itself)."""
+        structures = self._derived.get(dataset_id, {}).values()
+        return round(sum(estimate_size(structure) for _, structure in structures) / 1024 ** 2, 2)
+
+    def _enforce_budget(self, keep):
+        """Evicts least-recently-used datasets (frame and derived structures) until the in-memory total fits the budget."""
+        total = sum(self.index["datasets"][d]["memory_mb"] + self._derived_mb(d) for d in self._frames)
+        for dataset_id in list(self._frames):
+            if total <= self.budget_mb:
+                break
+            if dataset_id == keep:
+                continue
+            key = self.index["datasets"][dataset_id]["key"]
+            if not has_snapshot(key) and not save_snapshot(self._frames[dataset_id], key):
+                continue
+            total -= self.index["datasets"][dataset_id]["memory_mb"] + self._derived_mb(dataset_id)
+            del self._frames[dataset_id]
+            self._derived.pop(dataset_id, None)
+            print(f"♻️ Evicted dataset {dataset_id} to disk ({total:.1f}/{self.budget_mb} MB in memory)")
+
+datasets = DatasetRegistry()
@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from app.services.cache import filters_hash
+
+# Trained risk models, keyed by dataset id + version + filter hash, persisted under MODEL_DIR/<key>/
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", 16))
+RISK_FEATURES = ['hour', 'month', 'LAT', 'LON', 'AREA NAME']
+# Format of the ids produced by ModelRegistry.key; anything else is rejected before touching the filesystem
+MODEL_ID_PATTERN = re.compile(r'^[0-9a-f]{12}-v\d+-[0-9a-f]{16}(-[0-9a-f]{8})?$')
+
+class RiskModel:
+    """A trained severity classifier with the label classes it was fitted on and its training result."""
+    def __init__(self, booster, area_classes, severity_classes, result):
+        self.booster = booster
+        self.area_classes = [str(c) for c in area_classes]
+        self.severity_classes = [str(c) for c in severity_classes]
+        self.result = result
+
+    def features(self, hour, month, lat, lon, area):
+        """Feature matrix in training order; areas unseen in training are passed as missing values."""
+        area_codes = pd.Categorical(np.asarray(area, dtype=object), categories=self.area_classes).codes.astype(np.float32)
+        area_codes[area_codes < 0] = np.nan
+        return np.column_stack([
+            np.asarray(hour, dtype=np.float32), np.asarray(month, dtype=np.float32),
+            np.asarray(lat, dtype=np.float32), np.asarray(lon, dtype=np.float32), area_codes,
+        ])
+
+    def predict_proba(self, features):
+        """Class probabilities [n, n_classes], columns ordered as severity_classes."""
+        # In-place prediction reads the float32 matrix directly instead of copying it into a DMatrix
+        proba = self.booster.inplace_predict(features)
+        return proba.reshape(len(features), -1)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.booster.save_model(os.path.join(path, "model.json"))
+        with open(os.path.join(path, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"area_classes": self.area_classes, "severity_classes": self.severity_classes, "result": self.result}, f)
+
+    @classmethod
+    def load(cls, path):
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(path, "model.json"))
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(booster, meta["area_classes"], meta["severity_classes"], meta["result"])
+
+class ModelRegistry:
+    """Trained models in an in-memory LRU backed by one directory per model on disk."""
+    def __init__(self, model_dir=MODEL_DIR, max_entries=MODEL_CACHE_MAX_ENTRIES):
+        self.model_dir = model_dir
+        self.max_entries = max_entries
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, dataset, filters, **params):
+        """Model id for a dataset version + filters; non-default training parameters are part of the id."""
+        key = f"{dataset.id}-v{dataset.version}-{filters_hash(filters)[:16]}"
+        params = {k: v for k, v in params.items() if v not in (None, False)}
+        if params:
+            key += "-" + hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        return key
+
+    def _path(self, key):
+        """Directory of a model; raises ValueError for ids that are not registry keys or leave model_dir."""
+        if not isinstance(key, str) or not MODEL_ID_PATTERN.match(key):
+            raise ValueError(f"Invalid model id '{key}'.")
+        root = os.path.realpath(self.model_dir)
+        path = os.path.realpath(os.path.join(root, key))
+        if os.path.dirname(path) != root:
+            raise ValueError(f"Invalid model id '{key}'.")
+        return path
+
+    def _remember(self, key, model):
+        with self._lock:
+            self._models[key] = model
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_entries:
+                self._models.popitem(last=False)
+
+    def get(self, key):
+        """Returns the stored model for key (loading it from disk if needed), or None. Invalid ids raise ValueError."""
+        path = self._path(key)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        try:
+            model = RiskModel.load(path)
+        except Exception as e:
+            print(f"❌ Model Load Error ({key}): {e}")
+            return None
+        self._remember(key, model)
+        return model
+
+    def put(self, key, model):
+        self._remember(key, model)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            model.save(tmp_path)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+            print(f"💾 Saved risk model: {path}")
+        except Exception as e:
+            print(f"❌ Model Save Error ({key}): {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+model_registry = ModelRegistry()
@@ -1,11 +1,20 @@
+import os
+import json
+import pickle
+import threading
+from collections import OrderedDict
 import osmnx as ox
 import networkx as nx
 from math import radians, cos, sin, asin, sqrt, isnan, isinf
 
-# Global Caches
-city_graph = None
-graph_center = None 
-current_radius = 0
+# Road graphs: kept in memory in LRU order under a size budget and persisted to disk, so routes in
+# already visited areas never hit the network. Graph files can also be pre-seeded for offline use.
+GRAPH_CACHE_DIR = os.getenv("GRAPH_CACHE_DIR", os.path.join("cache", "graphs"))
+GRAPH_MEMORY_BUDGET_MB = float(os.getenv("GRAPH_MEMORY_BUDGET_MB", 512))
+GRAPH_OFFLINE = os.getenv("GRAPH_OFFLINE", "0") == "1"
+GRAPH_INDEX_FILE = "graphs.json"
+# An endpoint counts as covered when it lies within this fraction of a graph's download radius
+GRAPH_COVERAGE_MARGIN = 0.9
 
 # NEW: Cache for amenities to prevent re-downloading
 AMENITIES_CACHE = {} 
@@ -20,34 +29,228 @@ def haversine(lon1, lat1, lon2, lat2):
     r = 6371 
     return c * r * 1000 
 
-def get_graph_robust(mid_lat, mid_lon, radius_meters):
-    global city_graph, graph_center, current_radius
+def _prepare_graph(G):
+    try:
+        G = ox.truncate.largest_component(G, strongly=False)
+    except AttributeError:
+        G = ox.utils_graph.get_largest_component(G, strongly=False)
+    for u, v, k, data in G.edges(keys=True, data=True):
+        data['crime_weight'] = data['length']
+    return G
 
-    # Check Reuse
-    if city_graph is not None and graph_center is not None:
-        dist = haversine(graph_center[1], graph_center[0], mid_lon, mid_lat)
-        if dist < 1000 and current_radius >= radius_meters:
-            return city_graph
+def _graph_coverage(G):
+    """Center and radius (meters) of the largest circle inside the bounding box of a graph's nodes."""
+    lats = [data['y'] for _, data in G.nodes(data=True)]
+    lons = [data['x'] for _, data in G.nodes(data=True)]
+    south, north, west, east = min(lats), max(lats), min(lons), max(lons)
+    lat, lon = (south + north) / 2, (west + east) / 2
+    radius = min(haversine(lon, south, lon, north), haversine(west, lat, east, lat)) / 2
+    return {"lat": lat, "lon": lon, "radius": radius}
 
-    print(f"Downloading map at {mid_lat:.4f}, {mid_lon:.4f} (r={int(radius_meters)}m)...")
-    try:
-        G = ox.graph_from_point((mid_lat, mid_lon), dist=radius_meters, network_type='walk')
-        
+def _graph_size_mb(G):
+    # Rough footprint of an OSMnx MultiDiGraph with its attribute dicts
+    return (G.number_of_nodes() * 400 + G.number_of_edges() * 1000) / 1e6
+
+class GraphStore:
+    """
+    Walk-network graphs by (center, radius). Any stored graph whose coverage contains both endpoints of a
+    route is reused; otherwise a graph is downloaded (unless offline), saved as a pickle and indexed.
+    GraphML files placed in the cache directory are indexed on first use, with coverage taken from their nodes
+    (each file is read outside the store lock).
+    """
+    def __init__(self, cache_dir=GRAPH_CACHE_DIR, budget_mb=GRAPH_MEMORY_BUDGET_MB, offline=GRAPH_OFFLINE):
+        self.cache_dir = cache_dir
+        self.budget_mb = budget_mb
+        self.offline = offline
+        self._graphs = OrderedDict()  # graph id -> graph (in memory)
+        self._index = None  # graph id -> {"lat", "lon", "radius", "file", "size_mb"}
+        self._lock = threading.RLock()
+        # graph id -> lock held while that graph is read from disk
+        self._loading = {}
+        # GraphML files in the cache directory that are not indexed yet
+        self._seeded = set()
+
+    @property
+    def index(self):
+        if self._index is None:
+            path = os.path.join(self.cache_dir, GRAPH_INDEX_FILE)
+            self._index = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self._index = json.load(f)
+                except Exception as e:
+                    print(f"❌ Graph Index Error: {e}")
+            # Forget entries whose graph file is gone
+            self._index = {k: v for k, v in self._index.items() if os.path.exists(os.path.join(self.cache_dir, v["file"]))}
+            # Only the file names are collected here; _index_seeded_files reads the graphs
+            if os.path.isdir(self.cache_dir):
+                known = {entry["file"] for entry in self._index.values()}
+                self._seeded = {f for f in os.listdir(self.cache_dir) if f.endswith(".graphml") and f not in known}
+        return self._index
+
+    def _index_seeded_files(self):
+        """Indexes GraphML files dropped into the cache directory (e.g. exported with ox.save_graphml)."""
+        with self._lock:
+            self.index
+            pending = sorted(self._seeded)
+        for filename in pending:
+            self._index_seeded_file(filename)
+
+    def _index_seeded_file(self, filename):
+        graph_id = os.path.splitext(filename)[0]
+        with self._lock:
+            loading = self._loading.setdefault(graph_id, threading.Lock())
+        with loading:
+            try:
+                with self._lock:
+                    if filename not in self._seeded:
+                        return
+                try:
+                    G = _prepare_graph(ox.load_graphml(os.path.join(self.cache_dir, filename)))
+                except Exception as e:
+                    print(f"❌ Graph Seed Error ({filename}): {e}")
+                    G = None
+                with self._lock:
+                    self._seeded.discard(filename)
+                    if G is None:
+                        return
+                    self._index[graph_id] = {**_graph_coverage(G), "file": filename, "size_mb": _graph_size_mb(G)}
+                    self._graphs[graph_id] = G
+                    self._write_index()
+                    self._enforce_budget(keep=graph_id)
+                print(f"✅ Indexed seeded road graph: {filename}")
+            finally:
+                with self._lock:
+                    if self._loading.get(graph_id) is loading:
+                        del self._loading[graph_id]
+
+    def _write_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, GRAPH_INDEX_FILE)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(f"{path}.tmp", path)
+
+    def covering(self, points, radius_meters=0):
+        """Id of the best stored graph containing every point (in memory first, then smallest), or None."""
+        self._index_seeded_files()
+        with self._lock:
+            candidates = []
+            for graph_id, entry in self.index.items():
+                if entry["radius"] < radius_meters:
+                    continue
+                reach = entry["radius"] * GRAPH_COVERAGE_MARGIN
+                if all(haversine(entry["lon"], entry["lat"], lon, lat) <= reach for lat, lon in points):
+                    candidates.append((graph_id not in self._graphs, entry["radius"], graph_id))
+            return min(candidates)[2] if candidates else None
+
+    def load(self, graph_id):
+        """
+        Returns a stored graph, reading it from disk when it is not in memory. The read happens outside the
+        store lock, so routes on other graphs are not blocked; concurrent loads of one graph read it once.
+        """
+        with self._lock:
+            if graph_id in self._graphs:
+                self._graphs.move_to_end(graph_id)
+                return self._graphs[graph_id]
+            path = os.path.join(self.cache_dir, self.index[graph_id]["file"])
+            loading = self._loading.setdefault(graph_id, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if graph_id in self._graphs:
+                    self._graphs.move_to_end(graph_id)
+                    return self._graphs[graph_id]
+            try:
+                print(f"⚡ Loading road graph from CACHE: {path}")
+                if path.endswith(".graphml"):
+                    G = _prepare_graph(ox.load_graphml(path))
+                else:
+                    with open(path, 'rb') as f:
+                        G = pickle.load(f)
+                with self._lock:
+                    self._graphs[graph_id] = G
+                    self._enforce_budget(keep=graph_id)
+            finally:
+                with self._lock:
+                    if self._loading.get(graph_id) is loading:
+                        del self._loading[graph_id]
+            return G
+
+    def add(self, G, lat, lon, radius_meters):
+        """Saves a prepared graph to disk, indexes it and keeps it in memory."""
+        graph_id = f"{lat:.4f}_{lon:.4f}_{int(radius_meters)}"
+        filename = f"{graph_id}.pkl"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, filename)
+        with open(f"{path}.tmp", 'wb') as f:
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+        print(f"💾 Saved road graph: {path}")
+
+        with self._lock:
+            self.index[graph_id] = {"lat": lat, "lon": lon, "radius": radius_meters, "file": filename, "size_mb": _graph_size_mb(G)}
+            self._write_index()
+            self._graphs[graph_id] = G
+            self._enforce_budget(keep=graph_id)
+        return graph_id
+
+    def download(self, lat, lon, radius_meters):
+        print(f"Downloading map at {lat:.4f}, {lon:.4f} (r={int(radius_meters)}m)...")
+        G = _prepare_graph(ox.graph_from_point((lat, lon), dist=radius_meters, network_type='walk'))
         try:
-            city_graph = ox.truncate.largest_component(G, strongly=False)
-        except AttributeError:
-            city_graph = ox.utils_graph.get_largest_component(G, strongly=False)
-        
-        graph_center = (mid_lat, mid_lon)
-        current_radius = radius_meters
-        
-        for u, v, k, data in city_graph.edges(keys=True, data=True):
-            data['crime_weight'] = data['length']
-            
-        return city_graph
-    except Exception as e:
-        print(f"Graph load failed: {e}")
-        return None
+            self.add(G, lat, lon, radius_meters)
+        except Exception as e:
+            print(f"❌ Graph Cache Write Error: {e}")
+        return G
+
+    def seed(self, lat, lon, radius_meters):
+        """Downloads and stores a graph ahead of time (e.g. the whole city) so routing can run offline."""
+        self._index_seeded_files()
+        with self._lock:
+            for graph_id, entry in self.index.items():
+                if haversine(entry["lon"], entry["lat"], lon, lat) + radius_meters <= entry["radius"]:
+                    return graph_id
+        self.download(lat, lon, radius_meters)
+        return f"{lat:.4f}_{lon:.4f}_{int(radius_meters)}"
+
+    def graph_for(self, points, center, radius_meters, min_radius=0):
+        """
+        A graph containing all points (stored with at least min_radius) when possible, else one downloaded
+        with radius_meters around `center` (None when offline or the download fails).
+        """
+        graph_id = self.covering(points, min_radius)
+        if graph_id is not None:
+            try:
+                return self.load(graph_id)
+            except Exception as e:
+                print(f"❌ Graph Cache Read Error ({graph_id}): {e}")
+        if self.offline:
+            print("⚠️ No cached road graph covers this route (offline mode).")
+            return None
+        try:
+            return self.download(center[0], center[1], radius_meters)
+        except Exception as e:
+            print(f"Graph load failed: {e}")
+            return None
+
+    def _enforce_budget(self, keep=None):
+        total = sum(self.index.get(k, {}).get("size_mb", 0) for k in self._graphs)
+        while total > self.budget_mb and len(self._graphs) > 1:
+            graph_id = next(iter(self._graphs))
+            if graph_id == keep:
+                self._graphs.move_to_end(graph_id)
+                continue
+            del self._graphs[graph_id]
+            total -= self.index.get(graph_id, {}).get("size_mb", 0)
+            print(f"♻️ Evicted road graph {graph_id} from memory (kept on disk)")
+
+graph_store = GraphStore()
+
+def get_graph_robust(mid_lat, mid_lon, radius_meters, points=None, min_radius=0):
+    """Graph around the midpoint of a route, reusing any stored graph that already covers its endpoints."""
+    return graph_store.graph_for(points or [(mid_lat, mid_lon)], (mid_lat, mid_lon), radius_meters, min_radius)
 
 def calculate_safe_route(start_lat, start_lon, end_lat, end_lon):
     mid_lat = (start_lat + end_lat) / 2
@@ -57,7 +260,8 @@ def calculate_safe_route(start_lat, start_lon, end_lat, end_lon):
     attempts = [max(2000, trip_dist * 0.75), max(5000, trip_dist * 1.5)]
     
     for radius in attempts:
-        graph = get_graph_robust(mid_lat, mid_lon, radius)
+        # Only the endpoints must be covered for the first attempt; retries ask for a genuinely larger graph
+        graph = get_graph_robust(mid_lat, mid_lon, radius, [(start_lat, start_lon), (end_lat, end_lon)], min_radius=0 if radius == attempts[0] else radius)
         if graph is None: continue
 
         try:
@@ -125,4 +329,10 @@ def get_nearby_amenities(lat, lon, dist=30000):
 
 # Placeholder
 def update_graph_weights_by_hotspots(centers, radius=150, penalty=2000):
-    pass
\ No newline at end of file
+    pass
+
+if __name__ == "__main__":
+    # Pre-seed the graph cache: python -m app.services.routing <lat> <lon> <radius_m>
+    import sys
+    lat, lon, radius = (float(v) for v in sys.argv[1:4])
+    print(f"✅ Seeded road graph {graph_store.seed(lat, lon, radius)} in {graph_store.cache_dir}")
@@ -0,0 +1,192 @@
+import numpy as np
+
+# Sorted grid index: incidents are projected to meters and bucketed into square cells; rows are kept in
+# cell-key order so every cell (and every run of cells along one grid row) is one contiguous slice.
+SPATIAL_CELL_M = 250.0
+# Queries are answered in batches of this many points, and candidates gathered in chunks of at most
+# SPATIAL_MAX_CANDIDATES rows, so memory stays bounded whatever the radius and point density
+SPATIAL_QUERY_BATCH = 512
+SPATIAL_MAX_CANDIDATES = 1_000_000
+# Largest accepted query radius
+SPATIAL_MAX_RADIUS_M = 5000.0
+METERS_PER_DEG_LAT = 111_320.0
+_COL_BITS = 24
+_OFFSET = 1 << (_COL_BITS - 1)
+
+def _pack(row, col):
+    row = np.clip(row, 1 - _OFFSET, _OFFSET - 1)
+    col = np.clip(col, 1 - _OFFSET, _OFFSET - 1)
+    return ((row + _OFFSET) << _COL_BITS) | (col + _OFFSET)
+
+class SpatialIndex:
+    """
+    Grid index over the incident coordinates of a dataset (positionally aligned with the frame).
+    Rows with missing or zero coordinates are not indexed.
+    """
+    def __init__(self, df=None, cell_m=SPATIAL_CELL_M):
+        self.cell_m = cell_m
+        self.lat0 = 34.05
+        self.lon0 = -118.25
+        self.x = np.empty(0, dtype=np.float32)
+        self.y = np.empty(0, dtype=np.float32)
+        self.order = np.empty(0, dtype=np.int64)
+        self.sorted_keys = np.empty(0, dtype=np.int64)
+        if df is not None:
+            lat, lon = self._coordinates(df)
+            valid = np.isfinite(lat) & np.isfinite(lon)
+            if valid.any():
+                # Equirectangular projection around the data's mean position (accurate at city scale)
+                self.lat0 = float(lat[valid].mean())
+                self.lon0 = float(lon[valid].mean())
+            self.x, self.y = self.project(lat, lon)
+            keys = self._cell_keys(self.x, self.y)
+            indexed = np.flatnonzero(keys >= 0)
+            order = np.argsort(keys[indexed], kind='stable')
+            self.order = indexed[order]
+            self.sorted_keys = keys[self.order]
+
+    @staticmethod
+    def _coordinates(df):
+        lat = df['LAT'].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        lon = df['LON'].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        missing = (lat == 0) | (lon == 0)
+        lat[missing] = np.nan
+        lon[missing] = np.nan
+        return lat, lon
+
+    def project(self, lat, lon):
+        """Meters east / north of (lat0, lon0)."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        x = (lon - self.lon0) * METERS_PER_DEG_LAT * np.cos(np.radians(self.lat0))
+        y = (lat - self.lat0) * METERS_PER_DEG_LAT
+        return x.astype(np.float32), y.astype(np.float32)
+
+    def _cell_keys(self, x, y):
+        """Packed cell key of every point, -1 for points without coordinates."""
+        valid = np.isfinite(x) & np.isfinite(y)
+        keys = np.full(len(x), -1, dtype=np.int64)
+        row = np.floor(y[valid] / self.cell_m).astype(np.int64)
+        col = np.floor(x[valid] / self.cell_m).astype(np.int64)
+        keys[valid] = _pack(row, col)
+        return keys
+
+    def extended(self, df, start):
+        """Returns an index covering df by merging the rows appended from position `start`."""
+        index = SpatialIndex(cell_m=self.cell_m)
+        index.lat0, index.lon0 = self.lat0, self.lon0
+        lat, lon = self._coordinates(df.iloc[start:])
+        dx, dy = index.project(lat, lon)
+        keys = index._cell_keys(dx, dy)
+        indexed = np.flatnonzero(keys >= 0)
+        order = indexed[np.argsort(keys[indexed], kind='stable')]
+        delta_keys = keys[order]
+
+        # Sorted merge: appended rows go after existing rows of the same cell
+        at = np.searchsorted(self.sorted_keys, delta_keys, side='right')
+        index.x = np.concatenate([self.x, dx])
+        index.y = np.concatenate([self.y, dy])
+        index.order = np.insert(self.order, at, order + start)
+        index.sorted_keys = np.insert(self.sorted_keys, at, delta_keys)
+        return index
+
+    def _ranges(self, rows, col_lo, col_hi):
+        lo = np.searchsorted(self.sorted_keys, _pack(rows, col_lo).ravel(), side='left')
+        hi = np.searchsorted(self.sorted_keys, _pack(rows, col_hi).ravel(), side='right')
+        return lo, hi
+
+    def _gather(self, lo, hi):
+        """Row positions in the given sorted-key slices, plus which slice each came from."""
+        lengths = hi - lo
+        total = int(lengths.sum())
+        slice_of = np.repeat(np.arange(len(lo)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.order[lo[slice_of] + offsets], slice_of
+
+    def _radius_chunks(self, lat, lon, radius_m, mask=None):
+        """
+        Yields (row positions, query index, distance in meters) of the incidents within radius_m of the query
+        points, one bounded chunk of candidates at a time.
+        """
+        if radius_m > SPATIAL_MAX_RADIUS_M:
+            raise ValueError(f"radius_m must be at most {SPATIAL_MAX_RADIUS_M:g} meters.")
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        span = int(np.ceil(radius_m / self.cell_m))
+        steps = np.arange(-span, span + 1)
+
+        for begin in range(0, len(lat), SPATIAL_QUERY_BATCH):
+            qx, qy = self.project(lat[begin:begin + SPATIAL_QUERY_BATCH], lon[begin:begin + SPATIAL_QUERY_BATCH])
+            q_row = np.floor(qy / self.cell_m).astype(np.int64)
+            q_col = np.floor(qx / self.cell_m).astype(np.int64)
+            # One contiguous key range per (query, grid row) covering the query's column span
+            rows = q_row[:, None] + steps[None, :]
+            lo, hi = self._ranges(rows, (q_col - span)[:, None], (q_col + span)[:, None])
+
+            # Split the slices into groups of at most SPATIAL_MAX_CANDIDATES rows (a larger single slice goes alone)
+            ends = np.cumsum(hi - lo)
+            first = 0
+            while first < len(lo):
+                budget = (ends[first - 1] if first else 0) + SPATIAL_MAX_CANDIDATES
+                last = max(int(np.searchsorted(ends, budget, side='right')), first + 1)
+                candidates, slice_of = self._gather(lo[first:last], hi[first:last])
+                query_of = (slice_of + first) // len(steps)
+                first = last
+
+                dist = np.hypot(self.x[candidates] - qx[query_of], self.y[candidates] - qy[query_of])
+                keep = dist <= radius_m
+                if mask is not None:
+                    keep &= mask[candidates]
+                yield candidates[keep], query_of[keep] + begin, dist[keep]
+
+    def count_radius(self, lat, lon, radius_m, mask=None):
+        """Number of incidents within radius_m meters of each query point."""
+        counts = np.zeros(len(np.atleast_1d(lat)), dtype=np.int64)
+        for _, queries, _ in self._radius_chunks(lat, lon, radius_m, mask):
+            counts += np.bincount(queries, minlength=len(counts))
+        return counts
+
+    def query_radius(self, lat, lon, radius_m, mask=None, limit=None):
+        """
+        Incidents within radius_m meters of each query point.
+        Returns (row positions, query index, distance in meters) for every match; `mask` (boolean per frame row)
+        restricts the matches. With `limit`, only the nearest `limit` matches of each query are kept (sorted by
+        query, then distance), so the result stays small even for dense areas.
+        """
+        positions = np.empty(0, dtype=np.int64)
+        queries = np.empty(0, dtype=np.int64)
+        distances = np.empty(0, dtype=np.float32)
+        parts = []
+        for chunk in self._radius_chunks(lat, lon, radius_m, mask):
+            if limit is None:
+                parts.append(chunk)
+                continue
+            positions = np.concatenate([positions, chunk[0]])
+            queries = np.concatenate([queries, chunk[1]])
+            distances = np.concatenate([distances, chunk[2]])
+            # Nearest first within each query, then the first `limit` of every query
+            order = np.lexsort((distances, queries))
+            positions, queries, distances = positions[order], queries[order], distances[order]
+            rank = np.arange(len(queries)) - np.searchsorted(queries, queries, side='left')
+            keep = rank < limit
+            positions, queries, distances = positions[keep], queries[keep], distances[keep]
+
+        if parts:
+            return tuple(np.concatenate(column) for column in zip(*parts))
+        return positions, queries, distances
+
+    def query_bbox(self, south, west, north, east, mask=None):
+        """Row positions of the incidents inside a lat/lon bounding box."""
+        x0, y0 = self.project(south, west)
+        x1, y1 = self.project(north, east)
+        row0, row1 = int(np.floor(y0 / self.cell_m)), int(np.floor(y1 / self.cell_m))
+        col0, col1 = int(np.floor(x0 / self.cell_m)), int(np.floor(x1 / self.cell_m))
+        rows = np.arange(row0, row1 + 1, dtype=np.int64)
+        lo, hi = self._ranges(rows, col0, col1)
+        candidates, _ = self._gather(lo, hi)
+
+        x, y = self.x[candidates], self.y[candidates]
+        keep = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        if mask is not None:
+            keep &= mask[candidates]
+        return np.sort(candidates[keep])
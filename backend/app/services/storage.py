@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import pandas as pd
+
+# Columnar snapshots of preprocessed uploads, keyed by a content hash of the raw CSV and the pipeline that built them
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+INDEX_FILE = "datasets.json"
+
+def hash_upload(file_stream, salt=None, block_size=1 << 20):
+    """
+    Computes a SHA-256 content hash of an uploaded file and rewinds the stream.
+    `salt` (e.g. the pipeline fingerprint) is hashed first, so the same file processed differently gets another key.
+    """
+    digest = hashlib.sha256()
+    if salt:
+        digest.update(f"{salt}\n".encode('utf-8'))
+    file_stream.seek(0)
+    while True:
+        block = file_stream.read(block_size)
+        if not block:
+            break
+        if isinstance(block, str):
+            block = block.encode('utf-8')
+        digest.update(block)
+    file_stream.seek(0)
+    return digest.hexdigest()
+
+def snapshot_path(key):
+    return os.path.join(SNAPSHOT_DIR, f"{key}.parquet")
+
+def has_snapshot(key):
+    return os.path.exists(snapshot_path(key))
+
+def save_snapshot(df, key):
+    """Writes the preprocessed frame as a Parquet snapshot."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"❌ Snapshot Save Error: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    print(f"💾 Saved dataset snapshot: {path}")
+    return True
+
+def load_snapshot(key):
+    """Loads a snapshot back into a DataFrame (memory-mapped read, categoricals preserved)."""
+    path = snapshot_path(key)
+    if not os.path.exists(path):
+        return None
+    print(f"⚡ Loading dataset from SNAPSHOT: {path}")
+    return pd.read_parquet(path, memory_map=True)
+
+def remove_snapshot(key):
+    path = snapshot_path(key)
+    if os.path.exists(path):
+        os.remove(path)
+
+def read_index():
+    """Reads the persisted dataset index ({"default": id, "datasets": {id: meta}})."""
+    path = os.path.join(SNAPSHOT_DIR, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"default": None, "datasets": {}}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except Exception as e:
+        print(f"❌ Snapshot Index Error: {e}")
+        return {"default": None, "datasets": {}}
+    # Forget datasets whose snapshot file (or one of its appended parts) has been removed
+    index["datasets"] = {
+        k: v for k, v in index.get("datasets", {}).items()
+        if all(has_snapshot(key) for key in [v.get("key", "")] + v.get("parts", []))
+    }
+    if index.get("default") not in index["datasets"]:
+        index["default"] = None
+    return index
+
+def write_index(index):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, INDEX_FILE)
+    # A unique temp file per writer, so concurrent writers (e.g. several workers) never share a partial file
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=SNAPSHOT_DIR, suffix='.tmp', delete=False) as f:
+        json.dump(index, f)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.remove(f.name)
+        raise
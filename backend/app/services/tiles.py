@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+# Tile pyramid: Web Mercator tiles (same z/x/y scheme as the Leaflet base map),
+# each tile split into TILE_BINS x TILE_BINS heat cells.
+HEATMAP_MAX_ZOOM = 14
+TILE_BITS = 6
+TILE_BINS = 1 << TILE_BITS
+# Upper bound on cells in one bbox response; larger views are answered from a coarser level
+HEATMAP_MAX_CELLS = 20000
+
+def _part1by1(v):
+    """Spreads the bits of v so they occupy the even bit positions (Morton / Z-order helper)."""
+    v = v.astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+def _compact1by1(v):
+    v = v & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v
+
+def morton_encode(x, y):
+    return _part1by1(np.asarray(x)) | (_part1by1(np.asarray(y)) << np.uint64(1))
+
+def morton_decode(keys):
+    keys = np.asarray(keys, dtype=np.uint64)
+    return _compact1by1(keys).astype(np.int64), _compact1by1(keys >> np.uint64(1)).astype(np.int64)
+
+def mercator_fraction(lat, lon):
+    """Web Mercator position of lat/lon as fractions of the world (x right, y down), clipped to [0, 1)."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = (lon + 180.0) / 360.0
+    lat_rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+def fraction_to_latlon(x, y):
+    lon = x * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y))))
+    return lat, lon
+
+def bin_keys(lat, lon, zoom=HEATMAP_MAX_ZOOM):
+    """Morton key of the heat cell every point falls in, at the finest pyramid level."""
+    x, y = mercator_fraction(lat, lon)
+    scale = float(1 << (zoom + TILE_BITS))
+    return morton_encode(np.floor(x * scale).astype(np.int64), np.floor(y * scale).astype(np.int64))
+
+class TileKeys:
+    """
+    Per-row finest-level cell keys and severity codes of a dataset (positionally aligned with the frame).
+    """
+    def __init__(self, df=None):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.severity = np.empty(0, dtype=np.int16)
+        self.severity_labels = []
+        if df is not None:
+            self.keys = bin_keys(df['LAT'].to_numpy(), df['LON'].to_numpy())
+            self.severity, self.severity_labels = self._severity_codes(df)
+
+    @staticmethod
+    def _severity_codes(df):
+        severity = df['Severity']
+        if not isinstance(severity.dtype, pd.CategoricalDtype):
+            severity = severity.astype('category')
+        return severity.cat.codes.to_numpy().astype(np.int16), list(severity.cat.categories)
+
+    def extended(self, df, start):
+        extended = TileKeys()
+        delta = df.iloc[start:]
+        extended.severity, extended.severity_labels = self._severity_codes(df)
+        if extended.severity_labels[:len(self.severity_labels)] != self.severity_labels:
+            return TileKeys(df)
+        extended.keys = np.concatenate([self.keys, bin_keys(delta['LAT'].to_numpy(), delta['LON'].to_numpy())])
+        return extended
+
+def _collapse(keys, counts):
+    """Sums the count rows of equal neighbours in an already sorted key array."""
+    if len(keys) == 0:
+        return keys, counts
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(counts, starts, axis=0)
+
+class TilePyramid:
+    """
+    Sparse per-severity cell counts for every zoom level 0..HEATMAP_MAX_ZOOM, stored in Morton order so
+    every z/x/y tile (and every bounding box's candidate range) is one contiguous slice.
+    Serves both the heatmap (counts summed) and the 3D view (count + dominant severity per cell).
+    """
+    def __init__(self, keys, severity, severity_labels):
+        order = np.argsort(keys, kind='stable')
+        keys = np.asarray(keys, dtype=np.uint64)[order]
+        counts = np.zeros((len(keys), max(len(severity_labels), 1)), dtype=np.int32)
+        codes = np.asarray(severity)[order]
+        known = codes >= 0
+        counts[np.flatnonzero(known), codes[known]] = 1
+
+        level_keys, level_counts = _collapse(keys, counts)
+        self.levels = {HEATMAP_MAX_ZOOM: (level_keys, level_counts)}
+        for zoom in range(HEATMAP_MAX_ZOOM - 1, -1, -1):
+            # Dropping one bit per axis keeps Morton keys sorted, so each level collapses in one pass
+            level_keys, level_counts = _collapse(level_keys >> np.uint64(2), level_counts)
+            self.levels[zoom] = (level_keys, level_counts)
+        self.severity_labels = list(severity_labels)
+        self.total = int(len(keys))
+
+    @staticmethod
+    def _clamp_zoom(zoom):
+        return int(min(max(zoom, 0), HEATMAP_MAX_ZOOM))
+
+    def _cells(self, zoom, keys, counts):
+        scale = float(1 << (zoom + TILE_BITS))
+        bx, by = morton_decode(keys)
+        lat, lon = fraction_to_latlon((bx + 0.5) / scale, (by + 0.5) / scale)
+        return lat, lon, counts
+
+    def tile(self, zoom, x, y):
+        """Cells (lat, lon, per-severity counts) of one z/x/y tile. Tiles past the deepest level reuse its cells."""
+        shift = max(zoom - HEATMAP_MAX_ZOOM, 0)
+        level = self._clamp_zoom(zoom)
+        keys, counts = self.levels[level]
+        tile_key = int(morton_encode(np.array([x >> shift]), np.array([y >> shift]))[0])
+        lo = np.searchsorted(keys, np.uint64(tile_key << (2 * TILE_BITS)), side='left')
+        hi = np.searchsorted(keys, np.uint64((tile_key + 1) << (2 * TILE_BITS)), side='left')
+        keys, counts = keys[lo:hi], counts[lo:hi]
+
+        if shift:
+            # Keep only the deepest-level cells under the requested child tile
+            bx, by = morton_decode(keys)
+            x0, y0 = (x << TILE_BITS) >> shift, (y << TILE_BITS) >> shift
+            x1, y1 = ((x + 1) << TILE_BITS) >> shift, ((y + 1) << TILE_BITS) >> shift
+            inside = (bx >= x0) & (bx < max(x1, x0 + 1)) & (by >= y0) & (by < max(y1, y0 + 1))
+            keys, counts = keys[inside], counts[inside]
+        return self._cells(level, keys, counts)
+
+    def bbox(self, zoom, south, west, north, east, max_cells=HEATMAP_MAX_CELLS):
+        """
+        Cells inside a bounding box. Steps down to coarser levels until at most max_cells remain.
+        Returns (zoom actually used, lat, lon, per-severity counts).
+        """
+        zoom = self._clamp_zoom(zoom)
+        x0, y0 = mercator_fraction(north, west)
+        x1, y1 = mercator_fraction(south, east)
+        while True:
+            scale = float(1 << (zoom + TILE_BITS))
+            bx0, by0, bx1, by1 = (int(v * scale) for v in (x0, y0, x1, y1))
+            keys, counts = self.levels[zoom]
+            # Every cell in the box has a Morton key between the corners' keys
+            lo = np.searchsorted(keys, morton_encode(np.array([bx0]), np.array([by0]))[0], side='left')
+            hi = np.searchsorted(keys, morton_encode(np.array([bx1]), np.array([by1]))[0], side='right')
+            keys, counts = keys[lo:hi], counts[lo:hi]
+            bx, by = morton_decode(keys)
+            inside = (bx >= bx0) & (bx <= bx1) & (by >= by0) & (by <= by1)
+            if inside.sum() <= max_cells or zoom == 0:
+                return (zoom, *self._cells(zoom, keys[inside], counts[inside]))
+            zoom -= 1
+
+    def dominant_severity(self, counts):
+        """Label of the most frequent severity of every cell."""
+        if not self.severity_labels:
+            return [None] * len(counts)
+        return np.asarray(self.severity_labels, dtype=object)[counts.argmax(axis=1)].tolist()
@@ -0,0 +1,190 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from app.services.indexing import FILTER_COLUMNS
+
+# Range queries are answered at these resolutions; weeks start on Monday
+RESOLUTIONS = ('hour', 'day', 'week', 'month')
+# Upper bound on buckets in one range response
+TIMESERIES_MAX_BUCKETS = 100_000
+HOURS_PER_YEAR = 8766
+# Longest span of hours kept in the prefix arrays; rows outside it (outlier dates) are not counted
+TIMESERIES_MAX_HOURS = int(os.getenv("TIMESERIES_MAX_HOURS", 30 * HOURS_PER_YEAR))
+# Per-category prefix matrices larger than this are not built: such selections go through prefix_for_rows
+TIMESERIES_MAX_SLICE_MB = float(os.getenv("TIMESERIES_MAX_SLICE_MB", 256))
+
+def _prefix(hist):
+    """
+    Cumulative counts with a leading 0 along the last axis, so range sums are P[end] - P[start].
+    int32 is enough (no count exceeds the row count) and halves the per-category matrices.
+    """
+    pad = np.zeros(hist.shape[:-1] + (1,), dtype=np.int32)
+    return np.concatenate([pad, np.cumsum(hist, axis=-1, dtype=np.int32)], axis=-1)
+
+def _span(hours):
+    """
+    (start, n_hours) of the prefix arrays for the given row hours. Spans longer than TIMESERIES_MAX_HOURS are
+    cut down: dates more than a year outside the 0.1-99.9th percentile range are treated as outliers, then
+    only the latest TIMESERIES_MAX_HOURS are kept.
+    """
+    first, last = hours.min(), hours.max()
+    if int((last - first).astype(np.int64)) < TIMESERIES_MAX_HOURS:
+        return first, int((last - first).astype(np.int64)) + 1
+    values = hours.astype(np.int64)
+    low, high = np.percentile(values, [0.1, 99.9])
+    inliers = values[(values >= low - HOURS_PER_YEAR) & (values <= high + HOURS_PER_YEAR)]
+    last = inliers.max()
+    first = max(inliers.min(), last - TIMESERIES_MAX_HOURS + 1)
+    return np.datetime64(int(first), 'h'), int(last - first) + 1
+
+def _categories(series):
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    return series
+
+def bucket_edges(start, end, resolution):
+    """Bucket boundaries (datetime64[h]) covering [start, end) at the given resolution, aligned to calendar units."""
+    start = np.datetime64(pd.Timestamp(start), 'h')
+    end = np.datetime64(pd.Timestamp(end), 'h')
+    if resolution == 'hour':
+        return np.arange(start, end + np.timedelta64(1, 'h'), np.timedelta64(1, 'h'))
+    if resolution == 'day':
+        days = np.arange(start.astype('datetime64[D]'), end.astype('datetime64[D]') + np.timedelta64(2, 'D'))
+    elif resolution == 'week':
+        first = start.astype('datetime64[D]')
+        # 1970-01-01 was a Thursday: shift back to the Monday on or before start
+        first -= np.timedelta64((first.astype(np.int64) + 3) % 7, 'D')
+        days = np.arange(first, end.astype('datetime64[D]') + np.timedelta64(8, 'D'), np.timedelta64(7, 'D'))
+    elif resolution == 'month':
+        days = np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]') + np.timedelta64(2, 'M')).astype('datetime64[D]')
+    else:
+        raise ValueError(f"Unknown resolution '{resolution}'. Use one of: {', '.join(RESOLUTIONS)}.")
+    edges = days.astype('datetime64[h]')
+    # Drop trailing edges past the first one at or after end
+    last = np.searchsorted(edges, end, side='left')
+    return edges[:last + 1]
+
+class HourlyCounts:
+    """
+    Prefix sums of hourly incident counts over the dataset's time span (at most TIMESERIES_MAX_HOURS), in total
+    and per category of a filter column. Any range at any resolution is a difference of two prefix entries per
+    bucket. Per-category prefix matrices are built on first use and only when they fit TIMESERIES_MAX_SLICE_MB.
+    """
+    def __init__(self, df=None):
+        self.start = np.datetime64(0, 'h')
+        self.n_hours = 0
+        self.hour_index = np.empty(0, dtype=np.int32)
+        self.total = np.zeros(1, dtype=np.int64)
+        self.clipped = 0
+        self.codes = {}  # field -> (categories, row codes)
+        self.slices = {}  # field -> (categories, prefix matrix [n_categories, n_hours + 1]) or None if too large
+        self._lock = threading.Lock()
+        if df is not None and len(df):
+            hours = df['datetime_occ'].to_numpy().astype('datetime64[h]')
+            self.start, self.n_hours = _span(hours)
+            offsets = (hours - self.start).astype(np.int64)
+            outside = (offsets < 0) | (offsets >= self.n_hours)
+            self.clipped = int(outside.sum())
+            # Rows outside the span (outlier dates) get index -1 and are left out of every count
+            self.hour_index = np.where(outside, -1, offsets).astype(np.int32)
+            self.total = _prefix(self._histogram(self.hour_index))
+            for field, col in FILTER_COLUMNS.items():
+                series = _categories(df[col])
+                self.codes[field] = (series.cat.categories, series.cat.codes.to_numpy())
+
+    def _histogram(self, hour_index, codes=None, n_categories=None):
+        known = hour_index >= 0
+        if codes is None:
+            return np.bincount(hour_index[known], minlength=self.n_hours).astype(np.int32)
+        known &= codes >= 0
+        flat = codes[known].astype(np.int64) * self.n_hours + hour_index[known]
+        return np.bincount(flat, minlength=n_categories * self.n_hours).astype(np.int32).reshape(n_categories, self.n_hours)
+
+    def _slice(self, field):
+        """(categories, prefix matrix) of one filter column, built on first use; None when over the size cap."""
+        with self._lock:
+            if field not in self.slices:
+                categories, codes = self.codes[field]
+                if len(categories) * (self.n_hours + 1) * 4 > TIMESERIES_MAX_SLICE_MB * 1024 ** 2:
+                    self.slices[field] = None
+                else:
+                    self.slices[field] = (categories, _prefix(self._histogram(self.hour_index, codes, len(categories))))
+            return self.slices[field]
+
+    @property
+    def nbytes(self):
+        """Memory held by the prefix arrays and row indices (for memory budgets)."""
+        size = self.hour_index.nbytes + self.total.nbytes
+        size += sum(codes.nbytes for _, codes in self.codes.values())
+        size += sum(prefix.nbytes for entry in self.slices.values() if entry is not None for prefix in entry[1:])
+        return size
+
+    def extended(self, df, start):
+        """Adds the rows appended from position `start`; rebuilds when they fall outside the span or add categories."""
+        delta = df.iloc[start:]
+        hours = delta['datetime_occ'].to_numpy().astype('datetime64[h]')
+        offsets = (hours - self.start).astype(np.int64)
+        if self.n_hours == 0 or len(offsets) and (offsets.min() < 0 or offsets.max() >= self.n_hours):
+            return HourlyCounts(df)
+
+        counts = HourlyCounts()
+        counts.start, counts.n_hours, counts.clipped = self.start, self.n_hours, self.clipped
+        delta_index = offsets.astype(np.int32)
+        counts.hour_index = np.concatenate([self.hour_index, delta_index])
+        counts.total = self.total + _prefix(self._histogram(delta_index))
+        for field, (categories, _) in self.codes.items():
+            series = _categories(df[FILTER_COLUMNS[field]])
+            if not series.cat.categories.equals(categories):
+                return HourlyCounts(df)
+            codes = series.cat.codes.to_numpy()
+            counts.codes[field] = (categories, codes)
+            # Slices already built are carried over; the others stay lazy
+            entry = self.slices.get(field)
+            if entry is not None:
+                counts.slices[field] = (categories, entry[1] + _prefix(self._histogram(delta_index, codes[start:], len(categories))))
+            elif field in self.slices:
+                counts.slices[field] = None
+        return counts
+
+    def prefix_for(self, filters=None):
+        """
+        Prefix array for a filter selection when at most one filter column is used (sum of its category
+        rows), otherwise None: intersections across columns (and columns over the size cap) need prefix_for_rows.
+        """
+        active = [field for field in FILTER_COLUMNS if getattr(filters, field, None)]
+        if not active:
+            return self.total
+        if len(active) > 1:
+            return None
+        entry = self._slice(active[0])
+        if entry is None:
+            return None
+        categories, prefix = entry
+        codes = categories.get_indexer(pd.Index(list(set(getattr(filters, active[0]))), dtype=categories.dtype))
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return np.zeros(self.n_hours + 1, dtype=np.int64)
+        return prefix[codes].sum(axis=0, dtype=np.int64)
+
+    def prefix_for_rows(self, rows):
+        """Prefix array of an arbitrary row subset (one bincount over its hour indices)."""
+        return _prefix(self._histogram(self.hour_index if rows is None else self.hour_index[rows]))
+
+    def range_counts(self, prefix, start=None, end=None, resolution='day'):
+        """Counts per bucket of [start, end) (default: the whole span) as a ds/y frame, ds = bucket start."""
+        span_end = self.start + np.timedelta64(self.n_hours, 'h')
+        start = np.datetime64(pd.Timestamp(start), 'h') if start is not None else self.start
+        end = np.datetime64(pd.Timestamp(end), 'h') if end is not None else span_end
+        if end <= start:
+            raise ValueError("end must be after start.")
+        edges = bucket_edges(start, end, resolution)
+        if len(edges) - 1 > TIMESERIES_MAX_BUCKETS:
+            raise ValueError(f"Range has more than {TIMESERIES_MAX_BUCKETS} {resolution} buckets; use a coarser resolution.")
+
+        # Clamp bucket edges to [start, end) and to the indexed span before reading the prefix sums
+        bounded = np.clip(edges, start, end)
+        positions = np.clip((bounded - self.start).astype(np.int64), 0, self.n_hours)
+        counts = prefix[positions[1:]] - prefix[positions[:-1]]
+        return pd.DataFrame({'ds': pd.DatetimeIndex(edges[:-1]), 'y': counts})
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AREAS = ['Central', 'Hollywood', 'Newton', 'Pacific']
+CRIMES = ['BATTERY', 'BURGLARY', 'ROBBERY', 'THEFT', 'VANDALISM']
+SEVERITIES = ['High', 'Low', 'Medium']
+
+def make_incidents(n=2000, seed=0, start='2022-01-01', days=400):
+    """Synthetic preprocessed incidents with the columns the services read."""
+    rng = np.random.default_rng(seed)
+    occurred = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 24 * 60, n), unit='min')
+    df = pd.DataFrame({
+        'DR_NO': np.arange(n, dtype=np.int64) + 1,
+        'datetime_occ': occurred,
+        'AREA NAME': pd.Categorical(rng.choice(AREAS, n), categories=AREAS),
+        'Crm Cd Desc': pd.Categorical(rng.choice(CRIMES, n), categories=CRIMES),
+        'Severity': pd.Categorical(rng.choice(SEVERITIES, n), categories=SEVERITIES),
+        'LAT': 34.05 + rng.normal(0, 0.05, n),
+        'LON': -118.25 + rng.normal(0, 0.05, n),
+    })
+    df['hour'] = df['datetime_occ'].dt.hour
+    df['month'] = df['datetime_occ'].dt.month
+    return df
+
+@pytest.fixture
+def incidents():
+    return make_incidents()
@@ -0,0 +1,17 @@
+import numpy as np
+
+from app.services.analysis import _gi_p_values, detect_density_hotspots, KDE_SIGNIFICANCE_ALPHA
+
+def test_gi_p_values_are_one_sided():
+    p = _gi_p_values(np.array([0.0, 1.6449, 1.96, -1.96]))
+    np.testing.assert_allclose(p, [0.5, 0.05, 0.025, 0.975], atol=1e-4)
+
+def test_density_hotspots_find_planted_cluster(incidents):
+    df = incidents.copy()
+    rng = np.random.default_rng(3)
+    df.loc[:299, 'LAT'] = 34.10 + rng.normal(0, 0.0005, 300)
+    df.loc[:299, 'LON'] = -118.30 + rng.normal(0, 0.0005, 300)
+    result = detect_density_hotspots(df, top_n=3, significance=True)
+    top = result["peaks"][0]
+    assert abs(top["lat"] - 34.10) < 0.002 and abs(top["lng"] + 118.30) < 0.002
+    assert all(peak["p_value"] < KDE_SIGNIFICANCE_ALPHA for peak in result["peaks"])
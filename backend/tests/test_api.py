@@ -0,0 +1,82 @@
+import pytest
+
+main = pytest.importorskip("app.main", reason="the API module needs the full backend requirements")
+
+from fastapi.testclient import TestClient
+
+from app.services import storage
+from app.services.cache import ResultCache
+from app.services.encoding import COLUMNS_MEDIA_TYPE, decode_codes
+from app.services.registry import DatasetRegistry
+from app.services.tiles import HEATMAP_MAX_CELLS
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, incidents):
+    monkeypatch.setattr(storage, 'SNAPSHOT_DIR', str(tmp_path))
+    registry = DatasetRegistry()
+    results = ResultCache()
+    registry.subscribe(lambda event, dataset_id, df, delta: results.invalidate(dataset_id))
+    monkeypatch.setattr(main, 'datasets', registry)
+    monkeypatch.setattr(main, 'result_cache', results)
+    registry.register(incidents, "c" * 64, filename="incidents.csv")
+    return TestClient(main.app)
+
+def test_hotspot_columns_cover_every_incident(client, incidents):
+    data = client.post("/api/hotspots", json={"n_clusters": 5}).json()
+    hotspots = data["hotspots"]
+    assert 0 < len(hotspots) <= HEATMAP_MAX_CELLS
+    # Aggregated cells of every row, not the first rows of the file
+    assert sum(h["count"] for h in hotspots) == len(incidents)
+    assert {h["severity"] for h in hotspots} <= {'High', 'Low', 'Medium'}
+
+    newton = client.post("/api/hotspots", json={"areas": ["Newton"], "n_clusters": 5}).json()["hotspots"]
+    assert sum(h["count"] for h in newton) == int((incidents['AREA NAME'] == 'Newton').sum())
+
+def test_points_match_hotspot_columns(client, incidents):
+    points = client.post("/api/points", json={"zoom": main.HOTSPOT_3D_ZOOM}).json()
+    assert points["total"] == len(incidents)
+    assert sum(p["count"] for p in points["points"]) == len(incidents)
+
+def test_heatmap_cells_replace_the_point_dump(client, incidents):
+    assert "heat_data" not in client.post("/api/hotspots", json={"n_clusters": 5}).json()
+    heatmap = client.post("/api/heatmap", json={"zoom": 12}).json()
+    assert heatmap["total"] == len(incidents)
+    assert sum(count for _, _, count in heatmap["points"]) == len(incidents)
+    assert heatmap["max"] == max(count for _, _, count in heatmap["points"])
+
+    inside = client.post("/api/heatmap", json={"zoom": 12, "bbox": [34.0, -118.3, 34.1, -118.2]}).json()
+    assert 0 < sum(count for _, _, count in inside["points"]) < len(incidents)
+
+@pytest.mark.parametrize("endpoint", ["/api/heatmap", "/api/points"])
+@pytest.mark.parametrize("bbox", [[34.0, -118.3], [34.1, -118.3, 34.0, -118.2], [34.0, -118.2, 34.1, -118.3], [-95, -118.3, 34.1, -118.2]])
+def test_malformed_bbox_is_rejected(client, endpoint, bbox):
+    response = client.post(endpoint, json={"zoom": 12, "bbox": bbox})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("days", [0, -5, main.SPATIAL_MAX_DAYS + 1])
+def test_spatial_query_rejects_bad_days(client, days):
+    response = client.post("/api/spatial/query", json={"points": [[34.05, -118.25]], "days": days})
+    assert response.status_code == 422
+
+def test_spatial_query_days_window(client, incidents):
+    point = {"points": [[34.05, -118.25]], "radius_m": 5000}
+    everything = client.post("/api/spatial/query", json=point).json()["results"][0]["count"]
+    recent = client.post("/api/spatial/query", json={**point, "days": 30}).json()["results"][0]["count"]
+    assert 0 < recent < everything
+
+def test_spatial_query_binary_records(client):
+    from test_encoding import decode_columns
+    query = {"points": [[34.05, -118.25], [34.06, -118.26]], "radius_m": 3000, "limit": 5,
+             "bbox": [34.0, -118.3, 34.1, -118.2]}
+    expected = client.post("/api/spatial/query", json=query).json()
+    response = client.post("/api/spatial/query", json=query, headers={"Accept": COLUMNS_MEDIA_TYPE})
+    assert response.headers["content-type"].startswith(COLUMNS_MEDIA_TYPE)
+    columns, meta = decode_columns(response.content)
+
+    assert columns["results.count"].tolist() == [r["count"] for r in expected["results"]]
+    incidents = [i for r in expected["results"] for i in r["incidents"]]
+    assert columns["incidents.DR_NO"].tolist() == [i["DR_NO"] for i in incidents]
+    assert columns["incidents.query"].tolist() == [q for q, r in enumerate(expected["results"]) for _ in r["incidents"]]
+    assert decode_codes(columns["incidents.Severity"], meta["labels"]["Severity"]) == [i["Severity"] for i in incidents]
+    assert meta["bbox"]["count"] == expected["bbox"]["count"]
+    assert columns["bbox.incidents.DR_NO"].tolist() == [i["DR_NO"] for i in expected["bbox"]["incidents"]]
@@ -0,0 +1,88 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services import cache
+from app.services.cache import ResultCache, estimate_size, filters_hash
+
+def test_filters_hash_ignores_order_and_duplicates():
+    a = SimpleNamespace(areas=['Newton', 'Central'], crimes=None, severities=['High'])
+    b = SimpleNamespace(areas=['Central', 'Newton', 'Central'], crimes=[], severities=['High'])
+    assert filters_hash(a) == filters_hash(b)
+
+def test_estimate_size_counts_buffers():
+    assert estimate_size(np.zeros(1000)) >= 8000
+    assert estimate_size({"values": np.zeros(1000)}) >= 8000
+    assert estimate_size(SimpleNamespace(keys=np.zeros(1000, dtype=np.int64))) >= 8000
+
+def test_evicts_least_recently_used_entry():
+    results = ResultCache(max_entries=2)
+    results.get_or_compute('a', lambda: 1)
+    results.get_or_compute('b', lambda: 2)
+    results.get_or_compute('a', lambda: 0)
+    results.get_or_compute('c', lambda: 3)
+    assert results.get_or_compute('a', lambda: -1) == 1
+    assert results.get_or_compute('b', lambda: -2) == -2
+    assert results.stats()["entries"] == 2
+
+def test_evicts_by_byte_budget():
+    results = ResultCache(max_entries=100, max_mb=0.05)
+    for key in range(5):
+        results.get_or_compute(("d1", key), lambda: np.zeros(2000))
+    assert results.bytes <= results.max_bytes
+    assert results.stats()["entries"] == 3
+    # A result larger than the whole budget is returned but not kept
+    big = results.get_or_compute(("d1", "big"), lambda: np.zeros(100_000))
+    assert len(big) == 100_000
+    assert ("d1", "big") not in results._entries
+    assert results.bytes == sum(entry[3] for entry in results._entries.values())
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    results = ResultCache(ttl_seconds=10)
+    assert results.get_or_compute('a', lambda: 1) == 1
+    now[0] += 5
+    assert results.get_or_compute('a', lambda: 2) == 1
+    now[0] += 10
+    assert results.get_or_compute('a', lambda: 3) == 3
+    assert results.stats()["hits"] == 1 and results.stats()["misses"] == 2
+
+def test_invalidate_one_dataset():
+    results = ResultCache()
+    results.get_or_compute(('d1', 1, 'x'), lambda: np.zeros(10))
+    results.get_or_compute(('d2', 1, 'x'), lambda: np.zeros(10))
+    results.invalidate('d1')
+    assert list(results._entries) == [('d2', 1, 'x')]
+    assert results.bytes == results._entries[('d2', 1, 'x')][3]
+
+def test_concurrent_misses_compute_once():
+    results = ResultCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    owner = threading.Thread(target=results.get_or_compute, args=('k', compute))
+    owner.start()
+    started.wait(5)
+    waiter_result = []
+    waiter = threading.Thread(target=lambda: waiter_result.append(results.get_or_compute('k', compute)))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert waiter_result == [42]
+    assert len(calls) == 1
+
+def test_failed_compute_is_not_cached():
+    results = ResultCache()
+    with pytest.raises(RuntimeError):
+        results.get_or_compute('k', lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert results.get_or_compute('k', lambda: 7) == 7
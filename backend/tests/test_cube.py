@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.cube import CrimeCube, _layout, _FIELDS, _KEY_BITS
+
+def filters(areas=None, crimes=None, severities=None):
+    return SimpleNamespace(areas=areas, crimes=crimes, severities=severities)
+
+def expected_monthly(df):
+    counts = df.set_index('datetime_occ').resample('ME').size()
+    return counts.loc[counts.index.min():counts.index.max()]
+
+def test_pack_unpack_round_trip(incidents):
+    cube = CrimeCube(incidents)
+    fields = {
+        'areas': np.array([0, 1, 4]),
+        'crimes': np.array([5, 0, 3]),
+        'severities': np.array([3, 2, 0]),
+        'bucket': np.array([0, 7, 13]),
+        'hour': np.array([0, 12, 23]),
+    }
+    keys = cube._pack(fields)
+    for field in _FIELDS:
+        expected = fields[field] + (cube.first_bucket if field == 'bucket' else 0)
+        np.testing.assert_array_equal(cube._unpack(keys, field), expected)
+
+def test_layout_rejects_keys_over_63_bits():
+    widths = {field: 13 for field in _FIELDS}
+    assert sum(widths.values()) > _KEY_BITS
+    with pytest.raises(ValueError):
+        _layout(widths)
+
+def test_cell_keys_reject_values_outside_layout(incidents):
+    cube = CrimeCube(incidents)
+    late = incidents.copy()
+    late['datetime_occ'] = late['datetime_occ'] + pd.DateOffset(years=40)
+    with pytest.raises(ValueError):
+        cube._cell_keys(late)
+
+def test_monthly_counts_match_pandas(incidents):
+    cube = CrimeCube(incidents)
+    result = cube.monthly_counts(filters())
+    expected = expected_monthly(incidents)
+    np.testing.assert_array_equal(result['y'].to_numpy(), expected.to_numpy())
+    assert list(result['ds']) == list(expected.index)
+
+    subset = incidents[incidents['AREA NAME'].isin(['Newton']) & incidents['Severity'].isin(['High'])]
+    result = cube.monthly_counts(filters(areas=['Newton'], severities=['High']))
+    np.testing.assert_array_equal(result['y'].to_numpy(), expected_monthly(subset).to_numpy())
+
+def test_severity_breakdown_matches_pandas(incidents):
+    cube = CrimeCube(incidents)
+    severity_counts, severity_by_area = cube.severity_breakdown(filters(crimes=['THEFT', 'ROBBERY']))
+    subset = incidents[incidents['Crm Cd Desc'].isin(['THEFT', 'ROBBERY'])]
+    expected = subset['Severity'].value_counts()
+    assert severity_counts.to_dict() == expected[expected > 0].to_dict()
+    crosstab = pd.crosstab(subset['AREA NAME'], subset['Severity'])
+    np.testing.assert_array_equal(severity_by_area.to_numpy(), crosstab[severity_by_area.columns].to_numpy())
+
+def test_extended_matches_full_build(incidents):
+    base = incidents.iloc[:1500]
+    cube = CrimeCube(base).extended(incidents, 1500)
+    full = CrimeCube(incidents)
+    np.testing.assert_array_equal(cube.keys, full.keys)
+    np.testing.assert_array_equal(cube.counts, full.counts)
+
+def test_extended_rebuilds_when_months_outgrow_layout(incidents):
+    cube = CrimeCube(incidents)
+    late = incidents.iloc[:10].copy()
+    late['datetime_occ'] = late['datetime_occ'] + pd.DateOffset(years=20)
+    combined = pd.concat([incidents, late], ignore_index=True)
+    extended = cube.extended(combined, len(incidents))
+    assert extended.bits['bucket'] > cube.bits['bucket']
+    assert extended.monthly_counts(filters())['y'].sum() == len(combined)
@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from app.services import data_processing
+from app.services.data_processing import (
+    COMPACT_DTYPES, _categorical_columns, classify_severity, compact_dataframe, load_and_preprocess_data_chunked,
+)
+
+def test_categorical_columns_skip_free_text():
+    n = 1000
+    df = pd.DataFrame({
+        'AREA NAME': ['Central'] * n,
+        'Premis Desc': np.where(np.arange(n) % 2, 'STREET', 'PARKING LOT'),
+        'LOCATION': [f"{i} MAIN ST" for i in range(n)],
+        'LAT': np.zeros(n),
+    })
+    assert _categorical_columns(df) == ['AREA NAME', 'Premis Desc']
+
+def test_chunked_loader_keeps_only_compact_columns(monkeypatch):
+    n = 500
+    rng = np.random.default_rng(0)
+    raw = pd.DataFrame({
+        'DR_NO': np.arange(n),
+        'Date Rptd': '01/02/2023 12:00:00 AM',
+        'DATE OCC': rng.choice(['01/01/2023 12:00:00 AM', '02/15/2023 12:00:00 AM'], n),
+        'TIME OCC': rng.integers(0, 2400, n) // 100 * 100,
+        'AREA NAME': rng.choice(['Central', 'Newton'], n),
+        'Crm Cd Desc': rng.choice(['ROBBERY', 'THEFT OF IDENTITY'], n),
+        'LOCATION': [f"{i} MAIN ST" for i in range(n)],
+        'Cross Street': [f"{i}TH AV" for i in range(n)],
+        'LAT': 34.05 + rng.normal(0, 0.01, n),
+        'LON': -118.25 + rng.normal(0, 0.01, n),
+    })
+    # Every preprocessed chunk is already trimmed: raw text never reaches the accumulated chunks
+    seen = []
+    trim = data_processing._trim_frame
+    monkeypatch.setattr(data_processing, '_trim_frame', lambda df: seen.append(trim(df)) or seen[-1])
+
+    df = load_and_preprocess_data_chunked(io.BytesIO(raw.to_csv(index=False).encode('utf-8')), chunksize=100)
+    assert len(seen) == 5
+    assert all(set(chunk.columns) <= set(COMPACT_DTYPES) for chunk in seen)
+    assert len(df) == n
+    assert set(df.columns) <= set(COMPACT_DTYPES)
+    assert not {'LOCATION', 'Cross Street', 'DATE OCC', 'Date Rptd'} & set(df.columns)
+    assert isinstance(df['AREA NAME'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['Crm Cd Desc'].dtype, pd.CategoricalDtype)
+
+    compact, memory = compact_dataframe(classify_severity(df))
+    assert set(compact.columns) == set(df.columns) | {'Severity'}
+    assert memory["before_mb"] == df.attrs['raw_memory_mb']
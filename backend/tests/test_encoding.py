@@ -0,0 +1,67 @@
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.encoding import (
+    ARROW_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, UNKNOWN_CODE, negotiate, category_codes, decode_codes, columns_response,
+)
+
+def decode_columns(body):
+    """Reads the typed-array format back: u32 header length, JSON header, aligned column buffers."""
+    (header_len,) = struct.unpack('<I', body[:4])
+    header = json.loads(body[4:4 + header_len])
+    data = body[4 + header_len:]
+    columns = {}
+    for column in header["columns"]:
+        dtype = np.dtype(column["dtype"]).newbyteorder('<')
+        columns[column["name"]] = np.frombuffer(data, dtype=dtype, count=column["length"], offset=column["offset"])
+    return columns, header["meta"]
+
+def sample_columns():
+    return {
+        "lat": np.array([34.05, 34.06, 34.07]),
+        "lon": np.array([-118.25, -118.24, -118.23], dtype=np.float32),
+        "severity": np.array([0, 2, UNKNOWN_CODE], dtype=np.uint8),
+        "count": np.array([5, 1], dtype=np.int64),
+    }
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate("application/json") is None
+    assert negotiate(f"application/json;q=0.9, {COLUMNS_MEDIA_TYPE}") == COLUMNS_MEDIA_TYPE
+    assert negotiate(ARROW_MEDIA_TYPE.upper() + "; q=1") == ARROW_MEDIA_TYPE
+
+def test_typed_arrays_round_trip():
+    columns = sample_columns()
+    response = columns_response(columns, COLUMNS_MEDIA_TYPE, meta={"severity_labels": ["High", "Low", "Medium"]})
+    decoded, meta = decode_columns(response.body)
+    assert meta == {"severity_labels": ["High", "Low", "Medium"]}
+    for name, values in columns.items():
+        assert decoded[name].dtype == values.dtype
+        np.testing.assert_array_equal(decoded[name], values)
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    columns = sample_columns()
+    response = columns_response(columns, ARROW_MEDIA_TYPE, meta={"zoom": 12})
+    table = pa.ipc.open_stream(response.body).read_all()
+    assert json.loads(table.schema.metadata[b"meta"]) == {"zoom": 12}
+    for name, values in columns.items():
+        np.testing.assert_array_equal(np.asarray(table.column(name)[0].as_py()), values)
+
+def test_category_codes_mark_missing_values():
+    series = pd.Series(pd.Categorical(["High", None, "Low", "High"], categories=["High", "Low"]))
+    codes = category_codes(series)
+    assert codes.dtype == np.uint8
+    np.testing.assert_array_equal(codes, [0, UNKNOWN_CODE, 1, 0])
+    assert decode_codes(codes, ["High", "Low"]) == ["High", None, "Low", "High"]
+
+def test_category_codes_widen_for_many_categories():
+    labels = [f"CRIME {i}" for i in range(300)]
+    series = pd.Series(pd.Categorical(["CRIME 299", None, "CRIME 0"], categories=labels))
+    codes = category_codes(series)
+    assert codes.dtype == np.uint16
+    assert decode_codes(codes, labels) == ["CRIME 299", None, "CRIME 0"]
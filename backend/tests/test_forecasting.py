@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import forecasting
+from app.services.forecasting import ForecastCache, fit_fast, forecast_series, forecast_batch, monthly_series, series_hash
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ForecastCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr(forecasting, 'forecast_cache', cache)
+    return cache
+
+def seasonal_series(months=48):
+    ds = pd.date_range('2020-01-31', periods=months, freq='ME')
+    t = np.arange(months)
+    return pd.DataFrame({'ds': ds, 'y': 100 + 2 * t + 20 * np.sin(2 * np.pi * t / 12)})
+
+def test_monthly_series_counts_each_month(incidents):
+    series = monthly_series(incidents)
+    assert series['y'].sum() == len(incidents)
+    assert (series['ds'].dt.is_month_end).all()
+
+def test_fit_fast_follows_trend_and_season():
+    series = seasonal_series()
+    forecast = fit_fast(series, 12)
+    assert len(forecast) == len(series) + 12
+    future = forecast.iloc[-12:]
+    expected = seasonal_series(60)['y'].iloc[-12:].to_numpy()
+    np.testing.assert_allclose(future['yhat'].to_numpy(), expected, rtol=0.1)
+    assert (future['yhat_lower'] <= future['yhat']).all() and (future['yhat'] <= future['yhat_upper']).all()
+    # Intervals widen with the horizon
+    width = (future['yhat_upper'] - future['yhat_lower']).to_numpy()
+    assert width[-1] >= width[0]
+
+def test_forecast_series_is_fitted_once(cache, monkeypatch):
+    calls = []
+    def counting_fit(series, periods):
+        calls.append(periods)
+        return fit_fast(series, periods)
+    monkeypatch.setitem(forecasting.FORECASTERS, 'fast', counting_fit)
+    series = seasonal_series()
+    first = forecast_series(series, 6, method='fast')
+    assert forecast_series(series, 6, method='fast') == first
+    assert calls == [6]
+    # A fresh process reads the fit back from disk
+    monkeypatch.setattr(forecasting, 'forecast_cache', ForecastCache(cache_dir=cache.cache_dir))
+    assert forecast_series(series, 6, method='fast') == first
+    assert calls == [6]
+
+def test_series_hash_depends_on_inputs():
+    series = seasonal_series()
+    changed = series.assign(y=series['y'] + 1)
+    assert series_hash(series, 12, 'fast') != series_hash(changed, 12, 'fast')
+    assert series_hash(series, 12, 'fast') != series_hash(series, 6, 'fast')
+    assert series_hash(series, 12, 'fast') != series_hash(series, 12, 'prophet')
+
+def test_forecast_rejects_unknown_method_and_short_series(cache):
+    with pytest.raises(ValueError):
+        forecast_series(seasonal_series(), 12, method='arima')
+    assert forecast_series(seasonal_series(2), 12, method='fast') is None
+
+def test_forecast_batch_fast(cache):
+    groups = [('long', seasonal_series()), ('short', seasonal_series(2))]
+    results = {label: (records, error) for label, _, records, error in forecast_batch(groups, 3, method='fast')}
+    assert results['short'] == (None, None)
+    records, error = results['long']
+    assert error is None and len(records) == 48 + 3
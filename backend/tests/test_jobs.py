@@ -0,0 +1,71 @@
+import time
+
+from app.services.jobs import JobManager, TERMINAL_STATES
+
+# Job functions run in spawned worker processes, so they live at module level
+
+def add(a, b):
+    return a + b
+
+def report_then_return(progress=None):
+    progress(0.5, "halfway")
+    return "finished"
+
+def fail():
+    raise RuntimeError("boom")
+
+def sleep_forever():
+    time.sleep(60)
+
+def wait_until(manager, job, predicate, timeout=30):
+    revision, state = 0, job.snapshot()
+    deadline = time.time() + timeout
+    while not predicate(state) and time.time() < deadline:
+        revision, state = manager.wait(job, revision, timeout=1)
+    return state
+
+def finished(state):
+    return state["status"] in TERMINAL_STATES
+
+def test_job_result_and_on_done():
+    manager = JobManager(workers=1)
+    job, deduplicated = manager.submit("sum", "sum-1-2", add, args=(1, 2), on_done=lambda result: {"value": result})
+    assert not deduplicated
+    state = wait_until(manager, job, finished)
+    assert state["status"] == "done"
+    assert state["result"] == {"value": 3}
+
+def test_progress_is_reported():
+    manager = JobManager(workers=1)
+    job, _ = manager.submit("progress", "progress", report_then_return, reports_progress=True)
+    seen = []
+    wait_until(manager, job, lambda state: seen.append(state["message"]) or finished(state))
+    assert "halfway" in seen
+    assert job.status == "done" and job.result == "finished"
+
+def test_same_key_is_deduplicated():
+    manager = JobManager(workers=1)
+    first, _ = manager.submit("sum", "same", add, args=(1, 1))
+    second, deduplicated = manager.submit("sum", "same", add, args=(1, 1))
+    assert deduplicated and second is first
+    wait_until(manager, first, finished)
+
+def test_failed_job_reports_error_and_can_be_resubmitted():
+    manager = JobManager(workers=1)
+    job, _ = manager.submit("fail", "fail", fail)
+    state = wait_until(manager, job, finished)
+    assert state["status"] == "failed"
+    assert "RuntimeError: boom" in state["error"]
+    retry, deduplicated = manager.submit("fail", "fail", fail)
+    assert not deduplicated and retry is not job
+    wait_until(manager, retry, finished)
+
+def test_cancel_running_and_queued_jobs():
+    manager = JobManager(workers=1)
+    running, _ = manager.submit("sleep", "sleep-1", sleep_forever)
+    queued, _ = manager.submit("sleep", "sleep-2", sleep_forever)
+    wait_until(manager, running, lambda state: state["status"] == "running")
+    manager.cancel(queued.id)
+    assert queued.status == "cancelled"
+    manager.cancel(running.id)
+    assert wait_until(manager, running, finished)["status"] == "cancelled"
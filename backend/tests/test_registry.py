@@ -0,0 +1,123 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from app.services import storage
+from app.services import registry as registry_module
+from app.services.cube import CrimeCube
+from app.services.data_processing import append_frames
+from app.services.registry import DatasetRegistry, dataset_id_for
+
+KEY = "a" * 64
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'SNAPSHOT_DIR', str(tmp_path))
+    return tmp_path
+
+def parquet_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.parquet'))
+
+def test_append_frames_keeps_base_codes(incidents):
+    base = incidents.iloc[:10]
+    delta = incidents.iloc[10:12].copy()
+    delta['AREA NAME'] = delta['AREA NAME'].astype(str)
+    delta.loc[delta.index[0], 'AREA NAME'] = 'Harbor'
+    combined = append_frames(base, delta)
+    categories = combined['AREA NAME'].cat.categories
+    assert list(categories[:len(base['AREA NAME'].cat.categories)]) == list(base['AREA NAME'].cat.categories)
+    assert combined['AREA NAME'].iloc[10] == 'Harbor'
+    assert len(combined) == 12
+
+def test_append_deduplicates_and_bumps_version(snapshot_dir, incidents):
+    registry = DatasetRegistry()
+    dataset_id = registry.register(incidents.iloc[:1500], KEY)
+    cube = registry.get_dataset(dataset_id).derived('crime_cube', CrimeCube)
+
+    # 100 rows already present, 500 new
+    result = registry.append(dataset_id, incidents.iloc[1400:2000], "delta-1")
+    assert result["appended"] == 500 and result["duplicates"] == 100
+    assert result["rows"] == 2000 and result["version"] == 2
+
+    dataset = registry.get_dataset(dataset_id)
+    assert dataset.version == 2 and len(dataset.df) == 2000
+    # Derived structures are extended, not rebuilt from scratch
+    extended = dataset.derived('crime_cube', CrimeCube)
+    assert extended is not cube and extended.counts.sum() == 2000
+
+    again = registry.append(dataset_id, incidents.iloc[1900:2000], "delta-2")
+    assert again["appended"] == 0 and again["version"] == 2
+
+def test_append_writes_only_the_delta(snapshot_dir, incidents):
+    registry = DatasetRegistry()
+    dataset_id = registry.register(incidents.iloc[:1500], KEY)
+    registry.append(dataset_id, incidents.iloc[1500:1700], "delta-1")
+    registry.append(dataset_id, incidents.iloc[1700:2000], "delta-2")
+
+    meta = registry.meta(dataset_id)
+    assert meta["key"] == KEY and len(meta["parts"]) == 2
+    assert len(parquet_files(snapshot_dir)) == 3
+    assert [len(storage.load_snapshot(key)) for key in meta["parts"]] == [200, 300]
+
+    # A restarted server joins the base snapshot and its parts back into the same frame
+    reloaded = DatasetRegistry().get(dataset_id)
+    pd.testing.assert_frame_equal(reloaded, registry.get(dataset_id))
+
+def test_merge_parts_rewrites_one_snapshot(snapshot_dir, incidents):
+    registry = DatasetRegistry()
+    dataset_id = registry.register(incidents.iloc[:1500], KEY)
+    registry.append(dataset_id, incidents.iloc[1500:1700], "delta-1")
+    registry.append(dataset_id, incidents.iloc[1700:2000], "delta-2")
+    expected = registry.get(dataset_id)
+
+    assert registry.merge_parts(dataset_id)
+    meta = registry.meta(dataset_id)
+    assert meta["parts"] == [] and meta["key"] != KEY
+    assert parquet_files(snapshot_dir) == [f"{meta['key']}.parquet"]
+    pd.testing.assert_frame_equal(DatasetRegistry().get(dataset_id), expected)
+    assert not registry.merge_parts(dataset_id)
+
+def test_append_requires_key_column(snapshot_dir, incidents):
+    registry = DatasetRegistry()
+    dataset_id = registry.register(incidents.iloc[:1500], KEY)
+    with pytest.raises(ValueError):
+        registry.append(dataset_id, incidents.iloc[1500:].drop(columns=['DR_NO']), "delta-1")
+    result = registry.append(dataset_id, incidents.iloc[1400:1600].drop(columns=['DR_NO']), "delta-1", key_column=None)
+    assert result["appended"] == 200 and result["duplicates"] == 0
+
+def test_reupload_returns_appended_dataset(snapshot_dir, incidents):
+    registry = DatasetRegistry()
+    dataset_id = registry.register(incidents.iloc[:1500], KEY)
+    registry.append(dataset_id, incidents.iloc[1500:], "delta-1")
+    # The upload's id names the dataset as it is now, not the file's own rows
+    found_id, df = registry.lookup(KEY)
+    assert found_id == dataset_id == dataset_id_for(KEY)
+    assert len(df) == len(incidents)
+    assert registry.meta(dataset_id)["appends"] == 1
+
+def test_register_writes_snapshot_outside_the_lock(snapshot_dir, incidents, monkeypatch):
+    registry = DatasetRegistry()
+    other = registry.register(incidents.iloc[:100], "b" * 64)
+
+    writing, release = threading.Event(), threading.Event()
+    save = registry_module.save_snapshot
+    def slow_save(df, key):
+        writing.set()
+        release.wait(5)
+        return save(df, key)
+    monkeypatch.setattr(registry_module, 'save_snapshot', slow_save)
+
+    worker = threading.Thread(target=registry.register, args=(incidents, KEY))
+    worker.start()
+    assert writing.wait(5)
+    # Readers of other datasets are not blocked by the snapshot write
+    reader = threading.Thread(target=registry.get_dataset, args=(other,))
+    reader.start()
+    reader.join(2)
+    alive = reader.is_alive()
+    release.set()
+    worker.join(5)
+    assert not alive
+    assert registry.meta(dataset_id_for(KEY))["rows"] == len(incidents)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services import analysis
+from app.services.analysis import fit_risk_model, risk_feature_matrix, _stratified_indices
+from app.services.risk_models import ModelRegistry
+
+from conftest import make_incidents
+
+@pytest.mark.parametrize("severities", [['High', 'Low'], ['High', 'Low', 'Medium']])
+def test_standard_fit_sets_num_class(severities):
+    df = make_incidents(n=600)
+    df = df[df['Severity'].isin(severities)].copy()
+    df['Severity'] = df['Severity'].cat.remove_unused_categories()
+    model = fit_risk_model(df, mode="standard")
+    assert model is not None
+    assert list(model.severity_classes) == severities
+    assert 0.0 <= model.result["accuracy"] <= 1.0
+    proba = model.predict_proba(model.features([12], [6], [34.05], [-118.25], ['Newton']))
+    assert proba.shape == (1, len(severities))
+    np.testing.assert_allclose(proba.sum(axis=1), 1.0, rtol=1e-5)
+
+def test_standard_fit_needs_two_classes():
+    df = make_incidents(n=600)
+    df = df[df['Severity'] == 'High']
+    assert fit_risk_model(df, mode="standard") is None
+
+def test_scalable_fit_reports_untouched_test_accuracy(monkeypatch):
+    df = make_incidents(n=3000)
+    monkeypatch.setattr(analysis, 'RISK_SAMPLE_START', 500)
+    scored = []
+    accuracy = analysis._accuracy
+    monkeypatch.setattr(analysis, '_accuracy', lambda booster, X, y: scored.append(len(X)) or accuracy(booster, X, y))
+
+    model = fit_risk_model(df, mode="scalable", sample=True)
+    result = model.result
+    X, y, _, _ = risk_feature_matrix(df)
+    test, train = _stratified_indices(y, 0.3, np.random.default_rng(42))
+    # Sample sizes are chosen on the validation slice; the test split is scored once, for the reported accuracy
+    assert len(result["sampling"]) >= 2
+    val_rows = len(_stratified_indices(y[train], 0.1, np.random.default_rng(0))[0])
+    assert scored == [val_rows] * len(result["sampling"]) + [len(test)]
+    assert result["accuracy"] == accuracy(model.booster, X[test], y[test])
+    assert "validation_accuracy" in result
+
+@pytest.mark.parametrize("model_id", ["../etc", "abc", "0123456789ab-v1-0123456789abcdef/..", "", None])
+def test_registry_rejects_invalid_ids(tmp_path, model_id):
+    registry = ModelRegistry(model_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        registry.get(model_id)
+
+def test_registry_accepts_its_own_ids(tmp_path):
+    registry = ModelRegistry(model_dir=str(tmp_path))
+    assert registry.get("0123456789ab-v3-0123456789abcdef") is None
+    assert registry.get("0123456789ab-v3-0123456789abcdef-01234567") is None
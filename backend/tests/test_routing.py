@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+ox = pytest.importorskip("osmnx")
+nx = pytest.importorskip("networkx")
+
+from app.services import routing
+from app.services.routing import GraphStore
+
+def make_graph(lat, lon):
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    G.add_node(1, y=lat - 0.02, x=lon - 0.02)
+    G.add_node(2, y=lat + 0.02, x=lon + 0.02)
+    G.add_edge(1, 2, length=5600.0)
+    G.add_edge(2, 1, length=5600.0)
+    return G
+
+def test_seeded_graphs_are_read_outside_the_store_lock(tmp_path, monkeypatch):
+    ox.save_graphml(make_graph(34.05, -118.25), str(tmp_path / "la.graphml"))
+    reading, release = threading.Event(), threading.Event()
+    load_graphml = ox.load_graphml
+
+    def slow_load(path):
+        reading.set()
+        release.wait(5)
+        return load_graphml(path)
+
+    monkeypatch.setattr(routing.ox, 'load_graphml', slow_load)
+    store = GraphStore(cache_dir=str(tmp_path), offline=True)
+    # Opening the index only lists the seeded files
+    assert store.index == {}
+    assert not reading.is_set()
+
+    found = []
+    worker = threading.Thread(target=lambda: found.append(store.covering([(34.05, -118.25)])))
+    worker.start()
+    assert reading.wait(5)
+    assert store._lock.acquire(timeout=1)
+    store._lock.release()
+    release.set()
+    worker.join(5)
+    assert found == ["la"]
+
+    # A new store finds the indexed graph without reading it again
+    reading.clear()
+    assert GraphStore(cache_dir=str(tmp_path), offline=True).covering([(34.05, -118.25)]) == "la"
+    assert not reading.is_set()
+
+def test_stored_graphs_are_reused(tmp_path):
+    store = GraphStore(cache_dir=str(tmp_path), offline=True)
+    graph_id = store.add(make_graph(34.05, -118.25), 34.05, -118.25, 2000)
+    fresh = GraphStore(cache_dir=str(tmp_path), offline=True)
+    G = fresh.graph_for([(34.05, -118.25), (34.052, -118.248)], (0, 0), 2000)
+    assert G is not None and G.number_of_nodes() == 2
+    assert fresh.covering([(34.2, -118.5)]) is None
+    assert fresh.graph_for([(34.2, -118.5)], (34.2, -118.5), 2000) is None
+    assert graph_id in fresh.index
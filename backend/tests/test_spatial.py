@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from app.services import spatial
+from app.services.spatial import SpatialIndex, SPATIAL_MAX_RADIUS_M
+
+QUERIES = (np.array([34.05, 34.0, 34.1]), np.array([-118.25, -118.3, -118.2]))
+
+def brute_force(index, lat, lon, radius_m):
+    qx, qy = index.project(lat, lon)
+    dist = np.hypot(index.x[None, :] - qx[:, None], index.y[None, :] - qy[:, None])
+    return dist <= radius_m
+
+def test_count_radius_matches_brute_force(incidents):
+    index = SpatialIndex(incidents)
+    expected = brute_force(index, *QUERIES, 1500.0).sum(axis=1)
+    np.testing.assert_array_equal(index.count_radius(*QUERIES, 1500.0), expected)
+
+def test_chunked_candidates_give_same_matches(incidents, monkeypatch):
+    index = SpatialIndex(incidents)
+    positions, queries, _ = index.query_radius(*QUERIES, 1500.0)
+    monkeypatch.setattr(spatial, 'SPATIAL_MAX_CANDIDATES', 10)
+    small_positions, small_queries, _ = index.query_radius(*QUERIES, 1500.0)
+    assert sorted(zip(queries, positions)) == sorted(zip(small_queries, small_positions))
+
+def test_limit_keeps_nearest(incidents, monkeypatch):
+    monkeypatch.setattr(spatial, 'SPATIAL_MAX_CANDIDATES', 10)
+    index = SpatialIndex(incidents)
+    positions, queries, distances = index.query_radius(*QUERIES, 2000.0)
+    _, limited_queries, limited_distances = index.query_radius(*QUERIES, 2000.0, limit=5)
+    for q in range(len(QUERIES[0])):
+        nearest = np.sort(distances[queries == q])[:5]
+        np.testing.assert_allclose(limited_distances[limited_queries == q], nearest)
+
+def test_radius_is_capped(incidents):
+    index = SpatialIndex(incidents)
+    with pytest.raises(ValueError):
+        index.count_radius(*QUERIES, SPATIAL_MAX_RADIUS_M + 1)
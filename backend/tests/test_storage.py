@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import threading
+
+from app.services import data_processing
+from app.services.data_processing import pipeline_fingerprint
+from app.services import storage
+from app.services.storage import hash_upload, read_index, write_index
+
+def test_pipeline_fingerprint_changes_upload_key(tmp_path, monkeypatch):
+    content = b"DATE OCC,TIME OCC\n01/01/2023,1200\n"
+    before = hash_upload(io.BytesIO(content), salt=pipeline_fingerprint())
+    assert before == hash_upload(io.BytesIO(content), salt=pipeline_fingerprint())
+
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps([{"level": "High", "keywords": ["ROBBERY"]}]))
+    monkeypatch.setenv("SEVERITY_RULES_PATH", str(rules))
+    assert hash_upload(io.BytesIO(content), salt=pipeline_fingerprint()) != before
+
+    monkeypatch.delenv("SEVERITY_RULES_PATH")
+    monkeypatch.setattr(data_processing, 'PIPELINE_VERSION', data_processing.PIPELINE_VERSION + 1)
+    assert hash_upload(io.BytesIO(content), salt=pipeline_fingerprint()) != before
+
+def test_concurrent_index_writes_never_interleave(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'SNAPSHOT_DIR', str(tmp_path))
+    errors = []
+
+    def writer(n):
+        try:
+            for _ in range(30):
+                write_index({"default": None, "datasets": {}, "writer": n, "padding": str(n) * 200_000})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert errors == []
+    index = read_index()
+    assert index["padding"] == str(index["writer"]) * 200_000
+    assert os.listdir(tmp_path) == [storage.INDEX_FILE]
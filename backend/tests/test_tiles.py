@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.services.tiles import (
+    HEATMAP_MAX_ZOOM, TILE_BITS, morton_encode, morton_decode, mercator_fraction, fraction_to_latlon, bin_keys,
+)
+
+def test_morton_round_trip():
+    rng = np.random.default_rng(1)
+    x = rng.integers(0, 1 << 20, 1000)
+    y = rng.integers(0, 1 << 20, 1000)
+    dx, dy = morton_decode(morton_encode(x, y))
+    np.testing.assert_array_equal(dx, x)
+    np.testing.assert_array_equal(dy, y)
+
+def test_morton_interleaves_x_in_even_bits():
+    keys = morton_encode(np.array([1, 0, 3]), np.array([0, 1, 3]))
+    np.testing.assert_array_equal(keys, np.array([1, 2, 15], dtype=np.uint64))
+
+def test_mercator_fraction_round_trip():
+    lat = np.array([34.05, -33.87, 0.0, 60.0])
+    lon = np.array([-118.25, 151.21, 0.0, -179.5])
+    x, y = mercator_fraction(lat, lon)
+    assert ((x >= 0) & (x < 1) & (y >= 0) & (y < 1)).all()
+    back_lat, back_lon = fraction_to_latlon(x, y)
+    np.testing.assert_allclose(back_lat, lat, atol=1e-9)
+    np.testing.assert_allclose(back_lon, lon, atol=1e-9)
+
+def test_mercator_fraction_clips_poles():
+    x, y = mercator_fraction(np.array([90.0, -90.0]), np.array([180.0, -180.0]))
+    assert (x < 1).all() and (y < 1).all() and (x >= 0).all() and (y >= 0).all()
+
+def test_bin_keys_fall_in_their_tile():
+    lat, lon = np.array([34.05]), np.array([-118.25])
+    bx, by = morton_decode(bin_keys(lat, lon))
+    x, y = mercator_fraction(lat, lon)
+    scale = 1 << HEATMAP_MAX_ZOOM
+    # The finest cell's parent tile is the z/x/y tile containing the point
+    assert bx[0] >> TILE_BITS == int(x[0] * scale)
+    assert by[0] >> TILE_BITS == int(y[0] * scale)
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import timeseries
+from app.services.timeseries import HourlyCounts, bucket_edges
+
+def filters(areas=None, crimes=None, severities=None):
+    return SimpleNamespace(areas=areas, crimes=crimes, severities=severities)
+
+def resampled(df, rule, start, end):
+    times = df['datetime_occ']
+    times = times[(times >= start) & (times < end)]
+    return pd.Series(1, index=times).resample(rule).sum()
+
+def test_bucket_edges_align_to_calendar():
+    edges = bucket_edges('2023-01-04 05:00', '2023-01-20', 'week')
+    assert pd.Timestamp(edges[0]) == pd.Timestamp('2023-01-02')
+    assert pd.Timestamp(edges[-1]) >= pd.Timestamp('2023-01-20')
+    edges = bucket_edges('2023-01-15', '2023-03-01', 'month')
+    assert [str(pd.Timestamp(e).date()) for e in edges] == ['2023-01-01', '2023-02-01', '2023-03-01']
+    with pytest.raises(ValueError):
+        bucket_edges('2023-01-01', '2023-02-01', 'year')
+
+@pytest.mark.parametrize("resolution, rule", [('hour', 'h'), ('day', 'D'), ('month', 'MS')])
+def test_range_counts_match_resample(incidents, resolution, rule):
+    counts = HourlyCounts(incidents)
+    start, end = pd.Timestamp('2022-02-01'), pd.Timestamp('2022-06-01')
+    result = counts.range_counts(counts.total, start, end, resolution)
+    expected = resampled(incidents, rule, start, end).reindex(result['ds'], fill_value=0)
+    np.testing.assert_array_equal(result['y'].to_numpy(), expected.to_numpy())
+
+def test_whole_span_counts_every_row(incidents):
+    counts = HourlyCounts(incidents)
+    assert counts.range_counts(counts.total, resolution='week')['y'].sum() == len(incidents)
+
+def test_prefix_for_one_column_matches_rows(incidents):
+    counts = HourlyCounts(incidents)
+    assert counts.slices == {}
+    prefix = counts.prefix_for(filters(areas=['Newton', 'Pacific']))
+    rows = incidents['AREA NAME'].isin(['Newton', 'Pacific']).to_numpy()
+    np.testing.assert_array_equal(prefix, counts.prefix_for_rows(rows))
+    assert set(counts.slices) == {'areas'}
+    assert counts.prefix_for(filters(areas=['Newton'], crimes=['THEFT'])) is None
+
+def test_slices_over_cap_fall_back(incidents, monkeypatch):
+    monkeypatch.setattr(timeseries, 'TIMESERIES_MAX_SLICE_MB', 0)
+    counts = HourlyCounts(incidents)
+    assert counts.prefix_for(filters(crimes=['THEFT'])) is None
+
+def test_outlier_dates_do_not_widen_span(incidents, monkeypatch):
+    monkeypatch.setattr(timeseries, 'TIMESERIES_MAX_HOURS', 5 * timeseries.HOURS_PER_YEAR)
+    df = incidents.copy()
+    df.loc[0, 'datetime_occ'] = pd.Timestamp('1900-01-01')
+    df.loc[1, 'datetime_occ'] = pd.Timestamp('2099-01-01')
+    counts = HourlyCounts(df)
+    assert counts.n_hours < 2 * timeseries.HOURS_PER_YEAR
+    assert counts.clipped == 2
+    assert counts.total[-1] == len(df) - 2
+
+def test_extended_matches_full_build(incidents):
+    base = incidents.iloc[:1500]
+    counts = HourlyCounts(base)
+    counts.prefix_for(filters(severities=['High']))
+    extended = counts.extended(incidents, 1500)
+    full = HourlyCounts(incidents)
+    assert extended.start == full.start and extended.n_hours == full.n_hours
+    np.testing.assert_array_equal(extended.total, full.total)
+    np.testing.assert_array_equal(extended.prefix_for(filters(severities=['High'])), full.prefix_for(filters(severities=['High'])))
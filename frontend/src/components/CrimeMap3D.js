@@ -94,8 +94,11 @@ export default function CrimeMap3D({ data }) {
         return [lng, lat];
       },
       
-      getElevationWeight: d => 1,
+      // Each point is an aggregated cell: weight it by its incident count
+      getElevationWeight: d => d.count || 1,
       elevationAggregation: 'SUM',
+      getColorWeight: d => d.count || 1,
+      colorAggregation: 'SUM',
       colorRange: COLOR_RANGE,
     })
   ];
@@ -20,6 +20,16 @@ export const getHotspots = (filters, n_clusters) => {
     return apiClient.post('/hotspots', { ...filters, n_clusters });
 };
 
+// Server-aggregated heatmap cells ({points: [[lat, lon, count]], max}) for a zoom and optional bbox
+export const getHeatmap = (filters, zoom, bbox = null) => {
+    return apiClient.post('/heatmap', { ...filters, zoom, bbox });
+};
+
+// Level-of-detail 3D columns ({lat, lng, count, severity} per cell) for a zoom and optional [south, west, north, east] bbox
+export const getPoints = (filters, zoom, bbox = null) => {
+    return apiClient.post('/points', { ...filters, zoom, bbox });
+};
+
 export const getTimeSeries = (filters) => {
     return apiClient.post('/time-series', filters);
 };
@@ -1,7 +1,7 @@
 // frontend/src/views/tabs/HotspotsTab.js
 
 import React, { useState, useEffect, useMemo } from 'react';
-import { getHotspots } from '../../services/api';
+import { getHotspots, getHeatmap } from '../../services/api';
 import { MapContainer, TileLayer, Marker, Popup, useMap } from 'react-leaflet';
 import L from 'leaflet';
 import 'leaflet.heat';
@@ -24,7 +24,7 @@ function ChangeView({ center, zoom }) {
 }
 
 // Component that correctly applies the heatmap layer
-const HeatmapLayer = ({ heatData }) => {
+const HeatmapLayer = ({ heatData, max }) => {
     // Use the official useMap hook from react-leaflet
     const map = useMap();
 
@@ -33,21 +33,25 @@ const HeatmapLayer = ({ heatData }) => {
             return;
         }
 
-        // Create the heat layer and add it to the map
-        const heatLayer = L.heatLayer(heatData, { radius: 25 }).addTo(map);
+        // Create the heat layer from the aggregated [lat, lon, count] cells and add it to the map
+        const heatLayer = L.heatLayer(heatData, { radius: 25, max: max || 1 }).addTo(map);
 
         // Cleanup function: remove the layer when the component is unmounted or data changes
         return () => {
             map.removeLayer(heatLayer);
         };
-    }, [map, heatData]); // Re-run effect if map instance or heatData changes
+    }, [map, heatData, max]); // Re-run effect if map instance or heatData changes
 
     return null; // This component does not render any visible DOM element
 };
 
 
+// Zoom of the heatmap cells; the server steps down to coarser cells when the data needs too many
+const HEATMAP_ZOOM = 12;
+
 const HotspotsTab = ({ activeFilters }) => {
-    const [hotspotData, setHotspotData] = useState({ centers: [], heat_data: [] });
+    const [hotspotData, setHotspotData] = useState({ centers: [] });
+    const [heatmap, setHeatmap] = useState({ points: [], max: 1 });
     const [numClusters, setNumClusters] = useState(10);
     const [loading, setLoading] = useState(false);
 
@@ -56,8 +60,12 @@ const HotspotsTab = ({ activeFilters }) => {
             if (!activeFilters) return;
             setLoading(true);
             try {
-                const response = await getHotspots(activeFilters, numClusters);
+                const [response, heatResponse] = await Promise.all([
+                    getHotspots(activeFilters, numClusters),
+                    getHeatmap(activeFilters, HEATMAP_ZOOM),
+                ]);
                 setHotspotData(response.data);
+                setHeatmap(heatResponse.data);
             } catch (error) {
                 console.error("Failed to fetch hotspots:", error);
             } finally {
@@ -68,13 +76,16 @@ const HotspotsTab = ({ activeFilters }) => {
     }, [activeFilters, numClusters]);
 
     const mapCenter = useMemo(() => {
-        if (hotspotData.heat_data.length > 0) {
-            const lats = hotspotData.heat_data.map(p => p[0]);
-            const lons = hotspotData.heat_data.map(p => p[1]);
-            return [lats.reduce((a, b) => a + b, 0) / lats.length, lons.reduce((a, b) => a + b, 0) / lons.length];
+        if (heatmap.points.length > 0) {
+            // Count-weighted average of the heatmap cells
+            const total = heatmap.points.reduce(
+                (acc, [lat, lon, count]) => ({ lat: acc.lat + lat * count, lon: acc.lon + lon * count, n: acc.n + count }),
+                { lat: 0, lon: 0, n: 0 }
+            );
+            return [total.lat / total.n, total.lon / total.n];
         }
         return [34.0522, -118.2437]; // Default to LA
-    }, [hotspotData.heat_data]);
+    }, [heatmap.points]);
 
 
     return (
@@ -103,7 +114,7 @@ const HotspotsTab = ({ activeFilters }) => {
                     />
                     
                     {/* This component now correctly gets the map instance and adds the layer */}
-                    <HeatmapLayer heatData={hotspotData.heat_data} />
+                    <HeatmapLayer heatData={heatmap.points} max={heatmap.max} />
 
                     {hotspotData.centers.map((center, idx) => (
                         <Marker key={idx} position={[center[0], center[1]]}>
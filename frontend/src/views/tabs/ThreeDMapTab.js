@@ -1,8 +1,11 @@
 // frontend/src/components/tabs/ThreeDMapTab.js
 import React, { useState, useEffect } from 'react';
-import axios from 'axios';
+import { getPoints } from '../../services/api';
 import CrimeMap3D from '../../components/CrimeMap3D'; // The deck.gl component you created
 
+// Zoom of the level-of-detail cells; the server steps down to coarser cells when the data needs too many
+const POINTS_ZOOM = 12;
+
 const ThreeDMapTab = ({ activeFilters }) => {
     const [mapData, setMapData] = useState([]);
     const [loading, setLoading] = useState(false);
@@ -11,14 +14,9 @@ const ThreeDMapTab = ({ activeFilters }) => {
         const fetchData = async () => {
             setLoading(true);
             try {
-                // Fetch data from your existing backend endpoint
-                // We send activeFilters so the backend sends relevant points
-                const response = await axios.post('http://127.0.0.1:8000/api/hotspots', {
-                    filters: activeFilters
-                });
-                
-                // Ensure response.data.hotspots is an array
-                setMapData(response.data.hotspots || []); 
+                // Server-aggregated cells (count + dominant severity) covering every incident, bounded in size
+                const response = await getPoints(activeFilters, POINTS_ZOOM);
+                setMapData(response.data.points || []);
             } catch (error) {
                 console.error("Error fetching 3D map data:", error);
             } finally {
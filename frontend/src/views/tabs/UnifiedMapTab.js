@@ -35,9 +35,12 @@ const endIcon = createPinIcon('https://raw.githubusercontent.com/pointhi/leaflet
 // ✅ NEW: Violet icon for user reports
 const reportIcon = createPinIcon('https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-2x-violet.png');
 
+// Zoom of the heatmap cells; the server steps down to coarser cells when the data needs too many
+const HEATMAP_ZOOM = 12;
+
 // --- COMPONENTS ---
 
-const HeatmapLayer = ({ points, visible }) => {
+const HeatmapLayer = ({ points, max, visible }) => {
     const map = useMap();
     const heatLayerRef = useRef(null);
 
@@ -48,11 +51,13 @@ const HeatmapLayer = ({ points, visible }) => {
         }
 
         if (visible && points && points.length > 0) {
+            // Points are aggregated cells [lat, lon, count]; scale intensities to the densest cell
             const layer = L.heatLayer(points, { 
                 radius: 25, 
                 blur: 20, 
                 maxZoom: 17, 
-                minOpacity: 0.4 
+                minOpacity: 0.4,
+                max: max || 1
             });
             layer.addTo(map);
             heatLayerRef.current = layer;
@@ -64,7 +69,7 @@ const HeatmapLayer = ({ points, visible }) => {
                 heatLayerRef.current = null;
             }
         };
-    }, [map, points, visible]);
+    }, [map, points, max, visible]);
 
     return null;
 };
@@ -164,6 +169,7 @@ const LocateControl = ({ hotspotCenters, onWarning }) => {
 const UnifiedMapTab = ({ activeFilters }) => {
     // Data State
     const [heatmapPoints, setHeatmapPoints] = useState([]);
+    const [heatmapMax, setHeatmapMax] = useState(1);
     const [hotspotCenters, setHotspotCenters] = useState([]);
     const [amenities, setAmenities] = useState([]);
     const [route, setRoute] = useState(null);
@@ -195,21 +201,27 @@ const UnifiedMapTab = ({ activeFilters }) => {
         const loadData = async () => {
             if (!activeFilters) return;
             try {
-                // Step A: Get Crime Hotspots first
-                const hRes = await axios.post('http://localhost:8000/api/hotspots', { ...activeFilters, n_clusters: 15 });
-                setHeatmapPoints(hRes.data.heat_data);
+                // Step A: Get Crime Hotspots and the server-aggregated heatmap cells
+                const [hRes, mRes] = await Promise.all([
+                    axios.post('http://localhost:8000/api/hotspots', { ...activeFilters, n_clusters: 15 }),
+                    axios.post('http://localhost:8000/api/heatmap', { ...activeFilters, zoom: HEATMAP_ZOOM }),
+                ]);
                 setHotspotCenters(hRes.data.centers);
+                setHeatmapPoints(mRes.data.points);
+                setHeatmapMax(mRes.data.max);
                 
                 // ✅ FIX: Calculate the dynamic center of the data
                 let centerLat = 34.0522;
                 let centerLon = -118.2437;
 
-                if (hRes.data.heat_data && hRes.data.heat_data.length > 0) {
-                    // Simple average of all points to find the "middle" of the city
-                    const points = hRes.data.heat_data;
-                    const total = points.reduce((acc, curr) => ({ lat: acc.lat + curr[0], lon: acc.lon + curr[1] }), { lat: 0, lon: 0 });
-                    centerLat = total.lat / points.length;
-                    centerLon = total.lon / points.length;
+                if (mRes.data.points && mRes.data.points.length > 0) {
+                    // Count-weighted average of the cells to find the "middle" of the city
+                    const total = mRes.data.points.reduce(
+                        (acc, [lat, lon, count]) => ({ lat: acc.lat + lat * count, lon: acc.lon + lon * count, n: acc.n + count }),
+                        { lat: 0, lon: 0, n: 0 }
+                    );
+                    centerLat = total.lat / total.n;
+                    centerLon = total.lon / total.n;
                 }
 
                 console.log(`Searching for amenities at: ${centerLat}, ${centerLon}`);
@@ -399,7 +411,7 @@ const UnifiedMapTab = ({ activeFilters }) => {
                 
                 <LocateControl hotspotCenters={hotspotCenters} onWarning={setProximityAlert} />
 
-                <HeatmapLayer points={heatmapPoints} visible={showHeatmap} />
+                <HeatmapLayer points={heatmapPoints} max={heatmapMax} visible={showHeatmap} />
 
                 {/* Hotspots */}
                 {showHotspots && hotspotCenters.map((c, i) => (